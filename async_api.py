@@ -0,0 +1,464 @@
+"""
+Async read API for deals, search and price history
+
+Runs next to the Flask app as an aiohttp application on an async SQLAlchemy
+engine, so slow queries and thousands of polling clients wait on the event loop
+instead of tying up gunicorn sync workers:
+
+    gunicorn 'async_api:create_async_app()' --worker-class aiohttp.GunicornWebWorker --bind 0.0.0.0:8001
+    python -m async_api --port 8001
+
+Memory stays bounded under load: identical requests share one query and one
+cached response body, database work is capped at the engine's pool size, and
+requests beyond ASYNC_API_MAX_PENDING are turned away with a 503.
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import web
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from sqlalchemy import and_, desc, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import joinedload
+from database import create_async_db_engine, replica_urls
+from models import Deal, Game, GameStore
+from services.catalog_version import get_version_async, make_etag
+from services.deal_events import CHANNEL_PREFIX
+from services.deal_service import changes_since, deal_changes_json, deal_json
+from services.redis_client import get_async_redis
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MAX_LIMIT = 100
+
+# How long a catalogue version read from Redis is reused before checking again
+VERSION_REFRESH_SECONDS = 1
+
+class ResponseCache:
+    """Small LRU of rendered JSON bodies with a TTL and single-flight fills
+    
+    Polling clients mostly ask for the same few URLs, so concurrent misses for a
+    key wait on the first caller's query instead of each running their own.
+    """
+    
+    def __init__(self, ttl=30, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.inflight = {}
+        self.hits = 0
+        self.misses = 0
+    
+    async def get_or_fill(self, key, fill):
+        entry = self.entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        
+        self.misses += 1
+        if key in self.inflight:
+            return await asyncio.shield(self.inflight[key])
+        
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            body = await fill()
+            future.set_result(body)
+        except BaseException as e:
+            # Waiters get the exception, and fail rather than hang if the fill was cancelled;
+            # retrieve it so an unawaited future doesn't warn
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError('Cache fill was cancelled'))
+            future.exception()
+            raise
+        finally:
+            del self.inflight[key]
+        
+        if self.ttl > 0:
+            self.entries[key] = (time.monotonic() + self.ttl, body)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        
+        return body
+
+class DealBroadcaster:
+    """Fans live deal events from one Redis pub/sub subscription out to SSE clients
+    
+    Each process holds a single subscription however many clients are connected.
+    Every client gets a small bounded queue, and a client that falls that far
+    behind is disconnected. It reconnects and catches up from /api/deals/changes.
+    """
+    
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self.subscribers = {}
+        self.task = None
+        self.published = 0
+        self.dropped = 0
+    
+    async def start(self, app=None):
+        self.task = asyncio.create_task(self._listen())
+    
+    async def stop(self, app=None):
+        if self.task:
+            self.task.cancel()
+        for queues in self.subscribers.values():
+            for queue in queues:
+                queue.put_nowait(None)
+    
+    def subscribe(self, region):
+        queue = asyncio.Queue(self.queue_size)
+        self.subscribers.setdefault(region, set()).add(queue)
+        return queue
+    
+    def unsubscribe(self, region, queue):
+        queues = self.subscribers.get(region, set())
+        queues.discard(queue)
+        if not queues:
+            self.subscribers.pop(region, None)
+    
+    def publish(self, region, frame):
+        for queue in list(self.subscribers.get(region, ())):
+            try:
+                queue.put_nowait(frame)
+                self.published += 1
+            except asyncio.QueueFull:
+                # Make room for the end-of-stream marker so the slow client hangs up
+                self.dropped += 1
+                self.unsubscribe(region, queue)
+                queue.get_nowait()
+                queue.put_nowait(None)
+    
+    async def _listen(self):
+        delay = 1
+        while True:
+            pubsub = get_async_redis().pubsub()
+            try:
+                await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                delay = 1
+                async for message in pubsub.listen():
+                    if message['type'] == 'pmessage':
+                        self.publish(message['channel'][len(CHANNEL_PREFIX):], _sse_event(message['data']))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Live deal subscription lost, retrying in {delay}s: {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+            finally:
+                await pubsub.reset()
+
+class AsyncReadAPI:
+    """Read-only JSON endpoints backed by an async engine (replicas when configured)"""
+    
+    def __init__(self, database_url=None, cache_ttl=None, max_pending=None):
+        database_url = database_url or os.getenv('DATABASE_URL', 'sqlite:///gametracker.db')
+        
+        # Everything here is a read, so prefer replicas and leave the primary to writers
+        self.engines = [create_async_db_engine(url, os.environ) for url in (replica_urls(os.environ) or [database_url])]
+        self.sessions = [async_sessionmaker(engine, expire_on_commit=False) for engine in self.engines]
+        
+        pool = self.engines[0].pool
+        max_queries = int(os.getenv('ASYNC_API_MAX_QUERIES', 0)) or (
+            pool.size() + max(getattr(pool, '_max_overflow', 0), 0) if hasattr(pool, 'size') else 10
+        )
+        self.query_slots = asyncio.Semaphore(max_queries * len(self.engines))
+        
+        self.cache = ResponseCache(
+            ttl=cache_ttl if cache_ttl is not None else int(os.getenv('ASYNC_API_CACHE_SECONDS', 30)),
+            max_entries=int(os.getenv('ASYNC_API_CACHE_ENTRIES', 1024))
+        )
+        self.max_pending = max_pending if max_pending is not None else int(os.getenv('ASYNC_API_MAX_PENDING', 2000))
+        self.pending = 0
+        self.stale_while_revalidate = int(os.getenv('HTTP_CACHE_STALE_WHILE_REVALIDATE', 300))
+        self.versions = {}
+        
+        self.broadcaster = DealBroadcaster(queue_size=int(os.getenv('LIVE_CLIENT_QUEUE_SIZE', 100)))
+        self.keepalive_seconds = int(os.getenv('LIVE_KEEPALIVE_SECONDS', 15))
+    
+    async def close(self, app=None):
+        for engine in self.engines:
+            await engine.dispose()
+    
+    async def _query(self, build):
+        """Run build(session) on a replica session, holding one of the limited query slots"""
+        async with self.query_slots:
+            async with random.choice(self.sessions)() as session:
+                return await build(session)
+    
+    async def _catalog_version(self, region):
+        """Catalogue version for a region, re-read from Redis at most once a second"""
+        cached = self.versions.get(region)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        
+        version = await get_version_async(region)
+        if len(self.versions) > 256:
+            self.versions.clear()
+        self.versions[region] = (time.monotonic() + VERSION_REFRESH_SECONDS, version)
+        return version
+    
+    async def _respond(self, request, build, region='US'):
+        """Serve a 304, or a cached or freshly queried JSON body, for this request's URL
+        
+        Bodies are cached per catalogue version, so a price change is visible on
+        the next poll instead of after the cache TTL.
+        """
+        version = await self._catalog_version(region)
+        headers = {'Cache-Control': f"public, max-age={self.cache.ttl}, "
+                                    f"stale-while-revalidate={self.stale_while_revalidate}"}
+        if version is not None:
+            etag = make_etag(version, request.path_qs)
+            headers['ETag'] = f'W/"{etag}"'
+            if etag in _etags(request.headers.get('If-None-Match', '')):
+                return web.Response(status=304, headers=headers)
+        
+        if self.pending >= self.max_pending:
+            return web.json_response({'error': 'Server busy'}, status=503, headers={'Retry-After': '5'})
+        
+        self.pending += 1
+        try:
+            body = await self.cache.get_or_fill(f"{version}:{request.path_qs}", lambda: self._render(build))
+        except Exception as e:
+            logger.error(f"Error serving {request.path}: {str(e)}")
+            return web.json_response({'error': 'Failed to fetch data'}, status=500)
+        finally:
+            self.pending -= 1
+        
+        return web.Response(body=body, content_type='application/json', headers=headers)
+    
+    async def _render(self, build):
+        return json.dumps(await self._query(build)).encode()
+    
+    async def deals(self, request):
+        """Current deals, same shape as the Flask /api/deals"""
+        region = request.query.get('region', 'US')
+        limit = min(_int(request.query.get('limit'), 20), MAX_LIMIT)
+        store_id = request.query.get('store_id')
+        
+        async def build(session):
+            statement = select(GameStore).options(
+                joinedload(GameStore.game),
+                joinedload(GameStore.store)
+            ).filter(
+                GameStore.region == region,
+                GameStore.is_on_sale == True
+            )
+            if store_id:
+                statement = statement.filter(GameStore.store_id == _int(store_id, 0))
+            statement = statement.order_by(desc(GameStore.discount_percentage)).limit(limit)
+            
+            deals = (await session.execute(statement)).scalars().unique().all()
+            return [deal_json(deal) for deal in deals]
+        
+        return await self._respond(request, build, region)
+    
+    async def deal_changes(self, request):
+        """Deals added, changed or ended since a version, same shape as the Flask endpoint"""
+        region = request.query.get('region', 'US')
+        since = _int(request.query.get('since'), None)
+        limit = min(_int(request.query.get('limit'), 500), 1000)
+        
+        async def build(session):
+            version, changes = await session.run_sync(changes_since, since, region, limit)
+            return deal_changes_json(version, changes)
+        
+        return await self._respond(request, build, region)
+    
+    async def search(self, request):
+        """Game search with the same filters as the /search page"""
+        query = request.query.get('q', '')
+        genre = request.query.get('genre', '')
+        min_rating = _int(request.query.get('min_rating'), 0)
+        max_price = _float(request.query.get('max_price'), 999)
+        region = request.query.get('region', 'US')
+        limit = min(_int(request.query.get('limit'), 20), MAX_LIMIT)
+        
+        async def build(session):
+            lowest_price = select(func.min(GameStore.current_price)).where(
+                GameStore.game_id == Game.id,
+                GameStore.region == region,
+                GameStore.is_available == True
+            ).correlate(Game).scalar_subquery()
+            
+            statement = select(Game, lowest_price)
+            if query:
+                statement = statement.filter(Game.title.ilike(f'%{query}%'))
+            if genre:
+                statement = statement.filter(Game.genres.ilike(f'%{genre}%'))
+            if min_rating > 0:
+                statement = statement.filter(Game.metacritic_score >= min_rating)
+            if max_price < 999:
+                statement = statement.filter(Game.game_stores.any(and_(
+                    GameStore.region == region,
+                    GameStore.is_available == True,
+                    GameStore.current_price <= max_price
+                )))
+            statement = statement.order_by(desc(Game.metacritic_score)).limit(limit)
+            
+            rows = (await session.execute(statement)).all()
+            return [{
+                'id': game.id,
+                'title': game.title,
+                'slug': game.slug,
+                'developer': game.developer,
+                'genres': game.genres,
+                'image_url': game.cover_image_url,
+                'rating': game.metacritic_score,
+                'lowest_price': float(price) if price is not None else None
+            } for game, price in rows]
+        
+        return await self._respond(request, build, region)
+    
+    async def price_history(self, request):
+        """Price history for a game, same shape as PriceService.get_price_history"""
+        game_id = _int(request.match_info['game_id'], 0)
+        days = min(_int(request.query.get('days'), 30), 365)
+        store_id = request.query.get('store_id')
+        region = request.query.get('region', 'US')
+        
+        async def build(session):
+            statement = select(Deal).options(joinedload(Deal.store)).filter(
+                Deal.game_id == game_id,
+                Deal.region == region,
+                Deal.created_at >= datetime.utcnow() - timedelta(days=days)
+            )
+            if store_id:
+                statement = statement.filter(Deal.store_id == _int(store_id, 0))
+            
+            history_by_store = {}
+            for deal in (await session.execute(statement.order_by(Deal.created_at))).scalars():
+                store_name = deal.store.name if deal.store else 'Unknown'
+                history_by_store.setdefault(store_name, []).append({
+                    'date': deal.created_at.isoformat(),
+                    'price': float(deal.sale_price),
+                    'original_price': float(deal.normal_price),
+                    'discount': float(deal.savings_percentage)
+                })
+            
+            return {'game_id': game_id, 'region': region, 'days': days, 'history': history_by_store}
+        
+        return await self._respond(request, build, region)
+    
+    async def stream_deals(self, request):
+        """Server-Sent Events feed of new hot deals and price drops for a region
+        
+        Event ids are deal versions, so a client that was away can catch up from
+        /api/deals/changes?since=<last id>.
+        """
+        region = request.query.get('region', 'US')
+        response = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+            'Access-Control-Allow-Origin': '*'
+        })
+        await response.prepare(request)
+        await response.write(f"retry: {self.keepalive_seconds * 1000}\n\n".encode())
+        
+        queue = self.broadcaster.subscribe(region)
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=self.keepalive_seconds)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from timing out idle streams
+                    await response.write(b': keepalive\n\n')
+                    continue
+                
+                if message is None:
+                    break
+                
+                await response.write(message)
+        except ConnectionResetError:
+            pass
+        finally:
+            # Runs on cancellation too, which then propagates to aiohttp
+            self.broadcaster.unsubscribe(region, queue)
+        
+        return response
+    
+    async def health(self, request):
+        return web.json_response({
+            'pending': self.pending,
+            'cache_entries': len(self.cache.entries),
+            'cache_hits': self.cache.hits,
+            'cache_misses': self.cache.misses,
+            'live_clients': sum(len(queues) for queues in self.broadcaster.subscribers.values()),
+            'live_events_sent': self.broadcaster.published,
+            'live_clients_dropped': self.broadcaster.dropped
+        })
+
+def _int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+def _sse_event(data):
+    """Encode a published live deal event once, as the SSE frame every client receives"""
+    live_event = json.loads(data)
+    return (f"id: {live_event['version']}\nevent: {live_event['type']}\n"
+            f"data: {json.dumps(live_event['deal'])}\n\n").encode()
+
+def _etags(header):
+    """Opaque tags from an If-None-Match header, ignoring weakness"""
+    return {tag.strip().removeprefix('W/').strip('"') for tag in header.split(',') if tag.strip()}
+
+def _float(value, default):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+@web.middleware
+async def cors_middleware(request, handler):
+    # Pages served by the Flask app poll this API from another origin
+    response = await handler(request)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+def create_async_app(database_url=None, **kwargs):
+    """Build the aiohttp application; kwargs are passed to AsyncReadAPI"""
+    api = AsyncReadAPI(database_url, **kwargs)
+    
+    app = web.Application(middlewares=[cors_middleware])
+    app['api'] = api
+    app.router.add_get('/api/deals', api.deals)
+    app.router.add_get('/api/deals/changes', api.deal_changes)
+    app.router.add_get('/api/search', api.search)
+    app.router.add_get('/api/games/{game_id:\\d+}/price-history', api.price_history)
+    app.router.add_get('/api/stream/deals', api.stream_deals)
+    app.router.add_get('/healthz', api.health)
+    app.on_startup.append(api.broadcaster.start)
+    app.on_shutdown.append(api.broadcaster.stop)
+    app.on_cleanup.append(api.close)
+    
+    return app
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the async read API')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--database-url', help='Defaults to DATABASE_URL')
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(create_async_app(args.database_url), host=args.host, port=args.port)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+"""
+Benchmark suite for Game Price Tracker
+"""
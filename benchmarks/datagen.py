@@ -0,0 +1,296 @@
+"""
+Synthetic catalogue generator for benchmarks
+
+Builds a deterministic catalogue of games, stores, current prices, deal history,
+users, wishlists and price alerts, with popularity following a Zipf-like curve so
+a small set of games attracts most wishlists and alerts, as in production.
+"""
+
+from models import Store, Game, GameStore, Deal, User, UserWishlist, PriceAlert
+from sqlalchemy import text
+from datetime import datetime, timedelta
+import json
+import random
+
+SCALES = {
+    'small': {'games': 2000, 'stores': 8, 'users': 500, 'wishlist_per_user': 10, 'alerts_per_user': 2},
+    'medium': {'games': 20000, 'stores': 15, 'users': 5000, 'wishlist_per_user': 15, 'alerts_per_user': 3},
+    'large': {'games': 100000, 'stores': 25, 'users': 50000, 'wishlist_per_user': 20, 'alerts_per_user': 4},
+}
+
+# The first stores match PriceUpdateService.STORE_MAPPING so ingestion finds them
+CHEAPSHARK_STORES = [('1', 'steam', 'Steam'), ('25', 'epic', 'Epic Games Store'), ('7', 'gog', 'GOG'),
+                     ('2', 'humble', 'Humble Store'), ('15', 'fanatical', 'Fanatical')]
+
+GENRES = ['Action', 'Adventure', 'RPG', 'Strategy', 'Simulation', 'Puzzle', 'Racing', 'Sports',
+          'Shooter', 'Platformer', 'Horror', 'Indie']
+NORMAL_PRICES = [4.99, 9.99, 14.99, 19.99, 29.99, 39.99, 49.99, 59.99, 69.99]
+DISCOUNTS = [10, 15, 20, 25, 30, 33, 40, 50, 60, 66, 75, 80, 85, 90]
+
+_ADJECTIVES = ['Dark', 'Lost', 'Eternal', 'Crimson', 'Silent', 'Iron', 'Hidden', 'Broken', 'Final', 'Star']
+_NOUNS = ['Kingdom', 'Legacy', 'Frontier', 'Protocol', 'Odyssey', 'Horizon', 'Dungeon', 'Empire', 'Signal', 'Tide']
+
+BATCH_SIZE = 5000
+HISTORY_DAYS = 30
+
+def game_title(game_id):
+    """Get the deterministic title of a generated game"""
+    return f"{_ADJECTIVES[game_id % 10]} {_NOUNS[(game_id // 10) % 10]} {game_id}"
+
+def steam_app_id(game_id):
+    """Get the deterministic Steam app id of a generated game"""
+    return 100000 + game_id
+
+def deal_id(game_id, cheapshark_store_id):
+    """Get the CheapShark-style deal id the mock server uses for a game in a store"""
+    return f"bench-{cheapshark_store_id}-{game_id}"
+
+def popularity_weights(count, exponent=1.1):
+    """Zipf-like weights where game 1 is the most popular"""
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+class CatalogueGenerator:
+    """Bulk-loads a synthetic catalogue into SQLite or PostgreSQL"""
+    
+    def __init__(self, db, scale='small', seed=42, **overrides):
+        self.db = db
+        self.params = dict(SCALES[scale], **overrides)
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.now = datetime.utcnow()
+        self.counts = {}
+    
+    def generate(self):
+        """Create the schema and load every table, returning row counts per table"""
+        self.db.drop_all()
+        self.db.create_all()
+        
+        game_ids = list(range(1, self.params['games'] + 1))
+        weights = popularity_weights(len(game_ids))
+        cumulative_weights = []
+        total = 0
+        for weight in weights:
+            total += weight
+            cumulative_weights.append(total)
+        
+        self._insert(Store, self._stores())
+        self._insert(Game, self._games(game_ids))
+        
+        prices = {}
+        self._insert(GameStore, self._game_stores(game_ids, prices))
+        self._insert(Deal, self._deals(prices))
+        self._insert(User, self._users())
+        self._insert(UserWishlist, self._wishlists(game_ids, cumulative_weights))
+        self._insert(PriceAlert, self._alerts(game_ids, cumulative_weights, prices))
+        
+        self._reset_sequences()
+        return dict(self.counts, seed=self.seed, **self.params)
+    
+    def _stores(self):
+        for index in range(self.params['stores']):
+            if index < len(CHEAPSHARK_STORES):
+                _, slug, name = CHEAPSHARK_STORES[index]
+            else:
+                slug, name = f"store-{index + 1}", f"Store {index + 1}"
+            yield {
+                'id': index + 1,
+                'name': name,
+                'slug': slug,
+                'base_url': f"https://{slug}.example.com",
+                'is_active': True,
+                'rate_limit_per_minute': 60,
+                'created_at': self.now,
+                'updated_at': self.now
+            }
+    
+    def _games(self, game_ids):
+        for game_id in game_ids:
+            genres = self.random.sample(GENRES, self.random.randint(1, 3))
+            score = int(self.random.gauss(72, 10)) if self.random.random() < 0.7 else None
+            yield {
+                'id': game_id,
+                'steam_app_id': steam_app_id(game_id),
+                'title': game_title(game_id),
+                'slug': f"game-{game_id}",
+                'developer': f"Studio {game_id % 500}",
+                'publisher': f"Publisher {game_id % 120}",
+                'genres': json.dumps(genres),
+                'platforms': json.dumps(['windows']),
+                'release_date': self.now - timedelta(days=self.random.randint(0, 3650)),
+                'metacritic_score': max(20, min(score, 99)) if score else None,
+                'created_at': self.now,
+                'updated_at': self.now
+            }
+    
+    def _game_stores(self, game_ids, prices):
+        """Popular games are sold in more stores; roughly 40% of listings are on sale"""
+        store_ids = list(range(1, self.params['stores'] + 1))
+        row_id = 0
+        for game_id in game_ids:
+            store_count = min(len(store_ids), 1 + int(6 / (1 + game_id / 500)) + self.random.randint(0, 1))
+            normal_price = self.random.choice(NORMAL_PRICES)
+            
+            for store_id in self.random.sample(store_ids, store_count):
+                roll = self.random.random()
+                if roll < 0.005:
+                    discount = 100.0
+                elif roll < 0.4:
+                    discount = float(self.random.choice(DISCOUNTS))
+                else:
+                    discount = 0.0
+                current_price = round(normal_price * (1 - discount / 100), 2)
+                
+                row_id += 1
+                prices[row_id] = (game_id, store_id, current_price, normal_price, discount)
+                yield {
+                    'id': row_id,
+                    'game_id': game_id,
+                    'store_id': store_id,
+                    'store_game_id': deal_id(game_id, self._cheapshark_id(store_id)),
+                    'store_url': f"https://store.example.com/{store_id}/{game_id}",
+                    'is_available': True,
+                    'current_price': current_price,
+                    'original_price': normal_price,
+                    'discount_percentage': discount,
+                    'currency': 'USD',
+                    'region': 'US',
+                    'is_on_sale': discount > 0,
+                    'deal_start_date': self.now - timedelta(days=self.random.randint(0, 14)) if discount else None,
+                    'deal_end_date': self.now + timedelta(hours=self.random.randint(1, 14 * 24)) if discount else None,
+                    'price_volatility': 0,
+                    'refresh_priority': 0,
+                    'created_at': self.now,
+                    'updated_at': self.now,
+                    'last_price_check': self.now - timedelta(minutes=self.random.randint(0, 24 * 60))
+                }
+    
+    def _deals(self, prices):
+        """One live deal per on-sale listing plus a few expired ones as price history"""
+        row_id = 0
+        for game_id, store_id, current_price, normal_price, discount in prices.values():
+            history = self.random.randint(0, 3)
+            for age in range(history + (1 if discount else 0)):
+                is_current = discount and age == history
+                savings = discount if is_current else float(self.random.choice(DISCOUNTS))
+                created_at = self.now - timedelta(
+                    days=0 if is_current else self.random.randint(1, HISTORY_DAYS)
+                ) - timedelta(minutes=self.random.randint(0, 24 * 60))
+                
+                row_id += 1
+                yield {
+                    'id': row_id,
+                    'game_id': game_id,
+                    'store_id': store_id,
+                    'title': game_title(game_id),
+                    'deal_url': f"https://store.example.com/{store_id}/{game_id}",
+                    'sale_price': current_price if is_current else round(normal_price * (1 - savings / 100), 2),
+                    'normal_price': normal_price,
+                    'savings_percentage': savings,
+                    'currency': 'USD',
+                    'region': 'US',
+                    'is_on_sale': bool(is_current),
+                    'external_deal_id': deal_id(game_id, self._cheapshark_id(store_id)) if is_current else None,
+                    'created_at': created_at,
+                    'updated_at': created_at
+                }
+    
+    def _users(self):
+        for user_id in range(1, self.params['users'] + 1):
+            yield {
+                'id': user_id,
+                'email': f"user{user_id}@bench.local",
+                'username': f"user{user_id}",
+                'password_hash': 'benchmark',
+                'preferred_currency': 'USD',
+                'preferred_region': 'US',
+                'email_notifications': self.random.random() < 0.8,
+                'price_alert_notifications': True,
+                'deal_notifications': False,
+                'is_active': True,
+                'is_verified': True,
+                'created_at': self.now,
+                'updated_at': self.now
+            }
+    
+    def _wishlists(self, game_ids, cumulative_weights):
+        row_id = 0
+        for user_id in range(1, self.params['users'] + 1):
+            size = max(1, int(self.random.expovariate(1 / self.params['wishlist_per_user'])))
+            picks = set(self.random.choices(game_ids, cum_weights=cumulative_weights, k=size))
+            
+            for game_id in picks:
+                row_id += 1
+                yield {
+                    'id': row_id,
+                    'user_id': user_id,
+                    'game_id': game_id,
+                    'added_at': self.now - timedelta(days=self.random.randint(0, 365)),
+                    'priority': self.random.randint(1, 3)
+                }
+    
+    def _alerts(self, game_ids, cumulative_weights, prices):
+        """Alerts target a fraction of normal price, so some are already satisfied"""
+        normal_prices = {}
+        for game_id, _, _, normal_price, _ in prices.values():
+            normal_prices[game_id] = normal_price
+        
+        row_id = 0
+        for user_id in range(1, self.params['users'] + 1):
+            size = int(self.random.expovariate(1 / self.params['alerts_per_user']))
+            picks = set(self.random.choices(game_ids, cum_weights=cumulative_weights, k=size))
+            
+            for game_id in picks:
+                row_id += 1
+                yield {
+                    'id': row_id,
+                    'user_id': user_id,
+                    'game_id': game_id,
+                    'alert_type': 'price',
+                    'target_price': round(normal_prices.get(game_id, 19.99) * self.random.uniform(0.2, 0.9), 2),
+                    'currency': 'USD',
+                    'region': 'US',
+                    'is_active': True,
+                    'is_triggered': False,
+                    'email_sent': False,
+                    'created_at': self.now,
+                    'updated_at': self.now
+                }
+    
+    def _insert(self, model, rows):
+        """Insert rows in executemany batches, bypassing the ORM unit of work"""
+        table = model.__table__
+        count = 0
+        batch = []
+        
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                self.db.session.execute(table.insert(), batch)
+                count += len(batch)
+                batch = []
+        
+        if batch:
+            self.db.session.execute(table.insert(), batch)
+            count += len(batch)
+        
+        self.db.session.commit()
+        self.counts[table.name] = count
+    
+    def _reset_sequences(self):
+        """Move PostgreSQL id sequences past the explicitly inserted ids"""
+        if self.db.engine.dialect.name != 'postgresql':
+            return
+        
+        for table in self.db.metadata.sorted_tables:
+            if 'id' in table.columns:
+                self.db.session.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                    f"COALESCE((SELECT MAX(id) FROM {table.name}), 0) + 1, false)"
+                ))
+        self.db.session.commit()
+    
+    @staticmethod
+    def _cheapshark_id(store_id):
+        if store_id <= len(CHEAPSHARK_STORES):
+            return CHEAPSHARK_STORES[store_id - 1][0]
+        return str(1000 + store_id)
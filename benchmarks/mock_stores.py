@@ -0,0 +1,414 @@
+"""
+Local stand-in for the CheapShark, Steam, Epic and GOG APIs
+
+Serves generated payloads in each store's response shape (or replays recorded
+ones) with configurable latency, rate limiting, pagination and failure
+injection, so ingestion can be exercised offline and benchmarked
+deterministically. Point the API clients at it with the *_API_BASE_URL
+settings:
+
+    python -m benchmarks.mock_stores --port 8089 --latency-ms 50 --rate-limit 600 --failure-rate 0.02
+    export CHEAPSHARK_API_BASE_URL=http://127.0.0.1:8089/cheapshark/api/1.0
+    export STEAM_API_BASE_URL=http://127.0.0.1:8089/steam/api
+    export EPIC_API_BASE_URL=http://127.0.0.1:8089/epic
+    export GOG_API_BASE_URL=http://127.0.0.1:8089/gog/games/ajax
+"""
+
+from aiohttp import web
+from benchmarks.datagen import game_title, steam_app_id, deal_id, NORMAL_PRICES, DISCOUNTS, CHEAPSHARK_STORES
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import threading
+import time
+
+API_PREFIXES = {
+    'cheapshark': '/cheapshark/api/1.0',
+    'steam': '/steam/api',
+    'epic': '/epic',
+    'gog': '/gog/games/ajax'
+}
+
+CURRENCIES = {'us': 'USD', 'gb': 'GBP', 'ca': 'CAD', 'au': 'AUD'}
+
+class MockStoreConfig:
+    """Behaviour knobs for the mock server; can be changed at runtime via POST /__config"""
+    
+    FIELDS = ('latency_ms', 'jitter_ms', 'rate_limit', 'failure_rate', 'max_pages')
+    
+    def __init__(self, games=2000, latency_ms=0, jitter_ms=0, rate_limit=0, failure_rate=0.0,
+                 max_pages=50, seed=42, replay_dir=None):
+        self.games = games
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit = rate_limit  # Requests per minute across all clients; 0 disables
+        self.failure_rate = failure_rate
+        self.max_pages = max_pages
+        self.seed = seed
+        self.replay_dir = replay_dir
+    
+    def update(self, values):
+        for field in self.FIELDS:
+            if field in values:
+                setattr(self, field, type(getattr(self, field))(values[field]))
+    
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+class MockStoreState:
+    """Counters, rate limiter and generated or replayed payloads shared by all handlers"""
+    
+    def __init__(self, config):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.stats = {'requests': 0, 'rate_limited': 0, 'failures': 0, 'by_route': {}}
+        self.hits = {}
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._recordings = {}
+    
+    def recording(self, name):
+        """Load a recorded payload from the replay directory, if one exists"""
+        if not self.config.replay_dir:
+            return None
+        
+        if name not in self._recordings:
+            path = os.path.join(self.config.replay_dir, f"{name}.json")
+            self._recordings[name] = None
+            if os.path.exists(path):
+                with open(path) as recording:
+                    self._recordings[name] = json.load(recording)
+        
+        return self._recordings[name]
+    
+    def take_token(self):
+        """Fixed one-minute window limiter; returns seconds to wait when the window is full"""
+        if not self.config.rate_limit:
+            return 0
+        
+        now = time.monotonic()
+        if now - self._window_start >= 60:
+            self._window_start = now
+            self._window_count = 0
+        
+        if self._window_count >= self.config.rate_limit:
+            return max(math.ceil(60 - (now - self._window_start)), 1)
+        
+        self._window_count += 1
+        return 0
+    
+    def generation(self, key):
+        """Count repeat requests for the same page so prices drift between runs"""
+        generation = self.hits.get(key, 0)
+        self.hits[key] = generation + 1
+        return generation
+    
+    def price(self, game_id, generation=0):
+        normal_price = NORMAL_PRICES[game_id % len(NORMAL_PRICES)]
+        savings = DISCOUNTS[(game_id + generation) % len(DISCOUNTS)]
+        return round(normal_price * (1 - savings / 100), 2), normal_price, savings
+
+@web.middleware
+async def chaos_middleware(request, handler):
+    """Apply latency, rate limiting and failure injection to every store route"""
+    state = request.app['state']
+    config = state.config
+    
+    if request.path.startswith('/__'):
+        return await handler(request)
+    
+    route = request.path.split('/')[1]
+    state.stats['requests'] += 1
+    state.stats['by_route'][route] = state.stats['by_route'].get(route, 0) + 1
+    
+    if config.latency_ms or config.jitter_ms:
+        delay = config.latency_ms + state.random.uniform(0, config.jitter_ms)
+        await asyncio.sleep(delay / 1000)
+    
+    retry_after = state.take_token()
+    if retry_after:
+        state.stats['rate_limited'] += 1
+        return web.json_response({'error': 'Too Many Requests'}, status=429,
+                                 headers={'Retry-After': str(retry_after)})
+    
+    if config.failure_rate and state.random.random() < config.failure_rate:
+        state.stats['failures'] += 1
+        return web.json_response({'error': 'Injected failure'}, status=503)
+    
+    return await handler(request)
+
+def _paginate(items, page, page_size):
+    start = page * page_size
+    return items[start:start + page_size]
+
+async def cheapshark_deals(request):
+    """CheapShark /deals: a page of deals for a store, or a single deal lookup by id"""
+    state = request.app['state']
+    params = request.query
+    
+    if 'id' in params:
+        return web.json_response(_cheapshark_deal_lookup(state, params['id']))
+    
+    store_id = params.get('storeID', '1')
+    page = int(params.get('pageNumber', 0))
+    page_size = min(int(params.get('pageSize', 60)), 60)
+    
+    recorded = state.recording('cheapshark_deals')
+    if recorded is not None:
+        deals = [deal for deal in recorded if deal.get('storeID') == store_id] or recorded
+        total_pages = max(math.ceil(len(deals) / page_size), 1)
+        return web.json_response(_paginate(deals, page, page_size),
+                                 headers={'X-Total-Page-Count': str(total_pages)})
+    
+    total_pages = min(math.ceil(state.config.games / page_size), state.config.max_pages)
+    if page >= total_pages:
+        return web.json_response([], headers={'X-Total-Page-Count': str(total_pages)})
+    
+    generation = state.generation((store_id, page))
+    offset = (int(store_id) * 7919 + page * page_size) % state.config.games
+    deals = []
+    for index in range(page_size):
+        game_id = 1 + (offset + index) % state.config.games
+        sale_price, normal_price, savings = state.price(game_id, generation)
+        deals.append({
+            'internalName': game_title(game_id).upper().replace(' ', ''),
+            'title': game_title(game_id),
+            'dealID': deal_id(game_id, store_id),
+            'storeID': store_id,
+            'gameID': str(game_id),
+            'salePrice': f"{sale_price:.2f}",
+            'normalPrice': f"{normal_price:.2f}",
+            'isOnSale': '1',
+            'savings': f"{savings:.6f}",
+            'metacriticScore': str(60 + game_id % 40),
+            'steamAppID': str(steam_app_id(game_id)),
+            'dealRating': '8.5',
+            'thumb': f"https://images.example.com/{game_id}.jpg"
+        })
+    
+    return web.json_response(deals, headers={'X-Total-Page-Count': str(total_pages)})
+
+def _cheapshark_deal_lookup(state, requested_id):
+    try:
+        game_id = int(requested_id.rsplit('-', 1)[-1])
+    except ValueError:
+        game_id = 1 + sum(map(ord, requested_id)) % state.config.games
+    
+    sale_price, normal_price, _ = state.price(game_id, state.generation(('deal', requested_id)))
+    return {
+        'gameInfo': {
+            'storeID': requested_id.split('-')[1] if requested_id.startswith('bench-') else '1',
+            'gameID': str(game_id),
+            'name': game_title(game_id),
+            'steamAppID': str(steam_app_id(game_id)),
+            'salePrice': f"{sale_price:.2f}",
+            'retailPrice': f"{normal_price:.2f}",
+            'metacriticScore': str(60 + game_id % 40),
+            'thumb': f"https://images.example.com/{game_id}.jpg"
+        },
+        'cheaperStores': [],
+        'cheapestPrice': {'price': f"{sale_price:.2f}", 'date': int(time.time())}
+    }
+
+async def cheapshark_stores(request):
+    return web.json_response([
+        {'storeID': store_id, 'storeName': name, 'isActive': 1}
+        for store_id, _, name in CHEAPSHARK_STORES
+    ])
+
+async def steam_appdetails(request):
+    """Steam /appdetails keyed by app id, with price_overview in cents"""
+    state = request.app['state']
+    app_id = request.query.get('appids', '')
+    
+    recorded = state.recording('steam_appdetails')
+    if recorded is not None:
+        return web.json_response({app_id: recorded.get(app_id, {'success': False})})
+    
+    game_id = int(app_id) - steam_app_id(0) if app_id.isdigit() else 0
+    if not 1 <= game_id <= state.config.games:
+        return web.json_response({app_id: {'success': False}})
+    
+    sale_price, normal_price, savings = state.price(game_id, state.generation(('steam', app_id)))
+    return web.json_response({app_id: {
+        'success': True,
+        'data': {
+            'type': 'game',
+            'name': game_title(game_id),
+            'steam_appid': int(app_id),
+            'is_free': False,
+            'price_overview': {
+                'currency': CURRENCIES.get(request.query.get('cc', 'us').lower(), 'EUR'),
+                'initial': int(round(normal_price * 100)),
+                'final': int(round(sale_price * 100)),
+                'discount_percent': savings
+            }
+        }
+    }})
+
+async def epic_free_games(request):
+    """Epic freeGamesPromotions in the Catalog.searchStore.elements shape"""
+    state = request.app['state']
+    
+    elements = state.recording('epic_free_games')
+    if elements is None:
+        elements = [{
+            'id': f"epic-{game_id}",
+            'title': game_title(game_id),
+            'description': f"{game_title(game_id)} is free this week.",
+            'urlSlug': f"game-{game_id}",
+            'keyImages': [{'type': 'Thumbnail', 'url': f"https://images.example.com/{game_id}.jpg"}],
+            'price': {'totalPrice': {'discountPrice': 0 if index < 2 else 999, 'originalPrice': 1999}}
+        } for index, game_id in enumerate(range(1, min(state.config.games, 6) + 1))]
+    
+    return web.json_response({'data': {'Catalog': {'searchStore': {
+        'elements': elements,
+        'paging': {'count': len(elements), 'total': len(elements)}
+    }}}})
+
+async def gog_filtered(request):
+    """GOG /filtered search with page-based pagination"""
+    state = request.app['state']
+    query = request.query.get('search', '').lower()
+    limit = int(request.query.get('limit', 20))
+    page = max(int(request.query.get('page', 1)), 1)
+    
+    products = state.recording('gog_products')
+    if products is None:
+        products = []
+        for game_id in range(1, state.config.games + 1):
+            title = game_title(game_id)
+            if query and query not in title.lower():
+                continue
+            sale_price, normal_price, savings = state.price(game_id)
+            products.append({
+                'id': 2000000000 + game_id,
+                'title': title,
+                'slug': f"game-{game_id}",
+                'url': f"/game/game-{game_id}",
+                'price': {
+                    'amount': f"{sale_price:.2f}",
+                    'baseAmount': f"{normal_price:.2f}",
+                    'discountPercentage': savings,
+                    'isDiscounted': True
+                }
+            })
+    
+    total_pages = max(math.ceil(len(products) / limit), 1)
+    return web.json_response({
+        'products': _paginate(products, page - 1, limit),
+        'page': page,
+        'totalPages': total_pages,
+        'totalResults': len(products)
+    })
+
+async def stats(request):
+    return web.json_response(request.app['state'].stats)
+
+async def update_config(request):
+    config = request.app['state'].config
+    config.update(await request.json())
+    return web.json_response(config.to_dict())
+
+def create_mock_app(config=None):
+    """Build the aiohttp application serving every mocked store API"""
+    app = web.Application(middlewares=[chaos_middleware])
+    app['state'] = MockStoreState(config or MockStoreConfig())
+    
+    app.router.add_get(f"{API_PREFIXES['cheapshark']}/deals", cheapshark_deals)
+    app.router.add_get(f"{API_PREFIXES['cheapshark']}/stores", cheapshark_stores)
+    app.router.add_get(f"{API_PREFIXES['steam']}/appdetails", steam_appdetails)
+    app.router.add_get(f"{API_PREFIXES['epic']}/freeGamesPromotions", epic_free_games)
+    app.router.add_get(f"{API_PREFIXES['gog']}/filtered", gog_filtered)
+    app.router.add_get('/__stats', stats)
+    app.router.add_post('/__config', update_config)
+    
+    return app
+
+class MockStoreServer:
+    """Runs the mock store APIs on a background event loop, for use from synchronous code"""
+    
+    def __init__(self, config=None, host='127.0.0.1', port=0):
+        self.app = create_mock_app(config)
+        self.host = host
+        self.port = port
+        self._loop = None
+        self._runner = None
+        self._thread = None
+    
+    @property
+    def state(self):
+        return self.app['state']
+    
+    def base_url(self, api):
+        return f"http://{self.host}:{self.port}{API_PREFIXES[api]}"
+    
+    def environ(self):
+        """Get the *_API_BASE_URL settings that point every client at this server"""
+        return {f"{api.upper()}_API_BASE_URL": self.base_url(api) for api in API_PREFIXES}
+    
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+        
+        async def serve():
+            self._runner = web.AppRunner(self.app, access_log=None)
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, self.host, self.port)
+            await site.start()
+            self.port = site._server.sockets[0].getsockname()[1]
+            started.set()
+        
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(serve())
+            self._loop.run_forever()
+        
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait(timeout=10)
+        return self
+    
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=10)
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve mock store APIs for offline ingestion testing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--games', type=int, default=2000)
+    parser.add_argument('--latency-ms', type=int, default=0)
+    parser.add_argument('--jitter-ms', type=int, default=0)
+    parser.add_argument('--rate-limit', type=int, default=0, help='Requests per minute before answering 429')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    parser.add_argument('--max-pages', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--replay-dir', help='Directory of recorded payloads (cheapshark_deals.json, '
+                                             'steam_appdetails.json, epic_free_games.json, gog_products.json)')
+    args = parser.parse_args(argv)
+    
+    config = MockStoreConfig(
+        games=args.games,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        rate_limit=args.rate_limit,
+        failure_rate=args.failure_rate,
+        max_pages=args.max_pages,
+        seed=args.seed,
+        replay_dir=args.replay_dir
+    )
+    web.run_app(create_mock_app(config), host=args.host, port=args.port)
+
+if __name__ == '__main__':
+    main()
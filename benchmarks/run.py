@@ -0,0 +1,275 @@
+"""
+Benchmark runner for Game Price Tracker
+
+Loads a synthetic catalogue, times the hot service calls, a full ingestion run
+against a local mock store server and the main pages, and writes the results
+as JSON. Ingestion runs against benchmarks/mock_stores.py through the
+*_API_BASE_URL settings, so no live store API is touched. The alert scenarios
+need the Redis at REDIS_URL for the threshold index and its lock. Pass
+--baseline to compare medians with an earlier run; the exit status is 1 when
+any scenario regressed by more than --threshold.
+
+    python -m benchmarks.run --scale small --output benchmarks/results.json
+    python -m benchmarks.run --database-url postgresql://localhost/gametracker_bench \\
+        --baseline benchmarks/baseline.json
+"""
+
+from datetime import datetime
+from benchmarks.datagen import CatalogueGenerator, SCALES
+from benchmarks.mock_stores import MockStoreConfig, MockStoreServer
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+PAGES = ['/', '/deals', '/search?q=Star', '/search?genre=RPG&min_rating=70', '/api/deals?limit=50']
+
+class NullNotifications:
+    """Stands in for NotificationService so alert checks measure only the database work"""
+    
+    def enqueue_price_alert(self, alert, deal, reason=None):
+        return True
+    
+    def enqueue_wishlist_target(self, item, deal, reason):
+        return True
+
+def time_scenario(run, repeat=5, warmup=1, setup=None):
+    """Time `run` over warmup + repeat iterations, calling the untimed `setup` before each"""
+    timings = []
+    result = None
+    
+    for iteration in range(warmup + repeat):
+        if setup:
+            setup()
+        
+        start = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - start
+        
+        if iteration >= warmup:
+            timings.append(elapsed)
+    
+    ordered = sorted(timings)
+    return {
+        'runs': len(timings),
+        'min': ordered[0],
+        'median': statistics.median(ordered),
+        'mean': statistics.mean(ordered),
+        'p95': ordered[max(math.ceil(0.95 * len(ordered)) - 1, 0)],
+        'max': ordered[-1],
+        'result': result
+    }
+
+def create_bench_app(database_url):
+    """Worker-style app bound to the benchmark database for service-level scenarios"""
+    from app import create_worker_app
+    from models import db
+    
+    app = create_worker_app('default', SQLALCHEMY_DATABASE_URI=database_url, SQLALCHEMY_ECHO=False)
+    return app, db
+
+def service_scenarios(db):
+    """Build (name, run, setup) tuples for the service-level scenarios"""
+    from models import PriceAlert
+    from services.alert_index import AlertThresholdIndex
+    from services.game_service import GameService
+    from services.deal_service import DealService
+    from services.price_service import PriceService
+    
+    game_service = GameService(db)
+    deal_service = DealService(db)
+    price_service = PriceService(db, notification_service=NullNotifications())
+    
+    def fresh_session():
+        db.session.remove()
+    
+    def reset_alerts():
+        PriceAlert.query.filter(PriceAlert.is_triggered == True).update({
+            'is_triggered': False,
+            'triggered_at': None,
+            'triggered_price': None,
+            'triggered_store': None
+        }, synchronize_session=False)
+        db.session.commit()
+        db.session.remove()
+        AlertThresholdIndex().rebuild()
+    
+    return [
+        ('search_games:title', lambda: len(game_service.search_games(query='Star')), fresh_session),
+        ('search_games:genre_rating', lambda: len(game_service.search_games(genre='RPG', min_rating=70)), fresh_session),
+        ('search_games:max_price', lambda: len(game_service.search_games(max_price=20)), fresh_session),
+        ('get_hot_deals', lambda: len(deal_service.get_hot_deals(limit=20)), fresh_session),
+        ('get_deal_stats', lambda: deal_service.get_deal_stats()['total_deals'], fresh_session),
+        ('check_price_alerts', price_service.check_price_alerts, reset_alerts),
+    ]
+
+def run_ingestion(db, args, server):
+    """Time update_all_prices against the mock server"""
+    from services.external_apis import PriceUpdateService
+    
+    os.environ.update(server.environ())
+    os.environ['CHEAPSHARK_API_RATE_LIMIT'] = str(10 ** 9)
+    price_update_service = PriceUpdateService(db)
+    
+    return time_scenario(
+        lambda: price_update_service.update_all_prices(
+            pages_per_store=args.pages_per_store,
+            page_size=args.page_size
+        ),
+        repeat=max(args.repeat // 2, 1),
+        warmup=1,
+        setup=db.session.remove
+    )
+
+def run_pages(database_url, args):
+    """Time the main pages through the Flask test client"""
+    from app import create_app
+    
+    app = create_app('default', SQLALCHEMY_DATABASE_URI=database_url, SQLALCHEMY_ECHO=False)
+    
+    client = app.test_client()
+    results = {}
+    
+    for path in PAGES:
+        def request_page():
+            response = client.get(path)
+            return response.status_code
+        
+        results[f"page:{path}"] = time_scenario(request_page, repeat=args.repeat, warmup=args.warmup)
+    
+    return results
+
+def compare(results, baseline, threshold, min_delta=0.001):
+    """Compare medians against a baseline run, returning the names of regressed scenarios
+    
+    Slowdowns smaller than `min_delta` seconds are ignored so sub-millisecond
+    scenarios don't flap on timer noise.
+    """
+    regressions = []
+    
+    print(f"{'scenario':<40} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, current in sorted(results['scenarios'].items()):
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous or not previous.get('median'):
+            print(f"{name:<40} {'-':>10} {current['median'] * 1000:>8.1f}ms {'new':>8}")
+            continue
+        
+        change = current['median'] / previous['median'] - 1
+        flag = ''
+        if change > threshold and current['median'] - previous['median'] > min_delta:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        
+        print(f"{name:<40} {previous['median'] * 1000:>8.1f}ms {current['median'] * 1000:>8.1f}ms "
+              f"{change:>+7.0%}{flag}")
+    
+    return regressions
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run the Game Price Tracker benchmark suite')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database-url', help='Defaults to a SQLite file in a temporary directory')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--pages-per-store', type=int, default=2)
+    parser.add_argument('--page-size', type=int, default=60)
+    parser.add_argument('--mock-latency-ms', type=int, default=0)
+    parser.add_argument('--mock-failure-rate', type=float, default=0.0)
+    parser.add_argument('--skip-pages', action='store_true', help='Skip the Flask test client scenarios')
+    parser.add_argument('--output', help='Write results JSON to this path')
+    parser.add_argument('--baseline', help='Compare against a previous results JSON')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative median slowdown that counts as a regression')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help='Ignore slowdowns smaller than this many milliseconds')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    
+    from services.redis_client import get_redis
+    try:
+        get_redis().ping()
+    except Exception as e:
+        print(f"The benchmarks need Redis at REDIS_URL ({os.getenv('REDIS_URL', 'redis://localhost:6379')}): {str(e)}",
+              file=sys.stderr)
+        return 2
+    
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}"
+    app, db = create_bench_app(database_url)
+    
+    results = {
+        'meta': {
+            'started_at': datetime.utcnow().isoformat(),
+            'revision': git_revision(),
+            'release': os.getenv('APP_RELEASE', 'dev'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'scale': args.scale
+        },
+        'scenarios': {}
+    }
+    
+    with app.app_context():
+        results['meta']['dialect'] = db.engine.dialect.name
+        
+        start = time.perf_counter()
+        results['meta']['catalogue'] = CatalogueGenerator(db, scale=args.scale, seed=args.seed).generate()
+        results['meta']['load_seconds'] = time.perf_counter() - start
+        print(f"Loaded {args.scale} catalogue in {results['meta']['load_seconds']:.1f}s")
+        
+        for name, run, setup in service_scenarios(db):
+            results['scenarios'][name] = time_scenario(run, repeat=args.repeat, warmup=args.warmup, setup=setup)
+        
+        mock_config = MockStoreConfig(
+            games=SCALES[args.scale]['games'],
+            latency_ms=args.mock_latency_ms,
+            failure_rate=args.mock_failure_rate,
+            seed=args.seed
+        )
+        with MockStoreServer(mock_config) as server:
+            results['scenarios']['update_all_prices'] = run_ingestion(db, args, server)
+    
+    if not args.skip_pages:
+        results['scenarios'].update(run_pages(database_url, args))
+    
+    for name, stats in sorted(results['scenarios'].items()):
+        print(f"{name:<40} median {stats['median'] * 1000:>8.1f}ms  p95 {stats['p95'] * 1000:>8.1f}ms")
+    
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, default=str)
+    
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold,
+                                  min_delta=args.min_delta_ms / 1000)
+        if regressions:
+            print(f"{len(regressions)} scenarios regressed by more than {args.threshold:.0%}")
+            return 1
+    
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""
+Cold-start timing for the web app and Celery worker entry points
+
+Each sample runs in a fresh interpreter so module imports are not cached:
+
+    python -m benchmarks.startup --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = {
+    'web': 'from app import create_app; create_app()',
+    'worker': 'import tasks; tasks.get_worker_app()',
+}
+
+_TIMER = """
+import sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+{statement}
+print(time.perf_counter() - start)
+"""
+
+def measure(statement, runs=5):
+    """Time a statement from a cold interpreter `runs` times, returning seconds per run"""
+    timings = []
+    for _ in range(runs):
+        output = subprocess.check_output(
+            [sys.executable, '-c', _TIMER.format(root=ROOT, statement=statement)],
+            cwd=ROOT,
+            stderr=subprocess.DEVNULL
+        )
+        timings.append(float(output.decode().strip().splitlines()[-1]))
+    return timings
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure web and worker cold start time')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', help='Write results JSON to this path')
+    args = parser.parse_args(argv)
+    
+    results = {}
+    for name, statement in ENTRY_POINTS.items():
+        timings = measure(statement, args.runs)
+        results[name] = {'median': statistics.median(timings), 'min': min(timings), 'max': max(timings)}
+        print(f"{name:<8} median {results[name]['median'] * 1000:>7.0f}ms  "
+              f"min {results[name]['min'] * 1000:>7.0f}ms  max {results[name]['max'] * 1000:>7.0f}ms")
+    
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Local HTTP sink for exercising webhook delivery
+
+Accepts webhook batches on any path, checks their signatures, counts events
+and duplicate deliveries, and can be made slow or flaky to exercise backoff:
+
+    python -m benchmarks.webhook_sink --port 8090 --secret s3cret --latency-ms 200 --failure-rate 0.1
+    flask add-webhook sink http://127.0.0.1:8090/hooks/sink --secret s3cret
+"""
+
+from aiohttp import web
+from webhook_worker import SIGNATURE_HEADER, verify_signature
+import argparse
+import asyncio
+import json
+import random
+
+class WebhookSinkConfig:
+    """Behaviour knobs for the sink; can be changed at runtime via POST /__config"""
+    
+    FIELDS = ('latency_ms', 'failure_rate', 'failure_status')
+    
+    def __init__(self, secret=None, latency_ms=0, failure_rate=0.0, failure_status=503, seed=42):
+        self.secret = secret  # None accepts unsigned requests
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.random = random.Random(seed)
+    
+    def update(self, values):
+        for field in self.FIELDS:
+            if field in values:
+                setattr(self, field, type(getattr(self, field))(values[field]))
+    
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+class WebhookSinkState:
+    def __init__(self, config):
+        self.config = config
+        self.delivery_ids = set()
+        self.event_ids = set()
+        self.stats = {'requests': 0, 'deliveries': 0, 'events': 0, 'duplicates': 0,
+                      'bad_signatures': 0, 'failures': 0, 'by_path': {}}
+
+async def receive(request):
+    state = request.app['state']
+    config = state.config
+    state.stats['requests'] += 1
+    
+    if config.latency_ms:
+        await asyncio.sleep(config.latency_ms / 1000)
+    
+    body = await request.read()
+    if config.secret and not verify_signature(config.secret, request.headers.get(SIGNATURE_HEADER, ''), body):
+        state.stats['bad_signatures'] += 1
+        return web.json_response({'error': 'Invalid signature'}, status=401)
+    
+    if config.failure_rate and config.random.random() < config.failure_rate:
+        state.stats['failures'] += 1
+        return web.json_response({'error': 'Injected failure'}, status=config.failure_status)
+    
+    payload = json.loads(body)
+    if payload['delivery_id'] in state.delivery_ids:
+        state.stats['duplicates'] += 1
+        return web.json_response({'status': 'duplicate'})
+    
+    state.delivery_ids.add(payload['delivery_id'])
+    state.event_ids.update(event['event_id'] for event in payload['events'])
+    state.stats['deliveries'] += 1
+    state.stats['events'] += len(payload['events'])
+    state.stats['by_path'][request.path] = state.stats['by_path'].get(request.path, 0) + len(payload['events'])
+    return web.json_response({'status': 'ok'})
+
+async def stats(request):
+    state = request.app['state']
+    return web.json_response(dict(state.stats, unique_events=len(state.event_ids)))
+
+async def update_config(request):
+    config = request.app['state'].config
+    config.update(await request.json())
+    return web.json_response(config.to_dict())
+
+def create_sink_app(config=None):
+    """Build the aiohttp application receiving webhook batches"""
+    app = web.Application()
+    app['state'] = WebhookSinkState(config or WebhookSinkConfig())
+    
+    app.router.add_get('/__stats', stats)
+    app.router.add_post('/__config', update_config)
+    app.router.add_post('/{path:.*}', receive)
+    
+    return app
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Receive webhook batches for local delivery testing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--secret', help='Subscription secret to verify signatures with')
+    parser.add_argument('--latency-ms', type=int, default=0)
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of requests answered with an error')
+    parser.add_argument('--failure-status', type=int, default=503)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+    
+    config = WebhookSinkConfig(
+        secret=args.secret,
+        latency_ms=args.latency_ms,
+        failure_rate=args.failure_rate,
+        failure_status=args.failure_status,
+        seed=args.seed
+    )
+    web.run_app(create_sink_app(config), host=args.host, port=args.port)
+
+if __name__ == '__main__':
+    main()
@@ -30,9 +30,18 @@ beat_schedule_filename = 'celerybeat-schedule'
 # Task routing
 task_routes = {
     'tasks.update_game_prices': {'queue': 'price_updates'},
+    'tasks.update_price_chunk': {'queue': 'price_updates'},
+    'tasks.aggregate_price_updates': {'queue': 'price_updates'},
+    'tasks.backfill_prices': {'queue': 'price_updates'},
+    'tasks.schedule_price_refreshes': {'queue': 'price_updates'},
+    'tasks.refresh_due_prices': {'queue': 'price_updates'},
+    'tasks.relay_outbox_events': {'queue': 'events'},
     'tasks.check_price_alerts': {'queue': 'alerts'},
     'tasks.cleanup_old_deals': {'queue': 'maintenance'},
     'tasks.send_weekly_digest': {'queue': 'emails'},
+    'tasks.send_digest_chunk': {'queue': 'emails'},
+    'tasks.dispatch_notifications': {'queue': 'emails'},
+    'tasks.import_steam_wishlist': {'queue': 'imports'},
 }
 
 # Result expiration
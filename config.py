@@ -8,7 +8,12 @@ from dotenv import load_dotenv
 load_dotenv()
 
 class Config:
-    """Base configuration"""
+    """Base configuration
+    
+    Holds the settings Flask and its extensions read from app.config. Tuning knobs
+    for the API clients, background tasks and the standalone async API and webhook
+    processes are read from the environment where they are used; see .env.example.
+    """
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///gametracker.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -29,6 +34,37 @@ class Config:
     MAIL_USE_TLS = os.getenv('MAIL_USE_TLS', 'true').lower() in ['true', 'on', '1']
     MAIL_USERNAME = os.getenv('MAIL_USERNAME')
     MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
+    MAIL_DEFAULT_SENDER = os.getenv('MAIL_DEFAULT_SENDER', 'alerts@gametracker.local')
+    
+    # Database connection pooling per process role, read by database.py. Pool size,
+    # overflow and statement timeout can be given per role (WEB_DB_*, WORKER_DB_*)
+    # or for both (DB_*); unset values fall back to the role defaults there.
+    # DB_PGBOUNCER=true hands pooling to PgBouncer.
+    DB_POOL_SIZE = os.getenv('DB_POOL_SIZE')
+    WEB_DB_POOL_SIZE = os.getenv('WEB_DB_POOL_SIZE')
+    WORKER_DB_POOL_SIZE = os.getenv('WORKER_DB_POOL_SIZE')
+    DB_MAX_OVERFLOW = os.getenv('DB_MAX_OVERFLOW')
+    WEB_DB_MAX_OVERFLOW = os.getenv('WEB_DB_MAX_OVERFLOW')
+    WORKER_DB_MAX_OVERFLOW = os.getenv('WORKER_DB_MAX_OVERFLOW')
+    DB_STATEMENT_TIMEOUT_MS = os.getenv('DB_STATEMENT_TIMEOUT_MS')
+    WEB_DB_STATEMENT_TIMEOUT_MS = os.getenv('WEB_DB_STATEMENT_TIMEOUT_MS')
+    WORKER_DB_STATEMENT_TIMEOUT_MS = os.getenv('WORKER_DB_STATEMENT_TIMEOUT_MS')
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 10))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() in ['true', 'on', '1']
+    DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', 'false').lower() in ['true', 'on', '1']
+    
+    # Read replicas for listing, search and price history reads in the web app
+    # (comma separated). After a wishlist or settings change a visitor reads from
+    # the primary for DB_REPLICA_STICKY_SECONDS so they see their own writes.
+    DATABASE_REPLICA_URLS = os.getenv('DATABASE_REPLICA_URLS', '')
+    DB_REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS', 10))
+    
+    # Accounts allowed to read operational endpoints such as /api/task-runs (comma separated)
+    ADMIN_EMAILS = [email.strip().lower() for email in os.getenv('ADMIN_EMAILS', '').split(',') if email.strip()]
+    
+    # Bearer token Prometheus sends to scrape /metrics; the endpoint is closed without one
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
     
     # Rate limiting
     RATELIMIT_STORAGE_URL = REDIS_URL
@@ -54,13 +90,6 @@ class ProductionConfig(Config):
     SESSION_COOKIE_SECURE = True
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
-    
-    # Database connection pooling
-    SQLALCHEMY_ENGINE_OPTIONS = {
-        'pool_size': 10,
-        'pool_recycle': 120,
-        'pool_pre_ping': True
-    }
 
 class TestingConfig(Config):
     """Testing configuration"""
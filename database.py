@@ -0,0 +1,220 @@
+"""
+Database engine, connection pool and read replica settings per process role
+"""
+
+from flask import current_app, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+import contextvars
+import functools
+import random
+import time
+
+# Connection budget per process. A deployment needs at most
+#   web_processes * (WEB pool + overflow) + worker_processes * (WORKER pool + overflow)
+# connections, which must stay below PostgreSQL's max_connections (or PgBouncer's pool).
+ROLE_DEFAULTS = {
+    'web': {'pool_size': 5, 'max_overflow': 5, 'statement_timeout_ms': 5000},
+    'worker': {'pool_size': 2, 'max_overflow': 2, 'statement_timeout_ms': 120000},
+}
+
+def _setting(config, role, name, default):
+    """Read ROLE_DB_NAME from config, falling back to DB_NAME, then the role default"""
+    for key in (f"{role.upper()}_DB_{name}", f"DB_{name}"):
+        if config.get(key) is not None:
+            return config[key]
+    return default
+
+def _flag(value):
+    return str(value).lower() in ['true', 'on', '1']
+
+def uses_pgbouncer(config, role='web'):
+    """Whether PgBouncer does the pooling for this role"""
+    return _flag(_setting(config, role, 'PGBOUNCER', 'false'))
+
+def engine_options(database_url, config, role='web'):
+    """Build SQLALCHEMY_ENGINE_OPTIONS for a process role ('web' or 'worker')
+    
+    Settings are read from `config`: the app config, or the environment in
+    processes without a Flask app. With DB_PGBOUNCER enabled the app keeps no
+    pool of its own (PgBouncer does the pooling in transaction mode), and the
+    statement timeout is set per transaction instead of as a startup parameter,
+    which PgBouncer rejects.
+    """
+    defaults = ROLE_DEFAULTS.get(role, ROLE_DEFAULTS['web'])
+    backend = make_url(database_url).get_backend_name()
+    
+    if backend == 'sqlite':
+        # SQLite has no server connections to budget; keep driver defaults
+        return {}
+    
+    options = {'pool_pre_ping': _flag(_setting(config, role, 'POOL_PRE_PING', 'true'))}
+    
+    if uses_pgbouncer(config, role):
+        options['poolclass'] = NullPool
+    else:
+        options.update({
+            'pool_size': int(_setting(config, role, 'POOL_SIZE', defaults['pool_size'])),
+            'max_overflow': int(_setting(config, role, 'MAX_OVERFLOW', defaults['max_overflow'])),
+            'pool_recycle': int(_setting(config, role, 'POOL_RECYCLE', 1800)),
+            'pool_timeout': int(_setting(config, role, 'POOL_TIMEOUT', 10)),
+            'pool_use_lifo': True
+        })
+        
+        statement_timeout = int(_setting(config, role, 'STATEMENT_TIMEOUT_MS', defaults['statement_timeout_ms']))
+        if backend == 'postgresql' and statement_timeout:
+            options['connect_args'] = {'options': f"-c statement_timeout={statement_timeout}"}
+    
+    return options
+
+def configure_engine(engine, config, role='web'):
+    """Attach per-transaction settings that can't be passed as engine options"""
+    if engine.dialect.name != 'postgresql' or not uses_pgbouncer(config, role):
+        return
+    
+    defaults = ROLE_DEFAULTS.get(role, ROLE_DEFAULTS['web'])
+    statement_timeout = int(_setting(config, role, 'STATEMENT_TIMEOUT_MS', defaults['statement_timeout_ms']))
+    if not statement_timeout:
+        return
+    
+    @event.listens_for(engine, 'begin')
+    def set_statement_timeout(conn):
+        # SET LOCAL lasts for the transaction, so it is safe under transaction pooling
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {statement_timeout}")
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite'
+}
+
+def async_database_url(database_url):
+    """Swap the sync driver in a database URL for its asyncio counterpart"""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+def create_async_db_engine(database_url, config, role='web'):
+    """Create an asyncio engine with a role's pool settings, for the async API and webhook worker"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+    
+    options = engine_options(database_url, config, role)
+    url = async_database_url(database_url)
+    
+    if url.get_backend_name() == 'postgresql':
+        # asyncpg takes server settings directly rather than a libpq options string
+        connect_args = {}
+        startup_options = options.pop('connect_args', {}).get('options', '')
+        if 'statement_timeout=' in startup_options:
+            connect_args['server_settings'] = {'statement_timeout': startup_options.split('statement_timeout=')[1]}
+        if uses_pgbouncer(config, role):
+            # Prepared statements don't survive PgBouncer transaction pooling
+            connect_args['statement_cache_size'] = 0
+            url = url.update_query_dict({'prepared_statement_cache_size': '0'})
+        options['connect_args'] = connect_args
+    
+    engine = create_async_engine(url, **options)
+    configure_engine(engine.sync_engine, config, role)
+    return engine
+
+# Read replicas are registered as SQLALCHEMY_BINDS under these keys
+REPLICA_BIND_PREFIX = 'replica_'
+
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+def replica_urls(config):
+    """Replica database URLs from DATABASE_REPLICA_URLS (comma separated)"""
+    return [url.strip() for url in (config.get('DATABASE_REPLICA_URLS') or '').split(',') if url.strip()]
+
+def replica_binds(config, role='web'):
+    """SQLALCHEMY_BINDS entries for the configured read replicas"""
+    return {
+        f"{REPLICA_BIND_PREFIX}{index}": dict(engine_options(url, config, role), url=url)
+        for index, url in enumerate(replica_urls(config))
+    }
+
+def replica_read(func):
+    """Run a read-only service method against a read replica when one is configured"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _replica_reads.set(True)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+    return wrapper
+
+def stick_to_primary(seconds=None):
+    """Route this visitor's reads to the primary for a while after they change something
+    
+    Replicas lag the primary slightly, so without this a user could add a game to
+    their wishlist and not see it on the next page load.
+    """
+    if not has_request_context():
+        return
+    if seconds is None:
+        seconds = int(current_app.config.get('DB_REPLICA_STICKY_SECONDS', 10))
+    session['db_primary_until'] = time.time() + seconds
+
+def _stuck_to_primary():
+    return has_request_context() and session.get('db_primary_until', 0) > time.time()
+
+def upsert_insert(db_session, model):
+    """INSERT construct with on_conflict_do_update/do_nothing for the session's database"""
+    dialect = db_session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise ValueError(f"No upsert support for {dialect}")
+    return insert(model)
+
+# Advisory lock key for transactions that log deal changes ('dealchng' in hex)
+DEAL_CHANGES_LOCK_KEY = 0x6465616c63686e67
+
+def lock_deal_changes(db_session):
+    """Make deal change ids commit in id order by serializing the transactions that log them
+    
+    Ids are drawn when a row is flushed, not when it commits, so two overlapping
+    transactions could commit 12 before 11 and a reader would move past 11 for
+    good. Call this first in the transaction, before it takes any row locks, and
+    the lock is held until commit. SQLite already runs one write transaction at
+    a time, so it needs nothing.
+    """
+    if db_session.get_bind().dialect.name == 'postgresql':
+        db_session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': DEAL_CHANGES_LOCK_KEY})
+
+class RoutingSession(Session):
+    """Session that sends replica_read queries to a read replica
+    
+    Everything else, including flushes and any read in a session that has already
+    written, goes to the primary.
+    """
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        
+        if (bind is None and _replica_reads.get() and not self._flushing
+                and not self.info.get('wrote') and engine is self._db.engines.get(None)
+                and not _stuck_to_primary()):
+            replica = self._replica_engine()
+            if replica is not None:
+                return replica
+        
+        return engine
+    
+    def _replica_engine(self):
+        # Stay on one replica for the life of the session so reads are consistent
+        if 'replica' not in self.info:
+            replicas = [engine for key, engine in self._db.engines.items()
+                        if key and key.startswith(REPLICA_BIND_PREFIX)]
+            self.info['replica'] = random.choice(replicas) if replicas else None
+        return self.info['replica']
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_session_wrote(db_session, flush_context):
+    db_session.info['wrote'] = True
@@ -0,0 +1,7 @@
+"""
+Flask extensions shared by the web app and background workers
+"""
+
+from flask_mail import Mail
+
+mail = Mail()
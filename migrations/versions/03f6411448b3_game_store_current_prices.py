@@ -0,0 +1,60 @@
+"""Keep current prices per region in game_stores
+
+Revision ID: 03f6411448b3
+Revises:
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '03f6411448b3'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Databases set up by `flask init-db` after this change already have the new
+# schema, so every step checks what exists first.
+
+def _columns(inspector, table):
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def _indexes(inspector, table):
+    return {index['name']: index['column_names'] for index in inspector.get_indexes(table)}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('game_stores'):
+        return
+
+    columns = _columns(inspector, 'game_stores')
+    if 'is_on_sale' not in columns:
+        op.add_column('game_stores', sa.Column('is_on_sale', sa.Boolean(), nullable=True, server_default=sa.false()))
+    if 'deal_start_date' not in columns:
+        op.add_column('game_stores', sa.Column('deal_start_date', sa.DateTime(), nullable=True))
+    if 'deal_end_date' not in columns:
+        op.add_column('game_stores', sa.Column('deal_end_date', sa.DateTime(), nullable=True))
+
+    # Current prices are kept per region, so the unique key gains the region
+    indexes = _indexes(inspector, 'game_stores')
+    if indexes.get('idx_game_store_unique') == ['game_id', 'store_id']:
+        op.drop_index('idx_game_store_unique', table_name='game_stores')
+        del indexes['idx_game_store_unique']
+    if 'idx_game_store_unique' not in indexes:
+        op.create_index('idx_game_store_unique', 'game_stores', ['game_id', 'store_id', 'region'], unique=True)
+    if 'idx_game_store_region_sale' not in indexes:
+        op.create_index('idx_game_store_region_sale', 'game_stores', ['region', 'is_on_sale', 'discount_percentage'])
+
+
+def downgrade():
+    op.drop_index('idx_game_store_region_sale', table_name='game_stores')
+    op.drop_index('idx_game_store_unique', table_name='game_stores')
+    op.create_index('idx_game_store_unique', 'game_stores', ['game_id', 'store_id'], unique=True)
+    with op.batch_alter_table('game_stores') as batch_op:
+        batch_op.drop_column('deal_end_date')
+        batch_op.drop_column('deal_start_date')
+        batch_op.drop_column('is_on_sale')
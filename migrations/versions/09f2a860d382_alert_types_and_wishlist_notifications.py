@@ -0,0 +1,54 @@
+"""Add discount and historical low alerts and wishlist notification state
+
+Revision ID: 09f2a860d382
+Revises: 21939ed40081
+Create Date: 2026-10-19 09:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '09f2a860d382'
+down_revision = '21939ed40081'
+branch_labels = None
+depends_on = None
+
+
+def _columns(inspector, table):
+    return {column['name']: column for column in inspector.get_columns(table)}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    if inspector.has_table('user_wishlist'):
+        columns = _columns(inspector, 'user_wishlist')
+        if 'notified_at' not in columns:
+            op.add_column('user_wishlist', sa.Column('notified_at', sa.DateTime(), nullable=True))
+        if 'notified_price' not in columns:
+            op.add_column('user_wishlist', sa.Column('notified_price', sa.Float(), nullable=True))
+
+    if inspector.has_table('price_alerts'):
+        columns = _columns(inspector, 'price_alerts')
+        if 'alert_type' not in columns:
+            op.add_column('price_alerts', sa.Column('alert_type', sa.String(length=20), nullable=True))
+            op.execute("UPDATE price_alerts SET alert_type = 'price'")
+        if 'target_discount' not in columns:
+            op.add_column('price_alerts', sa.Column('target_discount', sa.Float(), nullable=True))
+        # Discount alerts have no target price
+        if not columns['target_price']['nullable']:
+            with op.batch_alter_table('price_alerts') as batch_op:
+                batch_op.alter_column('target_price', existing_type=sa.Float(), nullable=True)
+
+
+def downgrade():
+    op.execute("DELETE FROM price_alerts WHERE target_price IS NULL")
+    with op.batch_alter_table('price_alerts') as batch_op:
+        batch_op.alter_column('target_price', existing_type=sa.Float(), nullable=False)
+        batch_op.drop_column('target_discount')
+        batch_op.drop_column('alert_type')
+    with op.batch_alter_table('user_wishlist') as batch_op:
+        batch_op.drop_column('notified_price')
+        batch_op.drop_column('notified_at')
@@ -0,0 +1,32 @@
+"""Record the previous price on deal changes
+
+Revision ID: 21939ed40081
+Revises: b46e337b5783
+Create Date: 2026-10-19 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '21939ed40081'
+down_revision = 'b46e337b5783'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # deal_changes itself is created by `flask init-db`; only tables made before
+    # live events need the column
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('deal_changes'):
+        return
+
+    if 'previous_price' not in {column['name'] for column in inspector.get_columns('deal_changes')}:
+        op.add_column('deal_changes', sa.Column('previous_price', sa.Float(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('deal_changes') as batch_op:
+        batch_op.drop_column('previous_price')
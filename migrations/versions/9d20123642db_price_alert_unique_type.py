@@ -0,0 +1,42 @@
+"""One price alert of each type per user and game
+
+Revision ID: 9d20123642db
+Revises: 09f2a860d382
+Create Date: 2026-10-19 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d20123642db'
+down_revision = '09f2a860d382'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('price_alerts'):
+        return
+
+    indexes = {index['name'] for index in inspector.get_indexes('price_alerts')}
+    if 'idx_price_alert_user_game_type' in indexes:
+        return
+
+    # Saving alerts upserts on this index, so earlier duplicates keep only the newest alert
+    op.execute("UPDATE price_alerts SET alert_type = 'price' WHERE alert_type IS NULL")
+    op.execute(
+        "DELETE FROM price_alerts WHERE id NOT IN ("
+        "SELECT MAX(id) FROM price_alerts GROUP BY user_id, game_id, alert_type)"
+    )
+    with op.batch_alter_table('price_alerts') as batch_op:
+        batch_op.alter_column('alert_type', existing_type=sa.String(length=20), nullable=False)
+        batch_op.create_index('idx_price_alert_user_game_type', ['user_id', 'game_id', 'alert_type'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('price_alerts') as batch_op:
+        batch_op.drop_index('idx_price_alert_user_game_type')
+        batch_op.alter_column('alert_type', existing_type=sa.String(length=20), nullable=True)
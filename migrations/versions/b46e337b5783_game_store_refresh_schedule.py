@@ -0,0 +1,41 @@
+"""Add refresh scheduling columns to game_stores
+
+Revision ID: b46e337b5783
+Revises: 03f6411448b3
+Create Date: 2026-10-19 09:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b46e337b5783'
+down_revision = '03f6411448b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('game_stores'):
+        return
+
+    columns = {column['name'] for column in inspector.get_columns('game_stores')}
+    if 'price_volatility' not in columns:
+        op.add_column('game_stores', sa.Column('price_volatility', sa.Float(), nullable=True, server_default='0'))
+    if 'refresh_priority' not in columns:
+        op.add_column('game_stores', sa.Column('refresh_priority', sa.Float(), nullable=True, server_default='0'))
+    if 'next_price_check' not in columns:
+        op.add_column('game_stores', sa.Column('next_price_check', sa.DateTime(), nullable=True))
+
+    if 'ix_game_stores_next_price_check' not in {index['name'] for index in inspector.get_indexes('game_stores')}:
+        op.create_index('ix_game_stores_next_price_check', 'game_stores', ['next_price_check'])
+
+
+def downgrade():
+    op.drop_index('ix_game_stores_next_price_check', table_name='game_stores')
+    with op.batch_alter_table('game_stores') as batch_op:
+        batch_op.drop_column('next_price_check')
+        batch_op.drop_column('refresh_priority')
+        batch_op.drop_column('price_volatility')
@@ -6,8 +6,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
 from sqlalchemy import Index
+from database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     """User model"""
@@ -141,6 +142,16 @@ class GameStore(db.Model):
     currency = db.Column(db.String(3), default='USD')
     region = db.Column(db.String(2), default='US')
     
+    # Current sale window
+    is_on_sale = db.Column(db.Boolean, default=False)
+    deal_start_date = db.Column(db.DateTime, nullable=True)
+    deal_end_date = db.Column(db.DateTime, nullable=True)
+    
+    # Refresh scheduling
+    price_volatility = db.Column(db.Float, default=0)  # Decayed count of recent price changes
+    refresh_priority = db.Column(db.Float, default=0)
+    next_price_check = db.Column(db.DateTime, nullable=True, index=True)
+    
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -152,10 +163,32 @@ class GameStore(db.Model):
     
     # Indexes
     __table_args__ = (
-        Index('idx_game_store_unique', 'game_id', 'store_id', unique=True),
+        Index('idx_game_store_unique', 'game_id', 'store_id', 'region', unique=True),
         Index('idx_game_store_price', 'current_price'),
         Index('idx_game_store_discount', 'discount_percentage'),
+        Index('idx_game_store_region_sale', 'region', 'is_on_sale', 'discount_percentage'),
     )
+    
+    # Deal-compatible accessors so listings can render GameStore rows
+    @property
+    def title(self):
+        return self.game.title if self.game else ''
+    
+    @property
+    def sale_price(self):
+        return self.current_price or 0
+    
+    @property
+    def normal_price(self):
+        return self.original_price or 0
+    
+    @property
+    def savings_percentage(self):
+        return self.discount_percentage or 0
+    
+    @property
+    def deal_url(self):
+        return self.store_url
 
 class Deal(db.Model):
     """Price deals and historical data"""
@@ -201,6 +234,82 @@ class Deal(db.Model):
         Index('idx_deal_created', 'created_at'),
     )
 
+class DealChange(db.Model):
+    """Change log of current deals; the id doubles as the deals version clients sync from"""
+    __tablename__ = 'deal_changes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    game_store_id = db.Column(db.Integer, db.ForeignKey('game_stores.id'), nullable=False)
+    region = db.Column(db.String(2), nullable=False)
+    change_type = db.Column(db.String(10), nullable=False)  # added, changed, ended
+    
+    # Prices after the change
+    sale_price = db.Column(db.Float, nullable=True)
+    normal_price = db.Column(db.Float, nullable=True)
+    savings_percentage = db.Column(db.Float, nullable=True)
+    previous_price = db.Column(db.Float, nullable=True)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    game_store = db.relationship('GameStore')
+    
+    # Indexes
+    __table_args__ = (
+        Index('idx_deal_change_region', 'region', 'id'),
+        Index('idx_deal_change_created', 'created_at'),
+    )
+
+class OutboxEvent(db.Model):
+    """Price change events written with the deal writes and relayed to a Redis stream"""
+    __tablename__ = 'outbox_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)  # deal_created, price_dropped, deal_ended
+    game_store_id = db.Column(db.Integer, db.ForeignKey('game_stores.id'), nullable=False)
+    region = db.Column(db.String(2), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON string
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    published_at = db.Column(db.DateTime, nullable=True)
+    
+    # Relationships
+    game_store = db.relationship('GameStore')
+    
+    # Indexes
+    __table_args__ = (
+        Index('idx_outbox_unpublished', 'published_at', 'id'),
+    )
+
+class WebhookSubscription(db.Model):
+    """Partner endpoint that receives matching price change events"""
+    __tablename__ = 'webhook_subscriptions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    url = db.Column(db.String(500), nullable=False)
+    secret = db.Column(db.String(100), nullable=False)  # HMAC signing key
+    
+    # Filters; None matches everything
+    event_types = db.Column(db.String(100), default='price_dropped')  # Comma separated
+    store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=True)
+    region = db.Column(db.String(2), nullable=True)
+    min_discount = db.Column(db.Float, nullable=True)  # Percentage
+    
+    # Delivery status
+    is_active = db.Column(db.Boolean, default=True)
+    consecutive_failures = db.Column(db.Integer, default=0)
+    last_delivered_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    store = db.relationship('Store')
+
 class UserWishlist(db.Model):
     """User wishlist items"""
     __tablename__ = 'user_wishlist'
@@ -217,6 +326,8 @@ class UserWishlist(db.Model):
     # Price tracking
     target_price = db.Column(db.Float, nullable=True)
     target_discount = db.Column(db.Float, nullable=True)  # Percentage
+    notified_at = db.Column(db.DateTime, nullable=True)
+    notified_price = db.Column(db.Float, nullable=True)  # Only a lower price notifies again
     
     # Relationships
     user = db.relationship('User', back_populates='wishlist_items')
@@ -227,6 +338,37 @@ class UserWishlist(db.Model):
         Index('idx_user_game_wishlist', 'user_id', 'game_id', unique=True),
     )
 
+class WishlistImport(db.Model):
+    """A Steam wishlist or library import and its progress"""
+    __tablename__ = 'wishlist_imports'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    source = db.Column(db.String(20), nullable=False)  # file, wishlist, library
+    steam_id = db.Column(db.String(20), nullable=True)
+    task_id = db.Column(db.String(255), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, completed, failed
+    
+    # Progress
+    total_count = db.Column(db.Integer, default=0)
+    processed_count = db.Column(db.Integer, default=0)
+    created_games = db.Column(db.Integer, default=0)
+    added_count = db.Column(db.Integer, default=0)  # New wishlist rows; the rest were already listed
+    error = db.Column(db.Text, nullable=True)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    # Relationships
+    user = db.relationship('User')
+    
+    # Indexes
+    __table_args__ = (
+        Index('idx_wishlist_import_user_created', 'user_id', 'created_at'),
+    )
+
 class PriceAlert(db.Model):
     """Price alerts for games"""
     __tablename__ = 'price_alerts'
@@ -236,7 +378,9 @@ class PriceAlert(db.Model):
     game_id = db.Column(db.Integer, db.ForeignKey('games.id'), nullable=False)
     
     # Alert configuration
-    target_price = db.Column(db.Float, nullable=False)
+    alert_type = db.Column(db.String(20), nullable=False, default='price')  # price, discount, historical_low
+    target_price = db.Column(db.Float, nullable=True)  # Lowest known price for historical_low
+    target_discount = db.Column(db.Float, nullable=True)  # Percentage, for discount alerts
     currency = db.Column(db.String(3), default='USD')
     region = db.Column(db.String(2), default='US')
     
@@ -257,4 +401,39 @@ class PriceAlert(db.Model):
     
     # Relationships
     user = db.relationship('User', back_populates='price_alerts')
-    game = db.relationship('Game', back_populates='price_alerts')
\ No newline at end of file
+    game = db.relationship('Game', back_populates='price_alerts')
+    
+    # One alert of each type per game, so saving alerts can upsert on it
+    __table_args__ = (
+        Index('idx_price_alert_user_game_type', 'user_id', 'game_id', 'alert_type', unique=True),
+    )
+
+class TaskRun(db.Model):
+    """Telemetry for a single background task run"""
+    __tablename__ = 'task_runs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    task_name = db.Column(db.String(255), nullable=False)
+    task_id = db.Column(db.String(255), nullable=True)
+    release = db.Column(db.String(100), nullable=True)
+    status = db.Column(db.String(20), nullable=False)
+    
+    # Timing
+    started_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    duration_seconds = db.Column(db.Float, nullable=True)
+    queue_lag_seconds = db.Column(db.Float, nullable=True)
+    
+    # Throughput
+    records_fetched = db.Column(db.Integer, default=0)
+    rows_changed = db.Column(db.Integer, default=0)
+    
+    # Full breakdown: counters, HTTP latency histograms, DB timings
+    metrics = db.Column(db.Text, nullable=True)  # JSON string
+    error = db.Column(db.Text, nullable=True)
+    
+    # Indexes
+    __table_args__ = (
+        Index('idx_task_run_name_started', 'task_name', 'started_at'),
+        Index('idx_task_run_release', 'release'),
+    )
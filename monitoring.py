@@ -0,0 +1,486 @@
+"""
+Request profiling, task telemetry and Prometheus-format metrics for Game Price Tracker
+"""
+
+from flask import current_app, g, has_request_context, request, Response, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from contextlib import contextmanager
+from datetime import datetime
+import contextvars
+import cProfile
+import hmac
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class _Metric:
+    """Base class for a labelled metric family"""
+    
+    metric_type = None
+    
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+    
+    def _format_labels(self, key, extra=None):
+        pairs = list(zip(self.labelnames, key)) + list(extra or [])
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            lines.extend(self._render_samples())
+        return lines
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+    
+    metric_type = 'counter'
+    
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def _render_samples(self):
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in self._values.items()]
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    
+    metric_type = 'gauge'
+    
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+    
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+    
+    def _render_samples(self):
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in self._values.items()]
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed buckets"""
+    
+    metric_type = 'histogram'
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+    
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][index] += 1
+            state['sum'] += value
+            state['count'] += 1
+    
+    def _render_samples(self):
+        lines = []
+        for key, state in self._values.items():
+            for bound, count in zip(self.buckets, state['buckets']):
+                lines.append(f"{self.name}_bucket{self._format_labels(key, [('le', str(bound))])} {count}")
+            lines.append(f"{self.name}_bucket{self._format_labels(key, [('le', '+Inf')])} {state['count']}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {state['sum']}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {state['count']}")
+        return lines
+
+class MetricsRegistry:
+    """Process-local metric registry rendered in the Prometheus text format
+    
+    Each gunicorn or Celery worker process keeps its own values, so scrape
+    every process (or aggregate by instance label) rather than a single one.
+    """
+    
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+    
+    def _get_or_create(self, cls, name, documentation, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, **kwargs)
+            return metric
+    
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames=labelnames)
+    
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames=labelnames)
+    
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames=labelnames, buckets=buckets)
+    
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+REQUEST_DURATION = registry.histogram(
+    'http_request_duration_seconds', 'Total request handling time',
+    labelnames=('endpoint', 'method', 'status'))
+REQUEST_SQL_DURATION = registry.histogram(
+    'http_request_sql_seconds', 'Time spent executing SQL per request',
+    labelnames=('endpoint',))
+REQUEST_SQL_QUERIES = registry.histogram(
+    'http_request_sql_queries', 'SQL statements executed per request',
+    labelnames=('endpoint',), buckets=COUNT_BUCKETS)
+REQUEST_TEMPLATE_DURATION = registry.histogram(
+    'http_request_template_seconds', 'Time spent rendering templates per request',
+    labelnames=('endpoint',))
+REQUEST_EXTERNAL_DURATION = registry.histogram(
+    'http_request_external_seconds', 'Time spent in external API calls per request',
+    labelnames=('endpoint',))
+EXTERNAL_CALL_DURATION = registry.histogram(
+    'external_api_request_duration_seconds', 'Latency of external store API calls',
+    labelnames=('api', 'outcome'))
+SLOW_REQUESTS = registry.counter(
+    'http_slow_requests_total', 'Requests slower than the profiling threshold',
+    labelnames=('endpoint',))
+
+DB_POOL_CAPACITY = registry.gauge(
+    'db_pool_capacity_connections', 'Configured pool size plus overflow per engine',
+    labelnames=('role', 'database'))
+DB_POOL_CHECKED_OUT = registry.gauge(
+    'db_pool_checked_out_connections', 'Connections currently checked out of the pool',
+    labelnames=('role', 'database'))
+DB_POOL_CONNECTIONS = registry.counter(
+    'db_pool_connections_opened_total', 'New database connections opened by the pool',
+    labelnames=('role', 'database'))
+DB_POOL_CHECKOUTS = registry.counter(
+    'db_pool_checkouts_total', 'Connection checkouts from the pool',
+    labelnames=('role', 'database'))
+
+def instrument_pool(engine, role, database=None):
+    """Track pool utilisation for an engine under the given process role"""
+    database = database or engine.url.database or ''
+    pool = engine.pool
+    
+    if hasattr(pool, 'size'):
+        DB_POOL_CAPACITY.set(pool.size() + max(getattr(pool, '_max_overflow', 0), 0), role=role, database=database)
+    
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        DB_POOL_CONNECTIONS.inc(role=role, database=database)
+    
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKOUTS.inc(role=role, database=database)
+        DB_POOL_CHECKED_OUT.inc(role=role, database=database)
+    
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        DB_POOL_CHECKED_OUT.dec(role=role, database=database)
+
+_current_task_run = contextvars.ContextVar('current_task_run', default=None)
+
+class TaskTelemetry:
+    """Collects structured metrics for one background task run
+    
+    While active, external API calls and SQL statements executed by the task are
+    recorded automatically; services add domain counters through record().
+    """
+    
+    WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+    
+    def __init__(self, task_name, task_id=None, queue_lag=None):
+        self.task_name = task_name
+        self.task_id = task_id
+        self.queue_lag = queue_lag
+        self.release = os.getenv('APP_RELEASE', 'dev')
+        self.started_at = datetime.utcnow()
+        self.finished_at = None
+        self.duration = None
+        self.status = 'running'
+        self.error = None
+        self.counters = {}
+        self.http = {}
+        self.db = {'statements': 0, 'read_seconds': 0.0, 'write_seconds': 0.0, 'rows_changed': 0}
+        self._start = time.perf_counter()
+        self._token = None
+    
+    def activate(self):
+        self._token = _current_task_run.set(self)
+    
+    def deactivate(self):
+        if self._token is not None:
+            _current_task_run.reset(self._token)
+            self._token = None
+    
+    def incr(self, name, amount=1, **labels):
+        label_key = ','.join(f"{key}={value}" for key, value in sorted(labels.items()))
+        values = self.counters.setdefault(name, {})
+        values[label_key] = values.get(label_key, 0) + amount
+    
+    def total(self, name):
+        return sum(self.counters.get(name, {}).values())
+    
+    def observe_http(self, api, seconds, ok=True):
+        stats = self.http.get(api)
+        if stats is None:
+            stats = self.http[api] = {
+                'count': 0, 'errors': 0, 'sum': 0.0, 'max': 0.0,
+                'buckets': {str(bound): 0 for bound in DEFAULT_BUCKETS}
+            }
+        stats['count'] += 1
+        stats['errors'] += 0 if ok else 1
+        stats['sum'] += seconds
+        stats['max'] = max(stats['max'], seconds)
+        for bound in DEFAULT_BUCKETS:
+            if seconds <= bound:
+                stats['buckets'][str(bound)] += 1
+    
+    def observe_sql(self, statement, seconds, rowcount):
+        self.db['statements'] += 1
+        if statement.lstrip()[:6].upper() in self.WRITE_STATEMENTS:
+            self.db['write_seconds'] += seconds
+            self.db['rows_changed'] += max(rowcount or 0, 0)
+        else:
+            self.db['read_seconds'] += seconds
+    
+    def finish(self, status, error=None):
+        self.finished_at = datetime.utcnow()
+        self.duration = time.perf_counter() - self._start
+        self.status = status
+        self.error = error
+    
+    def summary(self):
+        """Get the run as a flat, JSON-serialisable dict for logs and storage"""
+        records_fetched = self.total('records_fetched')
+        return {
+            'task_name': self.task_name,
+            'task_id': self.task_id,
+            'release': self.release,
+            'status': self.status,
+            'duration_seconds': self.duration,
+            'queue_lag_seconds': self.queue_lag,
+            'records_fetched': records_fetched,
+            'records_per_second': records_fetched / self.duration if self.duration else None,
+            'rows_changed': self.db['rows_changed'],
+            'counters': self.counters,
+            'http': self.http,
+            'db': self.db,
+            'error': self.error
+        }
+
+def record(name, amount=1, **labels):
+    """Add to a counter on the active task run; a no-op outside of tasks"""
+    task_run = _current_task_run.get()
+    if task_run is not None:
+        task_run.incr(name, amount, **labels)
+
+def _current_profile():
+    """Get the profile of the request being handled, if any"""
+    if has_request_context():
+        return g.get('_profile')
+    return None
+
+@contextmanager
+def track_external(api):
+    """Time an external API call for the current request and the latency histogram"""
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        elapsed = time.perf_counter() - start
+        EXTERNAL_CALL_DURATION.observe(elapsed, api=api, outcome=outcome)
+        
+        profile = _current_profile()
+        if profile is not None:
+            profile['external_time'] += elapsed
+            profile['external_count'] += 1
+        
+        task_run = _current_task_run.get()
+        if task_run is not None:
+            task_run.observe_http(api, elapsed, ok=outcome == 'ok')
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('_query_start')
+    if not starts:
+        return
+    
+    elapsed = time.perf_counter() - starts.pop()
+    profile = _current_profile()
+    if profile is not None:
+        profile['sql_time'] += elapsed
+        profile['sql_count'] += 1
+    
+    task_run = _current_task_run.get()
+    if task_run is not None:
+        task_run.observe_sql(statement, elapsed, cursor.rowcount)
+
+class RequestProfiler:
+    """Records per-request timing split into SQL, templates and external calls
+    
+    Exposes the results at /metrics, to scrapers presenting METRICS_TOKEN as a
+    bearer token, and adds a Server-Timing header. A sampled
+    fraction of requests runs under cProfile (or pyinstrument when installed and
+    selected), and profiles of requests slower than the threshold are written
+    to PROFILE_DIR.
+    """
+    
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.sample_rate = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+        self.slow_request_seconds = float(os.getenv('PROFILE_SLOW_REQUEST_MS', 500)) / 1000
+        self.query_warn_threshold = int(os.getenv('PROFILE_QUERY_WARN_THRESHOLD', 30))
+        self.profile_dir = os.getenv('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+        self.profiler_name = os.getenv('PROFILER', 'cprofile')
+        
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        before_render_template.connect(self._template_start, app)
+        template_rendered.connect(self._template_end, app)
+        
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+    
+    def metrics_view(self):
+        # Closed until a token is configured; the telemetry is as sensitive as /api/task-runs
+        token = current_app.config.get('METRICS_TOKEN')
+        if not token or not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+            return Response('Forbidden\n', status=403, mimetype='text/plain')
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+    
+    def _start(self):
+        g._profile = {
+            'start': time.perf_counter(),
+            'sql_time': 0.0,
+            'sql_count': 0,
+            'template_time': 0.0,
+            'template_start': None,
+            'external_time': 0.0,
+            'external_count': 0,
+            'profiler': self._start_sampled_profiler()
+        }
+    
+    def _finish(self, response):
+        profile = g.pop('_profile', None)
+        if profile is None:
+            return response
+        
+        total = time.perf_counter() - profile['start']
+        endpoint = request.endpoint or 'unknown'
+        
+        REQUEST_DURATION.observe(total, endpoint=endpoint, method=request.method, status=response.status_code)
+        REQUEST_SQL_DURATION.observe(profile['sql_time'], endpoint=endpoint)
+        REQUEST_SQL_QUERIES.observe(profile['sql_count'], endpoint=endpoint)
+        REQUEST_TEMPLATE_DURATION.observe(profile['template_time'], endpoint=endpoint)
+        REQUEST_EXTERNAL_DURATION.observe(profile['external_time'], endpoint=endpoint)
+        
+        response.headers['Server-Timing'] = ', '.join([
+            f"sql;dur={profile['sql_time'] * 1000:.1f};desc=\"{profile['sql_count']} queries\"",
+            f"template;dur={profile['template_time'] * 1000:.1f}",
+            f"external;dur={profile['external_time'] * 1000:.1f}",
+            f"total;dur={total * 1000:.1f}"
+        ])
+        
+        if profile['sql_count'] > self.query_warn_threshold:
+            logger.warning(f"Possible N+1 on {request.method} {request.path}: "
+                           f"{profile['sql_count']} queries in {profile['sql_time'] * 1000:.0f}ms")
+        
+        if total > self.slow_request_seconds:
+            SLOW_REQUESTS.inc(endpoint=endpoint)
+        
+        self._stop_sampled_profiler(profile['profiler'], endpoint, total)
+        
+        return response
+    
+    def _template_start(self, sender, template, context, **extra):
+        profile = _current_profile()
+        if profile is not None:
+            profile['template_start'] = time.perf_counter()
+    
+    def _template_end(self, sender, template, context, **extra):
+        profile = _current_profile()
+        if profile is not None and profile['template_start'] is not None:
+            profile['template_time'] += time.perf_counter() - profile['template_start']
+            profile['template_start'] = None
+    
+    def _start_sampled_profiler(self):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        
+        if self.profiler_name == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+                profiler = Profiler()
+                profiler.start()
+                return profiler
+            except ImportError:
+                logger.warning("pyinstrument is not installed, falling back to cProfile")
+                self.profiler_name = 'cprofile'
+        
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    
+    def _stop_sampled_profiler(self, profiler, endpoint, total):
+        if profiler is None:
+            return
+        
+        try:
+            if isinstance(profiler, cProfile.Profile):
+                profiler.disable()
+            else:
+                profiler.stop()
+            
+            if total <= self.slow_request_seconds:
+                return
+            
+            os.makedirs(self.profile_dir, exist_ok=True)
+            stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+            filename = os.path.join(self.profile_dir, f"{endpoint}-{stamp}-{int(total * 1000)}ms")
+            
+            if isinstance(profiler, cProfile.Profile):
+                profiler.dump_stats(f"{filename}.prof")
+            else:
+                with open(f"{filename}.html", 'w') as handle:
+                    handle.write(profiler.output_html())
+        except Exception as e:
+            logger.error(f"Error writing request profile: {str(e)}")
@@ -2,11 +2,13 @@
 Production WSGI entry point for Game Price Tracker
 """
 
-from app import app
+from app import create_app
 from models import db
 
+app = create_app()
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
     
-    app.run(host='0.0.0.0', port=8000, debug=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=8000, debug=False)
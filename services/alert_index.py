@@ -0,0 +1,266 @@
+"""
+Sorted price alert thresholds in Redis for triggering alerts by range query
+"""
+
+from sqlalchemy import event, inspect
+from models import PriceAlert, UserWishlist
+from services.redis_client import get_redis
+import logging
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'alerts:index:'
+BUILT_KEY = 'alerts:built'
+DIRTY_KEY = 'alerts:dirty'
+CHECKPOINT_KEY = 'alerts:checkpoint'
+LOCK_KEY = 'alerts:lock'
+
+# Longest a rebuild or check may hold the lock before it expires
+LOCK_SECONDS = 900
+
+# The offer each kind of rule is compared with, and the score range that fires it.
+# Wishlist rules are kept per game, since their region comes from the owner's settings.
+RULE_KINDS = {
+    'price': ('cheapest', lambda price: (price, '+inf')),
+    'low': ('cheapest', lambda price: (f"({price}", '+inf')),
+    'discount': ('deepest', lambda discount: ('-inf', discount)),
+    'wishlist_price': ('cheapest', lambda price: (price, '+inf')),
+    'wishlist_discount': ('deepest', lambda discount: ('-inf', discount))
+}
+ALERT_KINDS = ('price', 'low', 'discount')
+WISHLIST_KINDS = ('wishlist_price', 'wishlist_discount')
+
+# Updates that touch none of these leave the indexed rules as they were
+RULE_COLUMNS = {
+    PriceAlert: ('game_id', 'region', 'alert_type', 'target_price', 'target_discount', 'is_active', 'is_triggered'),
+    UserWishlist: ('game_id', 'target_price', 'target_discount')
+}
+
+def alert_rules(alert):
+    """(kind, score) index entries for an armed PriceAlert"""
+    if not alert.is_active or alert.is_triggered:
+        return []
+    
+    alert_type = alert.alert_type or 'price'
+    if alert_type == 'discount':
+        return [('discount', alert.target_discount)] if alert.target_discount is not None else []
+    if alert_type == 'historical_low':
+        # Armed with the lowest price known when it was set; any lower price is a new low
+        return [('low', alert.target_price if alert.target_price is not None else float('inf'))]
+    return [('price', alert.target_price)] if alert.target_price is not None else []
+
+def wishlist_rules(item):
+    """(kind, score) index entries for a wishlist item's targets"""
+    rules = []
+    if item.target_price is not None:
+        rules.append(('wishlist_price', item.target_price))
+    if item.target_discount is not None:
+        rules.append(('wishlist_discount', item.target_discount))
+    return rules
+
+class AlertThresholdIndex:
+    """Armed alert rules per (game, region), scored by their threshold
+    
+    A best price of p fires exactly the price alerts scored p or higher, so
+    finding them is one ZRANGEBYSCORE; discount, historical low and wishlist
+    target rules work the same way over their own sets. Games whose rules change
+    are marked dirty, so a new alert whose target is already met fires on the
+    next check without a price change.
+    """
+    
+    def __init__(self, redis_client=None):
+        self.redis = redis_client or get_redis()
+    
+    @staticmethod
+    def key(kind, game_id, region=None):
+        if kind in WISHLIST_KINDS:
+            return f"{KEY_PREFIX}{kind}:{game_id}"
+        return f"{KEY_PREFIX}{kind}:{region}:{game_id}"
+    
+    def is_built(self):
+        return bool(self.redis.exists(BUILT_KEY))
+    
+    def lock(self, blocking_timeout=None):
+        """Lock held by rebuilds and alert checks, so a check never reads a half-built index"""
+        return self.redis.lock(LOCK_KEY, timeout=LOCK_SECONDS, blocking_timeout=blocking_timeout)
+    
+    def rebuild(self, batch_size=5000, blocking_timeout=300):
+        """Reload the index from the database under the lock; returns the number of rules indexed"""
+        with self.lock(blocking_timeout):
+            return self.rebuild_locked(batch_size)
+    
+    def rebuild_locked(self, batch_size=5000):
+        """Reload the index from the database; the caller holds the lock
+        
+        Keys are cleared before the rules are read, so entries that commit hooks
+        add for rows committed meanwhile are kept. The checkpoint is cleared so the
+        next check looks at every armed rule, including any the index had lost.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for key in self.redis.scan_iter(match=f"{KEY_PREFIX}*", count=1000):
+            pipe.delete(key)
+        pipe.execute()
+        
+        alerts = PriceAlert.query.filter(
+            PriceAlert.is_active == True,
+            PriceAlert.is_triggered == False
+        ).yield_per(batch_size)
+        items = UserWishlist.query.filter(
+            (UserWishlist.target_price.isnot(None)) | (UserWishlist.target_discount.isnot(None))
+        ).yield_per(batch_size)
+        
+        indexed_count = 0
+        for rows, rules_for in ((alerts, alert_rules), (items, wishlist_rules)):
+            for row in rows:
+                for kind, score in rules_for(row):
+                    pipe.zadd(self.key(kind, row.game_id, getattr(row, 'region', None)), {row.id: score})
+                    indexed_count += 1
+                    if indexed_count % batch_size == 0:
+                        pipe.execute()
+        
+        pipe.set(BUILT_KEY, indexed_count)
+        pipe.delete(CHECKPOINT_KEY)
+        pipe.execute()
+        
+        logger.info(f"Rebuilt alert threshold index with {indexed_count} rules")
+        return indexed_count
+    
+    def apply(self, added, removed):
+        """Index (kind, id, game_id, region, score) entries and drop (kind, id, game_id, region) ones"""
+        pipe = self.redis.pipeline(transaction=False)
+        for kind, member_id, game_id, region in removed:
+            pipe.zrem(self.key(kind, game_id, region), member_id)
+        for kind, member_id, game_id, region, score in added:
+            pipe.zadd(self.key(kind, game_id, region), {member_id: score})
+            pipe.sadd(DIRTY_KEY, f"{game_id}:{region or ''}")
+        pipe.execute()
+    
+    def matching(self, offers, chunk_size=500):
+        """Ids fired per kind and (game_id, region), given each pair's best offer values
+        
+        `offers` maps (game_id, region) to {'cheapest': price, 'deepest': discount}.
+        """
+        game_keys = list(offers)
+        matches = {kind: {} for kind in RULE_KINDS}
+        for start in range(0, len(game_keys), chunk_size):
+            queries = []
+            pipe = self.redis.pipeline(transaction=False)
+            for game_id, region in game_keys[start:start + chunk_size]:
+                for kind, (offer, score_range) in RULE_KINDS.items():
+                    value = offers[(game_id, region)].get(offer)
+                    if value is not None:
+                        pipe.zrangebyscore(self.key(kind, game_id, region), *score_range(value))
+                        queries.append((kind, (game_id, region)))
+            
+            for (kind, game_key), member_ids in zip(queries, pipe.execute()):
+                if member_ids:
+                    matches[kind][game_key] = [int(member_id) for member_id in member_ids]
+        return matches
+    
+    def pop_dirty(self, count=10000):
+        """Take the (game_id, region) pairs whose rules changed; region None means every region"""
+        members = self.redis.spop(DIRTY_KEY, count) or []
+        dirty = set()
+        for member in members:
+            game_id, region = member.split(':', 1)
+            dirty.add((int(game_id), region or None))
+        return dirty
+    
+    def mark_dirty(self, game_keys):
+        if game_keys:
+            self.redis.sadd(DIRTY_KEY, *(f"{game_id}:{region or ''}" for game_id, region in game_keys))
+    
+    def checkpoint(self):
+        """Last deal change id whose prices have been checked, or None before the first check"""
+        value = self.redis.get(CHECKPOINT_KEY)
+        return int(value) if value is not None else None
+    
+    def set_checkpoint(self, change_id):
+        self.redis.set(CHECKPOINT_KEY, change_id)
+
+def sync_alert_rows(upserted=(), deleted=()):
+    """Index alerts written with bulk statements, which the session listeners don't see
+    
+    Rows need id, game_id, region, alert_type, target_price, target_discount,
+    is_active and is_triggered. An upsert that moved an alert to another region
+    leaves a stale entry under the old one, which the check ignores.
+    """
+    removed = [(kind, row.id, row.game_id, row.region) for row in (*upserted, *deleted) for kind in ALERT_KINDS]
+    added = [(kind, row.id, row.game_id, row.region, score) for row in upserted for kind, score in alert_rules(row)]
+    if not removed:
+        return
+    
+    try:
+        AlertThresholdIndex().apply(added, removed)
+    except Exception as e:
+        logger.warning(f"Error updating alert threshold index: {str(e)}")
+
+def sync_wishlist_rows(upserted=(), deleted=()):
+    """Index wishlist targets written with bulk statements; rows need id, game_id, target_price and target_discount"""
+    removed = [(kind, row.id, row.game_id, None) for row in (*upserted, *deleted) for kind in WISHLIST_KINDS]
+    added = [(kind, row.id, row.game_id, None, score) for row in upserted for kind, score in wishlist_rules(row)]
+    if not removed:
+        return
+    
+    try:
+        AlertThresholdIndex().apply(added, removed)
+    except Exception as e:
+        logger.warning(f"Error updating alert threshold index: {str(e)}")
+
+def _rule_entries(instance):
+    if isinstance(instance, PriceAlert):
+        return ALERT_KINDS, instance.region, alert_rules(instance)
+    return WISHLIST_KINDS, None, wishlist_rules(instance)
+
+def _collect_rule_changes(session, flush_context):
+    # Ids are assigned and attribute history is still available after the flush
+    added = session.info.setdefault('alert_index_added', [])
+    removed = session.info.setdefault('alert_index_removed', [])
+    
+    for pending, is_new in ((session.new, True), (session.dirty, False), (session.deleted, False)):
+        for instance in pending:
+            columns = RULE_COLUMNS.get(type(instance))
+            if columns is None:
+                continue
+            
+            kinds, region, rules = _rule_entries(instance)
+            if not is_new:
+                state = inspect(instance)
+                if instance in session.dirty and not any(state.attrs[column].history.has_changes() for column in columns):
+                    continue
+                
+                # Drop every rule under the old game and region; live ones are re-added below
+                game_id = (state.attrs.game_id.history.deleted or [instance.game_id])[0]
+                if region is not None:
+                    region = (state.attrs.region.history.deleted or [region])[0]
+                removed.extend((kind, instance.id, game_id, region) for kind in kinds)
+            
+            if instance not in session.deleted:
+                added.extend((kind, instance.id, instance.game_id, getattr(instance, 'region', None), score)
+                             for kind, score in rules)
+
+def _publish_rule_changes(session):
+    added = session.info.pop('alert_index_added', None)
+    removed = session.info.pop('alert_index_removed', None)
+    if not added and not removed:
+        return
+    
+    try:
+        AlertThresholdIndex().apply(added or [], removed or [])
+    except Exception as e:
+        # Extra entries are re-checked against the database before an alert fires,
+        # and missing ones come back with the daily rebuild
+        logger.warning(f"Error updating alert threshold index: {str(e)}")
+
+def _discard_rule_changes(session):
+    session.info.pop('alert_index_added', None)
+    session.info.pop('alert_index_removed', None)
+
+def track_alert_thresholds(session_class):
+    """Keep the alert threshold index in step with committed alert and wishlist target changes"""
+    if event.contains(session_class, 'after_flush', _collect_rule_changes):
+        return
+    
+    event.listen(session_class, 'after_flush', _collect_rule_changes)
+    event.listen(session_class, 'after_commit', _publish_rule_changes)
+    event.listen(session_class, 'after_rollback', _discard_rule_changes)
@@ -0,0 +1,99 @@
+"""
+Catalogue version counters for validating cached listing responses
+"""
+
+from sqlalchemy import event, inspect
+from models import Deal, Game, GameStore, Store
+from services.redis_client import get_redis, get_async_redis
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'catalog:version'
+
+# Columns that show up in listings; scheduling and bookkeeping updates don't count
+LISTED_COLUMNS = {
+    GameStore: ('current_price', 'original_price', 'discount_percentage', 'currency', 'is_on_sale',
+                'is_available', 'deal_start_date', 'deal_end_date', 'store_url'),
+    Deal: ('title', 'deal_url', 'sale_price', 'normal_price', 'savings_percentage', 'is_on_sale',
+           'deal_start_date', 'deal_end_date'),
+    Game: ('title', 'slug', 'developer', 'genres', 'cover_image_url', 'metacritic_score'),
+    Store: ('name', 'slug', 'is_active')
+}
+
+def _regional_key(region):
+    return f"{VERSION_KEY}:{region}"
+
+def get_version(region='US', redis_client=None):
+    """Current catalogue version for a region, or None if Redis is unavailable"""
+    try:
+        redis_client = redis_client or get_redis()
+        catalog, regional = redis_client.mget(VERSION_KEY, _regional_key(region))
+        return f"{catalog or 0}.{regional or 0}"
+    except Exception as e:
+        logger.warning(f"Error reading catalog version: {str(e)}")
+        return None
+
+async def get_version_async(region='US', redis_client=None):
+    """get_version for asyncio callers"""
+    try:
+        redis_client = redis_client or get_async_redis()
+        catalog, regional = await redis_client.mget(VERSION_KEY, _regional_key(region))
+        return f"{catalog or 0}.{regional or 0}"
+    except Exception as e:
+        logger.warning(f"Error reading catalog version: {str(e)}")
+        return None
+
+def bump_versions(regions, redis_client=None):
+    """Invalidate cached listings for the given regions (None means every region)"""
+    try:
+        redis_client = redis_client or get_redis()
+        pipe = redis_client.pipeline()
+        for region in regions:
+            pipe.incr(VERSION_KEY if region is None else _regional_key(region))
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Error bumping catalog version: {str(e)}")
+
+def make_etag(version, path):
+    """Weak ETag value for a listing response at a catalogue version"""
+    return hashlib.sha1(f"{version}:{path}".encode()).hexdigest()[:20]
+
+def _changed_region(instance, check_history):
+    """Region a pending change affects (None for catalogue-wide), or False if nothing listed changed"""
+    columns = LISTED_COLUMNS.get(type(instance))
+    if columns is None:
+        return False
+    
+    if check_history:
+        state = inspect(instance)
+        if not any(state.attrs[column].history.has_changes() for column in columns):
+            return False
+    
+    return getattr(instance, 'region', None) or None
+
+def _collect_changes(session, flush_context, instances):
+    regions = session.info.setdefault('catalog_regions', set())
+    for pending, check_history in ((session.new, False), (session.dirty, True), (session.deleted, False)):
+        for instance in pending:
+            region = _changed_region(instance, check_history)
+            if region is not False:
+                regions.add(region)
+
+def _publish_changes(session):
+    regions = session.info.pop('catalog_regions', None)
+    if regions:
+        bump_versions(regions)
+
+def _discard_changes(session):
+    session.info.pop('catalog_regions', None)
+
+def track_catalog_changes(session_class):
+    """Bump catalogue versions whenever a commit changes listed deal, price or game data"""
+    if event.contains(session_class, 'before_flush', _collect_changes):
+        return
+    
+    event.listen(session_class, 'before_flush', _collect_changes)
+    event.listen(session_class, 'after_commit', _publish_changes)
+    event.listen(session_class, 'after_rollback', _discard_changes)
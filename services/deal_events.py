@@ -0,0 +1,84 @@
+"""
+Live deal events published to Redis pub/sub as ingestion commits them
+"""
+
+from sqlalchemy import event
+from models import DealChange, Game, Store
+from services.redis_client import get_redis
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'deals:live:'
+
+def channel_for(region):
+    return f"{CHANNEL_PREFIX}{region}"
+
+def deal_event(change, session):
+    """Live event for a deal change, or None if it isn't a new hot deal or a price drop"""
+    hot_discount = float(os.getenv('LIVE_HOT_DEAL_MIN_DISCOUNT', 50))
+    
+    if change.change_type == 'added' and (change.savings_percentage or 0) >= hot_discount:
+        event_type = 'hot_deal'
+    elif change.change_type == 'changed' and change.previous_price is not None \
+            and change.sale_price < change.previous_price:
+        event_type = 'price_drop'
+    else:
+        return None
+    
+    # Rows created in this flush don't have their relationships loaded yet
+    game_store = change.game_store
+    game = game_store.game or session.get(Game, game_store.game_id)
+    store = game_store.store or session.get(Store, game_store.store_id)
+    return {
+        'type': event_type,
+        'version': change.id,
+        'deal': {
+            'id': change.game_store_id,
+            'game_id': game.id if game else None,
+            'game_title': game.title if game else '',
+            'store_name': store.name if store else 'Unknown',
+            'sale_price': change.sale_price,
+            'normal_price': change.normal_price,
+            'previous_price': change.previous_price,
+            'savings_percentage': change.savings_percentage,
+            'deal_url': game_store.store_url,
+            'image_url': game.cover_image_url if game else None
+        }
+    }
+
+def _collect_events(session, flush_context):
+    # Built while the rows are still loaded; after commit they would be expired
+    events = session.info.setdefault('deal_events', [])
+    for instance in session.new:
+        if isinstance(instance, DealChange):
+            live_event = deal_event(instance, session)
+            if live_event:
+                events.append((instance.region, live_event))
+
+def _publish_events(session):
+    events = session.info.pop('deal_events', None)
+    if not events:
+        return
+    
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for region, live_event in events:
+            pipe.publish(channel_for(region), json.dumps(live_event))
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Error publishing {len(events)} live deal events: {str(e)}")
+
+def _discard_events(session):
+    session.info.pop('deal_events', None)
+
+def publish_deal_events(session_class):
+    """Publish hot deals and price drops to Redis once the transaction logging them commits"""
+    if event.contains(session_class, 'after_flush', _collect_events):
+        return
+    
+    event.listen(session_class, 'after_flush', _collect_events)
+    event.listen(session_class, 'after_commit', _publish_events)
+    event.listen(session_class, 'after_rollback', _discard_events)
@@ -2,115 +2,237 @@
 Deal service for managing game deals
 """
 
-from sqlalchemy import and_, desc, asc
-from models import Deal, Game, Store
+from sqlalchemy import and_, desc, asc, func, select
+from sqlalchemy.orm import joinedload
+from models import Deal, DealChange, Game, GameStore, Store
+from database import replica_read
 from datetime import datetime, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
+def deal_json(deal):
+    """Serialize a current-price listing row for the deals APIs"""
+    return {
+        'id': deal.id,
+        'title': deal.title,
+        'game_title': deal.game.title if deal.game else deal.title,
+        'store_name': deal.store.name if deal.store else 'Unknown',
+        'sale_price': float(deal.sale_price),
+        'normal_price': float(deal.normal_price),
+        'savings_percentage': float(deal.savings_percentage),
+        'deal_url': deal.deal_url,
+        'image_url': deal.game.cover_image_url if deal.game else None,
+        'rating': deal.game.metacritic_score if deal.game else None,
+        'created_at': deal.created_at.isoformat()
+    }
+
+def changes_since(session, since, region='US', limit=500):
+    """Deals added, changed or ended after version `since`, for the Flask and async APIs
+    
+    Returns (version, changes) with one change per deal, or (version, None) when
+    `since` is None or the client is too far behind and should refetch. Takes a
+    plain session, so the async API runs it through AsyncSession.run_sync.
+    
+    Writers log changes under lock_deal_changes, so ids commit in order and no
+    lower id can still appear once a higher one is visible.
+    """
+    def current_version():
+        return session.execute(select(func.max(DealChange.id)).filter(
+            DealChange.region == region
+        )).scalar() or 0
+    
+    if since is None:
+        return current_version(), None
+    
+    oldest = session.execute(select(func.min(DealChange.id))).scalar()
+    if oldest is not None and since < oldest - 1:
+        return current_version(), None
+    
+    changes = session.execute(select(DealChange).options(
+        joinedload(DealChange.game_store).joinedload(GameStore.game),
+        joinedload(DealChange.game_store).joinedload(GameStore.store)
+    ).filter(
+        DealChange.region == region,
+        DealChange.id > since
+    ).order_by(DealChange.id).limit(limit + 1)).scalars().unique().all()
+    
+    if len(changes) > limit:
+        return current_version(), None
+    
+    # Later changes to the same deal supersede earlier ones
+    latest = {}
+    for change in changes:
+        latest.pop(change.game_store_id, None)
+        latest[change.game_store_id] = change
+    
+    return changes[-1].id if changes else since, list(latest.values())
+
+def deal_changes_json(version, changes):
+    """Response body for /api/deals/changes; `changes` None tells the client to refetch"""
+    return {
+        'version': version,
+        'reset': changes is None,
+        'changes': [{
+            'id': change.game_store_id,
+            'version': change.id,
+            'change': change.change_type,
+            'deal': deal_json(change.game_store) if change.change_type != 'ended' else None
+        } for change in changes or []]
+    }
+
 class DealService:
     """Service for deal-related operations"""
     
     def __init__(self, db):
         self.db = db
     
+    def _current_prices(self, region):
+        """Base query over the current price table with listing relationships loaded"""
+        return GameStore.query.options(
+            joinedload(GameStore.game),
+            joinedload(GameStore.store)
+        ).filter(GameStore.region == region)
+    
+    @replica_read
     def get_deals(self, region='US', limit=20, store_id=None, min_discount=0):
         """Get deals with filters"""
         try:
-            deals_query = Deal.query.filter(
-                Deal.region == region,
-                Deal.is_on_sale == True
+            deals_query = self._current_prices(region).filter(
+                GameStore.is_on_sale == True
             )
             
             if store_id:
-                deals_query = deals_query.filter(Deal.store_id == store_id)
+                deals_query = deals_query.filter(GameStore.store_id == store_id)
             
             if min_discount > 0:
-                deals_query = deals_query.filter(Deal.savings_percentage >= min_discount)
+                deals_query = deals_query.filter(GameStore.discount_percentage >= min_discount)
             
-            deals = deals_query.order_by(desc(Deal.savings_percentage)).limit(limit).all()
+            deals = deals_query.order_by(desc(GameStore.discount_percentage)).limit(limit).all()
             
             return deals
         except Exception as e:
             logger.error(f"Error getting deals: {str(e)}")
             return []
     
+    @replica_read
     def get_hot_deals(self, limit=20, region='US'):
         """Get the hottest deals (highest savings)"""
         try:
-            deals = Deal.query.filter(
-                Deal.region == region,
-                Deal.is_on_sale == True,
-                Deal.savings_percentage >= 50
-            ).order_by(desc(Deal.savings_percentage)).limit(limit).all()
+            deals = self._current_prices(region).filter(
+                GameStore.is_on_sale == True,
+                GameStore.discount_percentage >= 50
+            ).order_by(desc(GameStore.discount_percentage)).limit(limit).all()
             
             return deals
         except Exception as e:
             logger.error(f"Error getting hot deals: {str(e)}")
             return []
     
+    @replica_read
     def get_recent_deals(self, limit=20, region='US', hours=24):
         """Get recently added deals"""
         try:
             cutoff_time = datetime.utcnow() - timedelta(hours=hours)
             
-            deals = Deal.query.filter(
-                Deal.region == region,
-                Deal.is_on_sale == True,
-                Deal.created_at >= cutoff_time
-            ).order_by(desc(Deal.created_at)).limit(limit).all()
+            deals = self._current_prices(region).filter(
+                GameStore.is_on_sale == True,
+                GameStore.deal_start_date >= cutoff_time
+            ).order_by(desc(GameStore.deal_start_date)).limit(limit).all()
             
             return deals
         except Exception as e:
             logger.error(f"Error getting recent deals: {str(e)}")
             return []
     
+    @replica_read
     def get_free_games(self, limit=20, region='US'):
         """Get currently free games"""
         try:
-            deals = Deal.query.filter(
-                Deal.region == region,
-                Deal.sale_price == 0,
-                Deal.is_on_sale == True
-            ).order_by(desc(Deal.created_at)).limit(limit).all()
+            deals = self._current_prices(region).filter(
+                GameStore.current_price == 0,
+                GameStore.is_on_sale == True
+            ).order_by(desc(GameStore.deal_start_date)).limit(limit).all()
             
             return deals
         except Exception as e:
             logger.error(f"Error getting free games: {str(e)}")
             return []
     
+    @replica_read
     def get_ending_soon_deals(self, limit=20, region='US', hours=48):
         """Get deals ending soon"""
         try:
             cutoff_time = datetime.utcnow() + timedelta(hours=hours)
             
-            deals = Deal.query.filter(
-                Deal.region == region,
-                Deal.is_on_sale == True,
-                Deal.deal_end_date.isnot(None),
-                Deal.deal_end_date <= cutoff_time
-            ).order_by(asc(Deal.deal_end_date)).limit(limit).all()
+            deals = self._current_prices(region).filter(
+                GameStore.is_on_sale == True,
+                GameStore.deal_end_date.isnot(None),
+                GameStore.deal_end_date <= cutoff_time
+            ).order_by(asc(GameStore.deal_end_date)).limit(limit).all()
             
             return deals
         except Exception as e:
             logger.error(f"Error getting ending soon deals: {str(e)}")
             return []
     
+    @replica_read
     def get_store_deals(self, store_id, region='US', limit=20):
         """Get deals from a specific store"""
         try:
-            deals = Deal.query.filter(
-                Deal.store_id == store_id,
-                Deal.region == region,
-                Deal.is_on_sale == True
-            ).order_by(desc(Deal.savings_percentage)).limit(limit).all()
+            deals = self._current_prices(region).filter(
+                GameStore.store_id == store_id,
+                GameStore.is_on_sale == True
+            ).order_by(desc(GameStore.discount_percentage)).limit(limit).all()
             
             return deals
         except Exception as e:
             logger.error(f"Error getting store deals: {str(e)}")
             return []
     
+    @replica_read
+    def get_store_stats(self, store_id, region='US'):
+        """Get aggregate deal statistics for a store"""
+        try:
+            active_deals, avg_discount, total_savings = self.db.session.query(
+                self.db.func.count(GameStore.id),
+                self.db.func.avg(GameStore.discount_percentage),
+                self.db.func.sum(GameStore.original_price - GameStore.current_price)
+            ).filter(
+                GameStore.store_id == store_id,
+                GameStore.region == region,
+                GameStore.is_on_sale == True
+            ).one()
+            
+            return {
+                'active_deals': active_deals,
+                'avg_discount': round(avg_discount or 0, 2),
+                'total_savings': round(total_savings or 0, 2)
+            }
+        except Exception as e:
+            logger.error(f"Error getting store stats: {str(e)}")
+            return {}
+    
+    def get_changes_version(self, region='US'):
+        """Get the latest deals version clients can sync from"""
+        try:
+            return changes_since(self.db.session, None, region=region)[0]
+        except Exception as e:
+            logger.error(f"Error getting deals version: {str(e)}")
+            return None
+    
+    def get_changes(self, since, region='US', limit=500):
+        """Get deals added, changed or ended after version `since`
+        
+        Returns (version, changes) with one change per deal, or (version, None)
+        when the client is too far behind and should refetch.
+        """
+        try:
+            return changes_since(self.db.session, since, region=region, limit=limit)
+        except Exception as e:
+            logger.error(f"Error getting deal changes: {str(e)}")
+            return None, None
+    
     def create_deal(self, game_id, store_id, **kwargs):
         """Create a new deal"""
         try:
@@ -149,26 +271,27 @@ class DealService:
             self.db.session.rollback()
             return None
     
+    @replica_read
     def get_deal_stats(self, region='US'):
         """Get deal statistics"""
         try:
-            total_deals = Deal.query.filter(Deal.region == region).count()
-            active_deals = Deal.query.filter(
-                Deal.region == region,
-                Deal.is_on_sale == True
+            total_deals = GameStore.query.filter(GameStore.region == region).count()
+            active_deals = GameStore.query.filter(
+                GameStore.region == region,
+                GameStore.is_on_sale == True
             ).count()
             
             avg_discount = self.db.session.query(
-                self.db.func.avg(Deal.savings_percentage)
+                self.db.func.avg(GameStore.discount_percentage)
             ).filter(
-                Deal.region == region,
-                Deal.is_on_sale == True
+                GameStore.region == region,
+                GameStore.is_on_sale == True
             ).scalar() or 0
             
-            free_games_count = Deal.query.filter(
-                Deal.region == region,
-                Deal.sale_price == 0,
-                Deal.is_on_sale == True
+            free_games_count = GameStore.query.filter(
+                GameStore.region == region,
+                GameStore.current_price == 0,
+                GameStore.is_on_sale == True
             ).count()
             
             return {
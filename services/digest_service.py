@@ -0,0 +1,132 @@
+"""
+Digest service for building personalised weekly deal digests
+"""
+
+from sqlalchemy import desc
+from sqlalchemy.orm import joinedload
+from models import User, GameStore, UserWishlist
+from services.redis_client import get_redis
+from monitoring import record
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+class DigestService:
+    """Service for streaming weekly digests to opted-in users in keyset batches"""
+    
+    BEST_DEALS_KEY_PREFIX = 'digest:best_deals:'
+    BEST_DEALS_TTL_SECONDS = 24 * 3600
+    
+    def __init__(self, db, redis_client=None):
+        self.db = db
+        self.redis = redis_client or get_redis()
+    
+    def compute_best_deals(self, region='US', min_discount=50, limit=200):
+        """Get the pool of current best deals that every digest is built from"""
+        game_stores = GameStore.query.options(
+            joinedload(GameStore.game),
+            joinedload(GameStore.store)
+        ).filter(
+            GameStore.region == region,
+            GameStore.is_on_sale == True,
+            GameStore.discount_percentage >= min_discount
+        ).order_by(desc(GameStore.discount_percentage)).limit(limit).all()
+        
+        return [{
+            'game_id': game_store.game_id,
+            'title': game_store.title,
+            'store_name': game_store.store.name if game_store.store else 'Unknown',
+            'sale_price': float(game_store.sale_price),
+            'normal_price': float(game_store.normal_price),
+            'savings_percentage': float(game_store.savings_percentage),
+            'deal_url': game_store.deal_url
+        } for game_store in game_stores]
+    
+    def store_best_deals(self, run_id, best_deals):
+        """Share the precomputed deal pool with every chunk of a digest run"""
+        self.redis.set(f"{self.BEST_DEALS_KEY_PREFIX}{run_id}", json.dumps(best_deals),
+                       ex=self.BEST_DEALS_TTL_SECONDS)
+    
+    def load_best_deals(self, run_id):
+        """Load the precomputed deal pool for a digest run"""
+        raw = self.redis.get(f"{self.BEST_DEALS_KEY_PREFIX}{run_id}")
+        return json.loads(raw) if raw else []
+    
+    def iter_user_id_ranges(self, batch_size=1000):
+        """Yield (first_id, last_id) ranges covering opted-in users, batch_size users each
+        
+        Uses keyset pagination on the primary key so only one batch of ids is held
+        at a time, regardless of how many users there are.
+        """
+        last_id = 0
+        
+        while True:
+            user_ids = [row.id for row in self._recipients().with_entities(User.id).filter(
+                User.id > last_id
+            ).order_by(User.id).limit(batch_size)]
+            
+            if not user_ids:
+                break
+            
+            yield user_ids[0], user_ids[-1]
+            last_id = user_ids[-1]
+    
+    def send_range(self, email_service, first_id, last_id, best_deals, per_user=10):
+        """Build and send digests for opted-in users with ids in [first_id, last_id]"""
+        users = self._recipients().filter(
+            User.id >= first_id,
+            User.id <= last_id
+        ).order_by(User.id).all()
+        
+        if not users or not best_deals:
+            return 0
+        
+        overlap = self._wishlist_overlap([user.id for user in users], best_deals)
+        
+        messages = []
+        for user in users:
+            wishlist_deals, other_deals = self.personalise(best_deals, overlap.get(user.id, set()), per_user)
+            messages.append(email_service.build_weekly_digest(user, other_deals, wishlist_deals=wishlist_deals))
+        
+        sent, failed, refused = email_service.send_batch(messages)
+        
+        for message in failed:
+            logger.error(f"Failed to send digest to {message.recipients}")
+        
+        record('emails_sent', len(sent), kind='digest')
+        record('emails_failed', len(failed) + len(refused), kind='digest')
+        return len(sent)
+    
+    @staticmethod
+    def personalise(best_deals, wishlist_game_ids, per_user=10):
+        """Split the deal pool into wishlisted deals first, topped up with the best general deals"""
+        wishlist_deals = [deal for deal in best_deals if deal['game_id'] in wishlist_game_ids][:per_user]
+        other_deals = [deal for deal in best_deals if deal['game_id'] not in wishlist_game_ids]
+        
+        return wishlist_deals, other_deals[:per_user - len(wishlist_deals)]
+    
+    def _recipients(self):
+        """Base query for users who opted into email"""
+        return User.query.filter(
+            User.email_notifications == True,
+            User.is_active == True
+        )
+    
+    def _wishlist_overlap(self, user_ids, best_deals):
+        """Get, per user, which games in the deal pool are on their wishlist"""
+        game_ids = list({deal['game_id'] for deal in best_deals})
+        
+        rows = self.db.session.query(
+            UserWishlist.user_id,
+            UserWishlist.game_id
+        ).filter(
+            UserWishlist.user_id.in_(user_ids),
+            UserWishlist.game_id.in_(game_ids)
+        ).all()
+        
+        overlap = {}
+        for user_id, game_id in rows:
+            overlap.setdefault(user_id, set()).add(game_id)
+        
+        return overlap
@@ -0,0 +1,91 @@
+"""
+Email service for sending notification mail over pooled SMTP connections
+"""
+
+from flask import render_template
+from flask_mail import Message
+import smtplib
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class EmailService:
+    """Service for building and sending email in batches"""
+    
+    MAX_ATTEMPTS = 3
+    RETRY_BACKOFF_SECONDS = 2
+    
+    def __init__(self, mail):
+        self.mail = mail
+    
+    def build_price_alerts(self, user, alerts):
+        """Build one email covering every price alert queued for a user"""
+        if len(alerts) == 1:
+            subject = f"Price drop: {alerts[0]['game_title']} is now ${alerts[0]['price']:.2f}"
+        else:
+            subject = f"Price drops on {len(alerts)} games you're watching"
+        
+        return Message(
+            subject=subject,
+            recipients=[user.email],
+            body=render_template('emails/price_alerts.txt', user=user, alerts=alerts),
+            html=render_template('emails/price_alerts.html', user=user, alerts=alerts)
+        )
+    
+    def build_weekly_digest(self, user, deals, wishlist_deals=None):
+        """Build the weekly best-deals digest for a user, leading with wishlisted games"""
+        wishlist_deals = wishlist_deals or []
+        if wishlist_deals:
+            subject = f"{len(wishlist_deals)} games on your wishlist are on sale this week"
+        else:
+            subject = "This week's best game deals"
+        
+        return Message(
+            subject=subject,
+            recipients=[user.email],
+            body=render_template('emails/weekly_digest.txt', user=user, deals=deals,
+                                 wishlist_deals=wishlist_deals),
+            html=render_template('emails/weekly_digest.html', user=user, deals=deals,
+                                 wishlist_deals=wishlist_deals)
+        )
+    
+    def send_batch(self, messages):
+        """Send messages over a single SMTP connection, reconnecting and retrying on failure
+        
+        Returns a tuple of (sent, failed, refused) message lists. Failed messages
+        may go through on a later try; refused ones were rejected by the server for
+        their recipients and won't.
+        """
+        sent = []
+        failed = []
+        refused = []
+        remaining = list(messages)
+        
+        for attempt in range(self.MAX_ATTEMPTS):
+            if not remaining:
+                break
+            
+            if attempt:
+                time.sleep(self.RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+            
+            try:
+                with self.mail.connect() as connection:
+                    while remaining:
+                        message = remaining[0]
+                        try:
+                            connection.send(message)
+                            sent.append(message)
+                        except smtplib.SMTPRecipientsRefused as e:
+                            # Permanent for this recipient; retrying won't help
+                            logger.error(f"Recipient refused for {message.recipients}: {str(e)}")
+                            refused.append(message)
+                        remaining.pop(0)
+            except (smtplib.SMTPException, OSError) as e:
+                logger.warning(f"SMTP batch attempt {attempt + 1} failed with "
+                               f"{len(remaining)} messages left: {str(e)}")
+        
+        failed.extend(remaining)
+        
+        logger.info(f"Email batch sent: {len(sent)} sent, {len(failed)} failed, {len(refused)} refused")
+        return sent, failed, refused
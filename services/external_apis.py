@@ -5,8 +5,12 @@ External API integrations for game data and pricing
 import requests
 import time
 import logging
+import os
 from datetime import datetime
 import json
+from services.ingestion_checkpoint import IngestionCheckpoint
+from database import lock_deal_changes, upsert_insert
+from monitoring import record, track_external
 
 logger = logging.getLogger(__name__)
 
@@ -14,7 +18,7 @@ class BaseAPI:
     """Base class for external API integrations"""
     
     def __init__(self, base_url, rate_limit=60):
-        self.base_url = base_url
+        self.base_url = base_url.rstrip('/')
         self.rate_limit = rate_limit
         self.last_request_time = 0
     
@@ -30,14 +34,15 @@ class BaseAPI:
         
         self.last_request_time = time.time()
     
-    def _make_request(self, endpoint, params=None):
+    def _make_request(self, endpoint, params=None, base_url=None):
         """Make HTTP request with rate limiting"""
         self._rate_limit_check()
         
         try:
-            url = f"{self.base_url}/{endpoint.lstrip('/')}"
-            response = requests.get(url, params=params, timeout=30)
-            response.raise_for_status()
+            url = f"{(base_url or self.base_url).rstrip('/')}/{endpoint.lstrip('/')}"
+            with track_external(self.__class__.__name__):
+                response = requests.get(url, params=params, timeout=30)
+                response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
             logger.error(f"API request failed: {str(e)}")
@@ -47,7 +52,13 @@ class SteamAPI(BaseAPI):
     """Steam Web API integration"""
     
     def __init__(self):
-        super().__init__('https://store.steampowered.com/api', rate_limit=200)
+        super().__init__(
+            os.getenv('STEAM_API_BASE_URL', 'https://store.steampowered.com/api'),
+            rate_limit=int(os.getenv('STEAM_API_RATE_LIMIT', 200))
+        )
+        # Wishlists, libraries and the app list come from the Web API host, not the store API
+        self.web_api_base_url = os.getenv('STEAM_WEB_API_BASE_URL', 'https://api.steampowered.com')
+        self.api_key = os.getenv('STEAM_API_KEY')
         self.app_list_cache = None
         self.cache_timestamp = None
     
@@ -82,6 +93,42 @@ class SteamAPI(BaseAPI):
             logger.error(f"Error searching Steam games: {str(e)}")
             return []
     
+    def get_wishlist(self, steam_id):
+        """App ids and dates on a public Steam wishlist, as [{'appid', 'date_added', ...}]"""
+        data = self._make_request('IWishlistService/GetWishlist/v1', {'steamid': steam_id},
+                                  base_url=self.web_api_base_url)
+        if data is None:
+            return None
+        return (data.get('response') or {}).get('items', [])
+    
+    def get_owned_games(self, steam_id):
+        """Games in a public Steam library, as [{'appid', 'name', ...}]; needs STEAM_API_KEY"""
+        if not self.api_key:
+            logger.error("STEAM_API_KEY is required to read Steam libraries")
+            return None
+        
+        data = self._make_request('IPlayerService/GetOwnedGames/v1', {
+            'key': self.api_key,
+            'steamid': steam_id,
+            'include_appinfo': 1,
+            'include_played_free_games': 1
+        }, base_url=self.web_api_base_url)
+        if data is None:
+            return None
+        return (data.get('response') or {}).get('games', [])
+    
+    def get_app_names(self, app_ids):
+        """Names for the given app ids from Steam's app list, fetched at most once a day"""
+        if self.app_list_cache is None or time.time() - self.cache_timestamp > 86400:
+            data = self._make_request('ISteamApps/GetAppList/v2', base_url=self.web_api_base_url)
+            apps = ((data or {}).get('applist') or {}).get('apps', [])
+            if apps:
+                self.app_list_cache = {app['appid']: app.get('name') for app in apps}
+                self.cache_timestamp = time.time()
+        
+        app_names = self.app_list_cache or {}
+        return {app_id: app_names[app_id] for app_id in app_ids if app_names.get(app_id)}
+    
     def get_price_info(self, app_id, region='US'):
         """Get current price information for a Steam app"""
         app_details = self.get_app_details(app_id, region)
@@ -111,7 +158,10 @@ class EpicAPI(BaseAPI):
     """Epic Games Store API integration"""
     
     def __init__(self):
-        super().__init__('https://store-site-backend-static.ak.epicgames.com', rate_limit=60)
+        super().__init__(
+            os.getenv('EPIC_API_BASE_URL', 'https://store-site-backend-static.ak.epicgames.com'),
+            rate_limit=int(os.getenv('EPIC_API_RATE_LIMIT', 60))
+        )
     
     def get_free_games(self):
         """Get current free games from Epic"""
@@ -147,7 +197,10 @@ class GOGAPI(BaseAPI):
     """GOG API integration"""
     
     def __init__(self):
-        super().__init__('https://www.gog.com/games/ajax', rate_limit=60)
+        super().__init__(
+            os.getenv('GOG_API_BASE_URL', 'https://www.gog.com/games/ajax'),
+            rate_limit=int(os.getenv('GOG_API_RATE_LIMIT', 60))
+        )
     
     def search_games(self, query='', limit=20):
         """Search for games on GOG"""
@@ -172,7 +225,10 @@ class CheapSharkAPI(BaseAPI):
     """CheapShark API for deal aggregation"""
     
     def __init__(self):
-        super().__init__('https://www.cheapshark.com/api/1.0', rate_limit=60)
+        super().__init__(
+            os.getenv('CHEAPSHARK_API_BASE_URL', 'https://www.cheapshark.com/api/1.0'),
+            rate_limit=int(os.getenv('CHEAPSHARK_API_RATE_LIMIT', 60))
+        )
     
     def get_deals(self, **kwargs):
         """Get deals from CheapShark"""
@@ -197,6 +253,26 @@ class CheapSharkAPI(BaseAPI):
             logger.error(f"Error fetching CheapShark deals: {str(e)}")
             return []
     
+    def get_deals_page(self, store_id, page=0, page_size=60):
+        """Get one page of on-sale deals for a store, or None if the request failed"""
+        return self._make_request('deals', {
+            'storeID': store_id,
+            'pageNumber': page,
+            'pageSize': page_size,
+            'sortBy': 'Savings',
+            'desc': 1,
+            'onSale': 1
+        })
+    
+    def get_deal(self, deal_id):
+        """Get current pricing for a single CheapShark deal"""
+        try:
+            data = self._make_request('deals', {'id': deal_id})
+            return data if data else None
+        except Exception as e:
+            logger.error(f"Error fetching CheapShark deal {deal_id}: {str(e)}")
+            return None
+    
     def get_stores(self):
         """Get list of stores from CheapShark"""
         try:
@@ -206,9 +282,24 @@ class CheapSharkAPI(BaseAPI):
             logger.error(f"Error fetching stores: {str(e)}")
             return []
 
+class PriceUpdateError(Exception):
+    """Raised when a price update chunk cannot be fetched and should be retried"""
+    pass
+
 class PriceUpdateService:
     """Service for updating game prices from external APIs"""
     
+    VOLATILITY_HALF_LIFE_HOURS = 24 * 7
+    
+    # Map CheapShark store IDs to our stores
+    STORE_MAPPING = {
+        '1': 'steam',
+        '25': 'epic',
+        '7': 'gog',
+        '2': 'humble',
+        '15': 'fanatical'
+    }
+    
     def __init__(self, db):
         self.db = db
         self.steam_api = SteamAPI()
@@ -216,46 +307,107 @@ class PriceUpdateService:
         self.gog_api = GOGAPI()
         self.cheapshark_api = CheapSharkAPI()
     
-    def update_all_prices(self):
-        """Update prices for all games"""
+    def update_all_prices(self, run_id=None, pages_per_store=5, page_size=60, commit_every=25):
+        """Update prices for all stores page by page
+        
+        Records are committed every `commit_every` deals. When a run_id is given,
+        progress is checkpointed so a crashed or redelivered run with the same
+        run_id resumes where it stopped instead of starting over.
+        """
+        checkpoint = IngestionCheckpoint(run_id) if run_id else None
+        
+        logger.info("Starting price update for all games...")
+        
+        updated_count = 0
+        for cheapshark_store_id, page in self.plan_update_chunks(pages_per_store):
+            try:
+                updated_count += self.update_store_prices(
+                    cheapshark_store_id, page, page_size,
+                    checkpoint=checkpoint,
+                    commit_every=commit_every
+                )
+            except Exception as e:
+                logger.error(f"Error updating store {cheapshark_store_id} page {page}: {str(e)}")
+                continue
+        
+        if checkpoint:
+            checkpoint.clear()
+        
+        logger.info(f"Price update completed: {updated_count} deals updated")
+        return updated_count
+    
+    @classmethod
+    def plan_update_chunks(cls, pages_per_store=5):
+        """Split a full price update into independent (store, page) chunks"""
+        return [
+            (cheapshark_store_id, page)
+            for cheapshark_store_id in cls.STORE_MAPPING
+            for page in range(pages_per_store)
+        ]
+    
+    def update_store_prices(self, cheapshark_store_id, page=0, page_size=60, checkpoint=None, commit_every=25):
+        """Update prices for one page of a store's deals, committing every `commit_every` records"""
+        if checkpoint and checkpoint.is_done(cheapshark_store_id, page):
+            logger.info(f"Store {cheapshark_store_id} page {page}: already committed, skipping")
+            return 0
+        
+        deals_data = self.cheapshark_api.get_deals_page(cheapshark_store_id, page, page_size)
+        if deals_data is None:
+            raise PriceUpdateError(f"Failed to fetch page {page} for store {cheapshark_store_id}")
+        
+        record('records_fetched', len(deals_data), store=cheapshark_store_id)
+        
+        start = checkpoint.resume_offset(cheapshark_store_id, page, deals_data) if checkpoint else 0
+        if start:
+            logger.info(f"Store {cheapshark_store_id} page {page}: resuming at record {start}")
+        
         try:
-            from models import Game, Deal, Store
-            
-            logger.info("Starting price update for all games...")
-            
-            # Get deals from CheapShark
-            deals_data = self.cheapshark_api.get_deals(limit=100)
-            
             updated_count = 0
-            for deal_data in deals_data:
-                try:
-                    # Find or create game
-                    game = self._find_or_create_game(deal_data)
-                    if not game:
-                        continue
-                    
-                    # Find or create store
-                    store = self._find_or_create_store(deal_data)
-                    if not store:
-                        continue
-                    
-                    # Create or update deal
-                    deal = self._create_or_update_deal(game, store, deal_data)
-                    if deal:
-                        updated_count += 1
+            for offset in range(start, len(deals_data), commit_every):
+                batch = deals_data[offset:offset + commit_every]
+                lock_deal_changes(self.db.session)
+                updated_count += self._process_deals(batch)
+                self.db.session.commit()
                 
-                except Exception as e:
-                    logger.error(f"Error processing deal: {str(e)}")
-                    continue
+                if checkpoint:
+                    checkpoint.advance(cheapshark_store_id, page, batch[-1].get('dealID'))
             
-            self.db.session.commit()
-            logger.info(f"Price update completed: {updated_count} deals updated")
+            if checkpoint:
+                checkpoint.complete(cheapshark_store_id, page)
             
+            record('deals_updated', updated_count, store=cheapshark_store_id)
+            logger.info(f"Store {cheapshark_store_id} page {page}: {updated_count} deals updated")
             return updated_count
-        except Exception as e:
-            logger.error(f"Error updating prices: {str(e)}")
+        except Exception:
             self.db.session.rollback()
-            return 0
+            raise
+    
+    def _process_deals(self, deals_data):
+        """Apply a list of CheapShark deals to games, deals and current prices"""
+        updated_count = 0
+        for deal_data in deals_data:
+            try:
+                # Find or create game
+                game = self._find_or_create_game(deal_data)
+                if not game:
+                    continue
+                
+                # Find or create store
+                store = self._find_or_create_store(deal_data)
+                if not store:
+                    continue
+                
+                # Create or update deal
+                deal = self._create_or_update_deal(game, store, deal_data)
+                if deal:
+                    self._upsert_game_store(deal)
+                    updated_count += 1
+            
+            except Exception as e:
+                logger.error(f"Error processing deal: {str(e)}")
+                continue
+        
+        return updated_count
     
     def _find_or_create_game(self, deal_data):
         """Find existing game or create new one"""
@@ -276,20 +428,33 @@ class PriceUpdateService:
             if game:
                 return game
             
-            # Create new game
+            # Create new game; a parallel chunk may insert it first, so this is an upsert
+            # on its Steam app id, or on the title's slug when there isn't one
             slug = title.lower().replace(' ', '-').replace(':', '').replace("'", '')
-            game = Game(
+            if steam_app_id and Game.query.filter_by(slug=slug).first():
+                # Another game has this slug; the upsert only covers the app id
+                slug = f"{slug}-{steam_app_id}"[:255]
+            
+            now = datetime.utcnow()
+            insert = upsert_insert(self.db.session, Game)
+            statement = insert.values(
                 title=title,
                 slug=slug,
                 steam_app_id=steam_app_id,
                 cover_image_url=deal_data.get('thumb'),
-                metacritic_score=int(deal_data.get('metacriticScore', 0)) if deal_data.get('metacriticScore') else None
-            )
-            
-            self.db.session.add(game)
-            self.db.session.flush()  # Get the ID
+                metacritic_score=int(deal_data.get('metacriticScore', 0)) if deal_data.get('metacriticScore') else None,
+                created_at=now,
+                updated_at=now
+            ).on_conflict_do_update(
+                index_elements=['steam_app_id' if steam_app_id else 'slug'],
+                set_={'updated_at': now}
+            ).returning(Game.id)
             
-            return game
+            # In a savepoint, so a slug taken since the check above fails this record
+            # rather than aborting the transaction for the rest of the batch
+            with self.db.session.begin_nested():
+                game_id = self.db.session.execute(statement).scalar_one()
+            return self.db.session.get(Game, game_id)
         except Exception as e:
             logger.error(f"Error finding/creating game: {str(e)}")
             return None
@@ -301,16 +466,7 @@ class PriceUpdateService:
             
             store_id = deal_data.get('storeID')
             
-            # Map CheapShark store IDs to our stores
-            store_mapping = {
-                '1': 'steam',
-                '25': 'epic',
-                '7': 'gog',
-                '2': 'humble',
-                '15': 'fanatical'
-            }
-            
-            store_slug = store_mapping.get(store_id)
+            store_slug = self.STORE_MAPPING.get(store_id)
             if not store_slug:
                 return None
             
@@ -338,6 +494,7 @@ class PriceUpdateService:
                 existing_deal.sale_price = sale_price
                 existing_deal.normal_price = normal_price
                 existing_deal.savings_percentage = savings
+                existing_deal.is_on_sale = sale_price < normal_price
                 existing_deal.updated_at = datetime.utcnow()
                 return existing_deal
             else:
@@ -358,4 +515,214 @@ class PriceUpdateService:
                 return deal
         except Exception as e:
             logger.error(f"Error creating/updating deal: {str(e)}")
-            return None
\ No newline at end of file
+            return None
+    
+    def _upsert_game_store(self, deal, emit_events=True):
+        """Insert or update the current price row for a deal's game/store/region
+        
+        With emit_events False only the row is written, without change log
+        entries, live events or outbox events, for rebuilds that replay stored
+        deals rather than observe new prices.
+        """
+        try:
+            from models import GameStore, DealChange, OutboxEvent
+            
+            region = deal.region or 'US'
+            now = datetime.utcnow()
+            
+            # Insert the row or touch the existing one in a single statement, so parallel
+            # chunks can't both insert it; on Postgres the update also locks the row until
+            # commit, so the previous price read below can't change underneath us
+            insert = upsert_insert(self.db.session, GameStore)
+            game_store_id = self.db.session.execute(
+                insert.values(
+                    game_id=deal.game_id,
+                    store_id=deal.store_id,
+                    region=region,
+                    created_at=now,
+                    updated_at=now
+                ).on_conflict_do_update(
+                    index_elements=['game_id', 'store_id', 'region'],
+                    set_={'updated_at': now}
+                ).returning(GameStore.id)
+            ).scalar_one()
+            game_store = GameStore.query.populate_existing().filter_by(id=game_store_id).one()
+            
+            is_on_sale = deal.sale_price < deal.normal_price
+            was_on_sale = bool(game_store.is_on_sale)
+            previous_price = game_store.current_price
+            price_changed = (previous_price, game_store.original_price) != (deal.sale_price, deal.normal_price)
+            
+            # Decay volatility by age so only recent price changes raise refresh priority
+            if game_store.last_price_check:
+                age_hours = (now - game_store.last_price_check).total_seconds() / 3600
+                decay = 0.5 ** (age_hours / self.VOLATILITY_HALF_LIFE_HOURS)
+                game_store.price_volatility = (game_store.price_volatility or 0) * decay
+            if game_store.current_price is not None and game_store.current_price != deal.sale_price:
+                game_store.price_volatility = (game_store.price_volatility or 0) + 1
+            
+            # Track when the current sale started so "new deals" don't need history
+            if is_on_sale and not game_store.is_on_sale:
+                game_store.deal_start_date = deal.deal_start_date or now
+            elif not is_on_sale:
+                game_store.deal_start_date = None
+            
+            game_store.store_game_id = deal.external_deal_id
+            game_store.store_url = deal.deal_url
+            game_store.current_price = deal.sale_price
+            game_store.original_price = deal.normal_price
+            game_store.discount_percentage = deal.savings_percentage
+            game_store.currency = deal.currency or 'USD'
+            game_store.is_on_sale = is_on_sale
+            game_store.deal_end_date = deal.deal_end_date
+            game_store.is_available = True
+            game_store.last_price_check = now
+            
+            # Log what clients syncing from /api/deals/changes need to apply
+            if is_on_sale and not was_on_sale:
+                change_type = 'added'
+            elif was_on_sale and not is_on_sale:
+                change_type = 'ended'
+            elif is_on_sale and price_changed:
+                change_type = 'changed'
+            else:
+                change_type = None
+            
+            if change_type and emit_events:
+                self.db.session.add(DealChange(
+                    game_store=game_store,
+                    region=region,
+                    change_type=change_type,
+                    sale_price=deal.sale_price,
+                    normal_price=deal.normal_price,
+                    savings_percentage=deal.savings_percentage,
+                    previous_price=previous_price,
+                    created_at=now
+                ))
+            
+            # Outbox events commit or roll back with the price write itself
+            if change_type == 'added':
+                event_type = 'deal_created'
+            elif change_type == 'ended':
+                event_type = 'deal_ended'
+            elif previous_price is not None and deal.sale_price < previous_price:
+                event_type = 'price_dropped'
+            else:
+                event_type = None
+            
+            if event_type and emit_events:
+                self.db.session.add(OutboxEvent(
+                    event_type=event_type,
+                    game_store=game_store,
+                    region=region,
+                    payload=json.dumps({
+                        'game_id': deal.game_id,
+                        'store_id': deal.store_id,
+                        'sale_price': deal.sale_price,
+                        'normal_price': deal.normal_price,
+                        'previous_price': previous_price,
+                        'savings_percentage': deal.savings_percentage,
+                        'currency': deal.currency or 'USD',
+                        'deal_url': deal.deal_url,
+                        'occurred_at': now.isoformat()
+                    }),
+                    created_at=now
+                ))
+            
+            return game_store
+        except Exception as e:
+            logger.error(f"Error upserting game store price: {str(e)}")
+            return None
+    
+    def refresh_game_store_prices(self, game_store_ids, commit_every=25):
+        """Re-poll current prices for specific game/store rows
+        
+        Every price is fetched before anything is written, and the writes are committed
+        every `commit_every` rows, so no transaction or row lock is held across the
+        rate-limited API calls.
+        """
+        try:
+            from models import GameStore
+            
+            targets = self.db.session.query(GameStore.id, GameStore.store_id, GameStore.store_game_id).filter(
+                GameStore.id.in_(game_store_ids),
+                GameStore.store_game_id.isnot(None)
+            ).all()
+            # End the read transaction too rather than leave it idle during the fetches
+            self.db.session.commit()
+            
+            fetched = {}
+            for target in targets:
+                try:
+                    deal_info = self.cheapshark_api.get_deal(target.store_game_id)
+                    fetched[target.id] = (deal_info or {}).get('gameInfo')
+                    record('records_fetched', 1 if fetched[target.id] else 0, store=target.store_id)
+                except Exception as e:
+                    logger.error(f"Error fetching price for game store {target.id}: {str(e)}")
+                    continue
+            
+            refreshed_count = 0
+            fetched_ids = list(fetched)
+            for offset in range(0, len(fetched_ids), commit_every):
+                lock_deal_changes(self.db.session)
+                game_stores = GameStore.query.filter(
+                    GameStore.id.in_(fetched_ids[offset:offset + commit_every])
+                ).all()
+                
+                for game_store in game_stores:
+                    try:
+                        game_info = fetched[game_store.id]
+                        if not game_info:
+                            game_store.last_price_check = datetime.utcnow()
+                            continue
+                        
+                        sale_price = float(game_info.get('salePrice', 0))
+                        normal_price = float(game_info.get('retailPrice', 0))
+                        savings = (1 - sale_price / normal_price) * 100 if normal_price else 0
+                        
+                        deal = self._create_or_update_deal(game_store.game, game_store.store, {
+                            'dealID': game_store.store_game_id,
+                            'title': game_info.get('name', game_store.title),
+                            'salePrice': sale_price,
+                            'normalPrice': normal_price,
+                            'savings': savings
+                        })
+                        if deal and self._upsert_game_store(deal):
+                            refreshed_count += 1
+                    
+                    except Exception as e:
+                        logger.error(f"Error refreshing game store {game_store.id}: {str(e)}")
+                        continue
+                
+                self.db.session.commit()
+            
+            return refreshed_count
+        except Exception as e:
+            logger.error(f"Error refreshing game store prices: {str(e)}")
+            self.db.session.rollback()
+            return 0
+    
+    def rebuild_game_stores(self, batch_size=500):
+        """Backfill current prices from the most recently updated deal per game/store/region"""
+        try:
+            from models import Deal
+            
+            logger.info("Rebuilding current price table from deals...")
+            
+            # Oldest first so the latest deal for each key wins
+            deals = Deal.query.order_by(Deal.updated_at, Deal.id).yield_per(batch_size)
+            
+            rebuilt_count = 0
+            for deal in deals:
+                # Replayed history must not reach change feeds, alerts or webhooks as new changes
+                if self._upsert_game_store(deal, emit_events=False):
+                    rebuilt_count += 1
+            
+            self.db.session.commit()
+            logger.info(f"Current price table rebuilt from {rebuilt_count} deals")
+            
+            return rebuilt_count
+        except Exception as e:
+            logger.error(f"Error rebuilding current price table: {str(e)}")
+            self.db.session.rollback()
+            return 0
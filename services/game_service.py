@@ -3,7 +3,8 @@ Game service for business logic
 """
 
 from sqlalchemy import and_, or_, desc
-from models import Game, Deal, Store
+from models import Game, GameStore, Deal, Store
+from database import replica_read
 from datetime import datetime, timedelta
 import json
 import logging
@@ -16,6 +17,7 @@ class GameService:
     def __init__(self, db):
         self.db = db
     
+    @replica_read
     def search_games(self, query='', genre='', min_rating=0, max_price=999, limit=20):
         """Search games with filters"""
         try:
@@ -37,10 +39,13 @@ class GameService:
                     Game.metacritic_score >= min_rating
                 )
             
-            # Join with deals to filter by price
+            # Filter by current price without touching deal history
             if max_price < 999:
-                games_query = games_query.join(Deal).filter(
-                    Deal.sale_price <= max_price
+                games_query = games_query.filter(
+                    Game.game_stores.any(and_(
+                        GameStore.is_available == True,
+                        GameStore.current_price <= max_price
+                    ))
                 )
             
             games = games_query.order_by(desc(Game.metacritic_score)).limit(limit).all()
@@ -50,6 +55,7 @@ class GameService:
             logger.error(f"Error searching games: {str(e)}")
             return []
     
+    @replica_read
     def get_game_details(self, game_id):
         """Get detailed game information"""
         try:
@@ -59,6 +65,7 @@ class GameService:
             logger.error(f"Error getting game details: {str(e)}")
             return None
     
+    @replica_read
     def get_similar_games(self, game_id, limit=6):
         """Get games similar to the specified game"""
         try:
@@ -82,6 +89,7 @@ class GameService:
             logger.error(f"Error getting similar games: {str(e)}")
             return []
     
+    @replica_read
     def get_featured_games(self, limit=10):
         """Get featured games"""
         try:
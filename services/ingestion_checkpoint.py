@@ -0,0 +1,73 @@
+"""
+Resumable checkpoints for price ingestion runs
+"""
+
+from services.redis_client import get_redis
+import logging
+
+logger = logging.getLogger(__name__)
+
+class IngestionCheckpoint:
+    """Tracks per-store, per-page progress of an ingestion run in Redis
+    
+    Each page records the CheapShark deal ID of the last committed record, so a
+    crashed or redelivered run with the same run_id resumes after it. Replaying a
+    few records is harmless because deal and current-price writes are upserts.
+    """
+    
+    KEY_PREFIX = 'ingest:checkpoint:'
+    DONE = '__done__'
+    TTL_SECONDS = 7 * 24 * 3600
+    
+    def __init__(self, run_id, redis_client=None):
+        self.run_id = run_id
+        self.key = f"{self.KEY_PREFIX}{run_id}"
+        self.redis = redis_client or get_redis()
+    
+    def is_done(self, store_id, page):
+        """Check whether a page was fully committed by an earlier attempt"""
+        return self._get(store_id, page) == self.DONE
+    
+    def resume_offset(self, store_id, page, deals_data):
+        """Get the index of the first record in a refetched page that still needs processing"""
+        last_deal_id = self._get(store_id, page)
+        if not last_deal_id or last_deal_id == self.DONE:
+            return 0
+        
+        # The listing may have shifted since the crash; fall back to replaying the page
+        for index, deal_data in enumerate(deals_data):
+            if deal_data.get('dealID') == last_deal_id:
+                return index + 1
+        
+        return 0
+    
+    def advance(self, store_id, page, last_deal_id):
+        """Record the last committed deal of a page"""
+        self._set(store_id, page, last_deal_id)
+    
+    def complete(self, store_id, page):
+        """Mark a page as fully committed"""
+        self._set(store_id, page, self.DONE)
+    
+    def clear(self):
+        """Drop all checkpoints once the run has finished"""
+        try:
+            self.redis.delete(self.key)
+        except Exception as e:
+            logger.warning(f"Error clearing ingestion checkpoint {self.run_id}: {str(e)}")
+    
+    def _get(self, store_id, page):
+        try:
+            return self.redis.hget(self.key, f"{store_id}:{page}")
+        except Exception as e:
+            logger.warning(f"Error reading ingestion checkpoint {self.run_id}: {str(e)}")
+            return None
+    
+    def _set(self, store_id, page, value):
+        try:
+            pipe = self.redis.pipeline()
+            pipe.hset(self.key, f"{store_id}:{page}", value)
+            pipe.expire(self.key, self.TTL_SECONDS)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Error writing ingestion checkpoint {self.run_id}: {str(e)}")
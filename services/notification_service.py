@@ -0,0 +1,224 @@
+"""
+Notification service for queueing and dispatching price alert emails
+"""
+
+from models import User, PriceAlert
+from services.redis_client import get_redis, lease_due
+from monitoring import record
+from datetime import datetime
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Append a user's pending notifications to their processing list and return it;
+# the list still holds anything left by a dispatch that died before finishing
+_TAKE_PENDING_SCRIPT = """
+local pending = redis.call('LRANGE', KEYS[1], 0, -1)
+if #pending > 0 then
+    redis.call('RPUSH', KEYS[2], unpack(pending))
+    redis.call('DEL', KEYS[1])
+end
+return redis.call('LRANGE', KEYS[2], 0, -1)
+"""
+
+# Drop a user's processing list and take them off the due set, unless more
+# notifications were queued meanwhile, in which case reschedule them at ARGV[2]
+_RELEASE_SCRIPT = """
+redis.call('DEL', KEYS[1])
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('ZADD', KEYS[3], ARGV[2], ARGV[1])
+else
+    redis.call('ZREM', KEYS[3], ARGV[1])
+end
+"""
+
+class NotificationService:
+    """Queues notifications per user in Redis and dispatches them as coalesced email batches
+    
+    Each user has a pending list of notification payloads. The first payload
+    schedules the user in a due set `coalesce_seconds` ahead, so every alert that
+    fires for that user within the window goes out as a single email. Dispatch
+    leases due users and moves their payloads to a processing list, and releases
+    both only once the batch is sent, so a failed dispatch retries them later.
+    """
+    
+    PENDING_KEY_PREFIX = 'notify:pending:'
+    PROCESSING_KEY_PREFIX = 'notify:processing:'
+    DUE_KEY = 'notify:due'
+    CLAIM_SECONDS = 300
+    MAX_DELIVERY_ATTEMPTS = 5
+    RETRY_BASE_SECONDS = 60
+    
+    def __init__(self, db, redis_client=None, coalesce_seconds=None):
+        self.db = db
+        self.redis = redis_client or get_redis()
+        self.coalesce_seconds = coalesce_seconds if coalesce_seconds is not None else \
+            int(os.getenv('NOTIFICATION_COALESCE_SECONDS', 60))
+        self._take_pending_script = self.redis.register_script(_TAKE_PENDING_SCRIPT)
+        self._release_script = self.redis.register_script(_RELEASE_SCRIPT)
+    
+    def enqueue_price_alert(self, alert, deal, reason=None):
+        """Queue a triggered price alert for the alert owner"""
+        try:
+            self._enqueue(alert.user_id, {
+                'type': 'price_alert',
+                'alert_id': alert.id,
+                'game_id': alert.game_id,
+                'game_title': deal.game.title if deal.game else deal.title,
+                'price': float(deal.sale_price),
+                'normal_price': float(deal.normal_price),
+                'target_price': float(alert.target_price) if alert.target_price is not None else None,
+                'reason': reason or f"your target: ${alert.target_price:.2f}",
+                'store_name': deal.store.name if deal.store else 'Unknown',
+                'deal_url': deal.deal_url,
+                'attempts': 0
+            })
+            return True
+        except Exception as e:
+            logger.error(f"Error queueing price alert {alert.id}: {str(e)}")
+            return False
+    
+    def enqueue_wishlist_target(self, item, deal, reason):
+        """Queue a notification that a wishlist item reached its target"""
+        try:
+            self._enqueue(item.user_id, {
+                'type': 'wishlist_target',
+                'wishlist_id': item.id,
+                'game_id': item.game_id,
+                'game_title': deal.game.title if deal.game else deal.title,
+                'price': float(deal.sale_price),
+                'normal_price': float(deal.normal_price),
+                'reason': reason,
+                'store_name': deal.store.name if deal.store else 'Unknown',
+                'deal_url': deal.deal_url,
+                'attempts': 0
+            })
+            return True
+        except Exception as e:
+            logger.error(f"Error queueing wishlist notification {item.id}: {str(e)}")
+            return False
+    
+    def dispatch(self, email_service, batch_size=100, max_batches=10):
+        """Send queued notifications for users whose coalescing window has closed"""
+        sent_count = 0
+        
+        for _ in range(max_batches):
+            now = time.time()
+            user_ids = [int(user_id) for user_id in lease_due(
+                self.redis, self.DUE_KEY, now, batch_size, now + self.CLAIM_SECONDS
+            )]
+            if not user_ids:
+                break
+            
+            sent_count += self._dispatch_users(email_service, user_ids)
+        
+        return sent_count
+    
+    def _dispatch_users(self, email_service, user_ids):
+        """Build and send one email per user for a batch of due users"""
+        pending = self._take_pending(user_ids)
+        users = User.query.filter(User.id.in_(list(pending))).all() if pending else []
+        
+        messages = []
+        payloads_by_message = {}
+        for user in users:
+            if not (user.is_active and user.email_notifications and user.price_alert_notifications):
+                continue
+            
+            payloads = pending[user.id]
+            message = email_service.build_price_alerts(user, payloads)
+            messages.append(message)
+            payloads_by_message[id(message)] = (user.id, payloads)
+        
+        sent, failed, refused = email_service.send_batch(messages)
+        
+        # Record delivery on the alerts that went out
+        alert_ids = [
+            payload['alert_id']
+            for message in sent
+            for payload in payloads_by_message[id(message)][1]
+            if payload.get('alert_id')
+        ]
+        if alert_ids:
+            PriceAlert.query.filter(PriceAlert.id.in_(alert_ids)).update({
+                'email_sent': True,
+                'email_sent_at': datetime.utcnow()
+            }, synchronize_session=False)
+            self.db.session.commit()
+        
+        # Refused recipients won't accept a retry either, so their notifications are
+        # released with the sent ones; only transient failures are requeued
+        retry_delays = {}
+        for message in failed:
+            user_id, payloads = payloads_by_message[id(message)]
+            retry_delays[user_id] = self._requeue(user_id, payloads)
+        
+        # Only now is it safe to forget what was taken; an error before this point
+        # leaves the users leased, and they are dispatched again when the lease runs out
+        self._release(user_ids, retry_delays)
+        
+        record('emails_sent', len(sent), kind='price_alert')
+        record('emails_failed', len(failed) + len(refused), kind='price_alert')
+        return len(sent)
+    
+    def _take_pending(self, user_ids):
+        """Move each user's pending notifications to their processing list and read it"""
+        pipe = self.redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            self._take_pending_script(
+                keys=[f"{self.PENDING_KEY_PREFIX}{user_id}", f"{self.PROCESSING_KEY_PREFIX}{user_id}"],
+                client=pipe
+            )
+        results = pipe.execute()
+        
+        pending = {}
+        for user_id, raw_payloads in zip(user_ids, results):
+            payloads = [json.loads(raw) for raw in raw_payloads]
+            if payloads:
+                pending[user_id] = payloads
+        
+        return pending
+    
+    def _release(self, user_ids, retry_delays):
+        """Clear processed users' processing lists and due entries, rescheduling any with newer or retried notifications"""
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            delay = retry_delays.get(user_id)
+            self._release_script(
+                keys=[f"{self.PROCESSING_KEY_PREFIX}{user_id}", f"{self.PENDING_KEY_PREFIX}{user_id}", self.DUE_KEY],
+                args=[user_id, now + (self.coalesce_seconds if delay is None else delay)],
+                client=pipe
+            )
+        pipe.execute()
+    
+    def _requeue(self, user_id, payloads):
+        """Put failed notifications back, dropping ones that keep failing; returns the backoff delay"""
+        retry = []
+        for payload in payloads:
+            payload['attempts'] = payload.get('attempts', 0) + 1
+            if payload['attempts'] < self.MAX_DELIVERY_ATTEMPTS:
+                retry.append(payload)
+            else:
+                logger.error(f"Dropping notification for user {user_id} after "
+                             f"{payload['attempts']} attempts: {payload.get('type')}")
+        
+        if not retry:
+            return None
+        
+        attempts = max(payload['attempts'] for payload in retry)
+        delay = self.RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+        self._enqueue(user_id, *retry, delay=delay)
+        return delay
+    
+    def _enqueue(self, user_id, *payloads, delay=None):
+        """Append payloads to a user's pending list and schedule the user if not already due"""
+        due_at = time.time() + (self.coalesce_seconds if delay is None else delay)
+        
+        pipe = self.redis.pipeline()
+        pipe.rpush(f"{self.PENDING_KEY_PREFIX}{user_id}", *[json.dumps(payload) for payload in payloads])
+        pipe.zadd(self.DUE_KEY, {user_id: due_at}, nx=True)
+        pipe.execute()
@@ -0,0 +1,153 @@
+"""
+Outbox relay and Redis stream consumers for price change events
+"""
+
+from models import OutboxEvent
+from services.redis_client import get_redis
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = 'events:deals'
+
+class OutboxRelay:
+    """Publishes committed outbox events to the deals stream, oldest first
+    
+    Events are marked published only after XADD succeeds, so a crash in between
+    re-publishes them: delivery is at-least-once and consumers dedupe on
+    event_id. A Redis lock keeps a single relay running, so events for the same
+    deal, which commit in order under its row lock, reach the stream in order.
+    """
+    
+    LOCK_KEY = 'outbox:relay:lock'
+    
+    def __init__(self, db, redis_client=None):
+        self.db = db
+        self.redis = redis_client or get_redis()
+        self.max_stream_length = int(os.getenv('OUTBOX_STREAM_MAXLEN', 100000))
+    
+    def relay(self, batch_size=500, max_batches=20):
+        """Relay pending events; returns how many were published"""
+        lock = self.redis.lock(self.LOCK_KEY, timeout=300, blocking=False)
+        if not lock.acquire():
+            logger.info("Outbox relay already running, skipping")
+            return 0
+        
+        try:
+            published_count = 0
+            for _ in range(max_batches):
+                relayed = self._relay_batch(batch_size)
+                published_count += relayed
+                if relayed < batch_size:
+                    break
+            
+            return published_count
+        finally:
+            try:
+                lock.release()
+            except Exception as e:
+                logger.warning(f"Error releasing outbox relay lock: {str(e)}")
+    
+    def _relay_batch(self, batch_size):
+        events = OutboxEvent.query.filter(
+            OutboxEvent.published_at.is_(None)
+        ).order_by(OutboxEvent.id).limit(batch_size).all()
+        
+        if not events:
+            return 0
+        
+        pipe = self.redis.pipeline(transaction=False)
+        for outbox_event in events:
+            pipe.xadd(STREAM_KEY, {
+                'event_id': outbox_event.id,
+                'event_type': outbox_event.event_type,
+                'game_store_id': outbox_event.game_store_id,
+                'region': outbox_event.region,
+                'payload': outbox_event.payload
+            }, maxlen=self.max_stream_length, approximate=True)
+        pipe.execute()
+        
+        try:
+            now = datetime.utcnow()
+            OutboxEvent.query.filter(
+                OutboxEvent.id.in_([outbox_event.id for outbox_event in events])
+            ).update({OutboxEvent.published_at: now}, synchronize_session=False)
+            self.db.session.commit()
+        except Exception:
+            # Already in the stream; they'll be sent again, which consumers tolerate
+            self.db.session.rollback()
+            raise
+        
+        return len(events)
+    
+    def prune(self, days=7):
+        """Delete published events older than `days`"""
+        try:
+            cutoff = datetime.utcnow() - timedelta(days=days)
+            pruned_count = OutboxEvent.query.filter(
+                OutboxEvent.published_at.isnot(None),
+                OutboxEvent.published_at < cutoff
+            ).delete(synchronize_session=False)
+            self.db.session.commit()
+            
+            return pruned_count
+        except Exception as e:
+            logger.error(f"Error pruning outbox events: {str(e)}")
+            self.db.session.rollback()
+            return 0
+
+class OutboxConsumer:
+    """Reads the deals stream as one member of a consumer group
+    
+    The group's last-delivered id is the consumer offset. Entries stay pending
+    until acked, and entries left pending by a crashed consumer are reclaimed
+    after `reclaim_idle_ms`, so every event is processed at least once.
+    """
+    
+    def __init__(self, group, name, redis_client=None, reclaim_idle_ms=60000):
+        self.group = group
+        self.name = name
+        self.redis = redis_client or get_redis()
+        self.reclaim_idle_ms = reclaim_idle_ms
+        self._ensure_group()
+    
+    def _ensure_group(self):
+        try:
+            # New groups start from the beginning of the retained stream
+            self.redis.xgroup_create(STREAM_KEY, self.group, id='0', mkstream=True)
+        except Exception as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+    
+    def read(self, count=100, block_ms=5000):
+        """Get up to `count` events as (entry_id, event) pairs, stale pending entries first"""
+        _, claimed, *_ = self.redis.xautoclaim(
+            STREAM_KEY, self.group, self.name, self.reclaim_idle_ms, start_id='0-0', count=count
+        )
+        entries = list(claimed)
+        
+        if len(entries) < count:
+            for _, stream_entries in self.redis.xreadgroup(
+                self.group, self.name, {STREAM_KEY: '>'}, count=count - len(entries), block=block_ms
+            ) or []:
+                entries.extend(stream_entries)
+        
+        return [(entry_id, self._decode(fields)) for entry_id, fields in entries if fields]
+    
+    def ack(self, entry_ids):
+        """Mark entries processed so they are not redelivered"""
+        if entry_ids:
+            self.redis.xack(STREAM_KEY, self.group, *entry_ids)
+    
+    @staticmethod
+    def _decode(fields):
+        return {
+            'event_id': int(fields['event_id']),
+            'event_type': fields['event_type'],
+            'game_store_id': int(fields['game_store_id']),
+            'region': fields['region'],
+            **json.loads(fields['payload'])
+        }
@@ -2,19 +2,35 @@
 Price service for managing price history and alerts
 """
 
-from sqlalchemy import and_, desc
-from models import Deal, PriceAlert, User
+from sqlalchemy import and_, delete, desc, func, or_
+from sqlalchemy.orm import joinedload
+from models import Deal, DealChange, Game, GameStore, PriceAlert, User, UserWishlist
+from database import replica_read, upsert_insert
 from datetime import datetime, timedelta
+from monitoring import record
+from redis.exceptions import LockError
+from services.alert_index import AlertThresholdIndex, ALERT_KINDS, WISHLIST_KINDS, sync_alert_rows
 import logging
 
 logger = logging.getLogger(__name__)
 
+ALERT_TYPES = ('price', 'discount', 'historical_low')
+
+# Returned by bulk alert writes, enough to keep the threshold index in step
+ALERT_ROW_COLUMNS = (
+    PriceAlert.id, PriceAlert.game_id, PriceAlert.region, PriceAlert.alert_type, PriceAlert.target_price,
+    PriceAlert.target_discount, PriceAlert.is_active, PriceAlert.is_triggered
+)
+
 class PriceService:
     """Service for price-related operations"""
     
-    def __init__(self, db):
+    def __init__(self, db, notification_service=None, alert_index=None):
         self.db = db
+        self.notification_service = notification_service
+        self.alert_index = alert_index
     
+    @replica_read
     def get_price_history(self, game_id, days=30, store_id=None, region='US'):
         """Get price history for a game"""
         try:
@@ -55,100 +71,349 @@ class PriceService:
             logger.error(f"Error getting price history: {str(e)}")
             return {}
     
-    def create_price_alert(self, user_id, game_id, target_price, currency='USD', region='US'):
-        """Create a price alert"""
+    def create_price_alert(self, user_id, game_id, target_price=None, currency='USD', region='US',
+                           alert_type='price', target_discount=None):
+        """Create or update a price alert
+        
+        alert_type is 'price' (fires at or below target_price), 'discount' (at least
+        target_discount percent off) or 'historical_low' (below the lowest price
+        recorded so far, which is stored as its target_price).
+        """
         try:
-            # Check if alert already exists
-            existing_alert = PriceAlert.query.filter_by(
-                user_id=user_id,
-                game_id=game_id,
-                is_active=True
-            ).first()
-            
-            if existing_alert:
-                # Update existing alert
-                existing_alert.target_price = target_price
-                existing_alert.currency = currency
-                existing_alert.region = region
-                existing_alert.updated_at = datetime.utcnow()
-                self.db.session.commit()
-                return existing_alert
-            
-            # Create new alert
-            alert = PriceAlert(
-                user_id=user_id,
-                game_id=game_id,
-                target_price=target_price,
-                currency=currency,
-                region=region
-            )
+            saved = self.save_price_alerts(user_id, [{
+                'game_id': game_id,
+                'alert_type': alert_type,
+                'target_price': target_price,
+                'target_discount': target_discount,
+                'currency': currency,
+                'region': region
+            }])
+            return self.db.session.get(PriceAlert, saved[0].id) if saved else None
+        except ValueError as e:
+            logger.error(f"Error creating price alert: {str(e)}")
+            return None
+    
+    def save_price_alerts(self, user_id, alerts):
+        """Create or update many alerts with one INSERT ... ON CONFLICT; returns the saved rows
+        
+        Alerts are keyed by game and alert type, the last entry for a key wins, and
+        saving an alert re-arms it. Raises ValueError for an invalid entry or a
+        game that doesn't exist.
+        """
+        now = datetime.utcnow()
+        rows = {}
+        for alert in alerts:
+            row = self._alert_row(user_id, alert, now)
+            rows[(row['game_id'], row['alert_type'])] = row
+        
+        if not rows:
+            return []
+        
+        game_ids = {game_id for game_id, _ in rows}
+        known_ids = {game_id for game_id, in self.db.session.query(Game.id).filter(Game.id.in_(game_ids))}
+        if game_ids - known_ids:
+            raise ValueError(f"Unknown game ids: {sorted(game_ids - known_ids)[:20]}")
+        
+        lows = self._lowest_recorded_prices({
+            (row['game_id'], row['region']) for row in rows.values() if row['alert_type'] == 'historical_low'
+        })
+        for row in rows.values():
+            if row['alert_type'] == 'historical_low':
+                row['target_price'] = lows.get((row['game_id'], row['region']))
+        
+        try:
+            insert = upsert_insert(self.db.session, PriceAlert)
+            statement = insert.values(list(rows.values()))
+            statement = statement.on_conflict_do_update(
+                index_elements=['user_id', 'game_id', 'alert_type'],
+                set_={
+                    'target_price': statement.excluded.target_price,
+                    'target_discount': statement.excluded.target_discount,
+                    'currency': statement.excluded.currency,
+                    'region': statement.excluded.region,
+                    'is_active': True,
+                    'is_triggered': False,
+                    'triggered_at': None,
+                    'triggered_price': None,
+                    'triggered_store': None,
+                    'email_sent': False,
+                    'email_sent_at': None,
+                    'updated_at': now
+                }
+            ).returning(*ALERT_ROW_COLUMNS)
             
-            self.db.session.add(alert)
+            saved = self.db.session.execute(statement).all()
             self.db.session.commit()
-            
-            return alert
         except Exception as e:
-            logger.error(f"Error creating price alert: {str(e)}")
+            logger.error(f"Error saving price alerts: {str(e)}")
             self.db.session.rollback()
-            return None
+            return []
+        
+        sync_alert_rows(upserted=saved)
+        return saved
+    
+    def _alert_row(self, user_id, alert, now):
+        """Validate one alert from a request and build its insert row"""
+        try:
+            game_id = int(alert['game_id'])
+            target_price = float(alert['target_price']) if alert.get('target_price') is not None else None
+            target_discount = float(alert['target_discount']) if alert.get('target_discount') is not None else None
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Invalid alert: {alert}")
+        
+        alert_type = alert.get('alert_type') or 'price'
+        if alert_type not in ALERT_TYPES:
+            raise ValueError(f"Unknown alert type: {alert_type}")
+        if alert_type == 'price' and not (target_price and target_price > 0):
+            raise ValueError(f"Price alert for game {game_id} needs a positive target_price")
+        if alert_type == 'discount' and not (target_discount and 0 < target_discount <= 100):
+            raise ValueError(f"Discount alert for game {game_id} needs a target_discount between 0 and 100")
+        
+        return {
+            'user_id': user_id,
+            'game_id': game_id,
+            'alert_type': alert_type,
+            'target_price': target_price if alert_type == 'price' else None,
+            'target_discount': target_discount if alert_type == 'discount' else None,
+            'currency': alert.get('currency') or 'USD',
+            'region': (alert.get('region') or 'US').upper(),
+            'is_active': True,
+            'is_triggered': False,
+            'created_at': now,
+            'updated_at': now
+        }
+    
+    def _lowest_recorded_prices(self, game_keys):
+        """Lowest recorded price per (game_id, region)"""
+        if not game_keys:
+            return {}
+        
+        lows = self.db.session.query(Deal.game_id, Deal.region, func.min(Deal.sale_price)).filter(
+            Deal.game_id.in_({game_id for game_id, _ in game_keys}),
+            Deal.region.in_({region for _, region in game_keys})
+        ).group_by(Deal.game_id, Deal.region).all()
+        
+        return {(game_id, region): low for game_id, region, low in lows}
     
     def check_price_alerts(self):
-        """Check all active price alerts and trigger notifications"""
+        """Evaluate every kind of price alert and wishlist target against changed prices
+        
+        One pass handles absolute price, percent discount and historical low alerts
+        along with wishlist target prices and discounts. Only games whose offers
+        changed since the last check, or whose rules changed, are looked at, and the
+        threshold index picks out just the rules each new best offer fires instead
+        of scanning every alert.
+        """
+        index = self.alert_index or AlertThresholdIndex()
+        dirty_keys = set()
+        
+        lock = index.lock(blocking_timeout=0)
+        if not lock.acquire():
+            # A rebuild is running; this check's changes are picked up by the next one
+            logger.info("Alert threshold index is being rebuilt; skipping this check")
+            return 0
+        
         try:
-            active_alerts = PriceAlert.query.filter_by(
-                is_active=True,
-                is_triggered=False
-            ).all()
+            if not index.is_built():
+                index.rebuild_locked()
             
-            triggered_count = 0
+            # Change ids commit in order (see lock_deal_changes), so every id up to the
+            # highest visible one is committed and the checkpoint can't skip a late commit
+            latest_change_id = self.db.session.query(func.max(DealChange.id)).scalar() or 0
+            last_change_id = index.checkpoint()
+            dirty_keys = index.pop_dirty()
             
-            for alert in active_alerts:
-                # Get current best price for the game
-                best_deal = Deal.query.filter(
-                    Deal.game_id == alert.game_id,
-                    Deal.region == alert.region,
-                    Deal.is_on_sale == True
-                ).order_by(Deal.sale_price).first()
-                
-                if best_deal and best_deal.sale_price <= alert.target_price:
-                    # Trigger alert
-                    alert.is_triggered = True
-                    alert.triggered_at = datetime.utcnow()
-                    alert.triggered_price = best_deal.sale_price
-                    alert.triggered_store = best_deal.store.name if best_deal.store else 'Unknown'
-                    
-                    # Send notification (implement email/push notification here)
-                    self._send_price_alert_notification(alert, best_deal)
-                    
-                    triggered_count += 1
+            if last_change_id is None:
+                # First check after a rebuild: every game with an armed rule, in any region
+                game_keys = {(game_id, region) for game_id, region in self.db.session.query(
+                    PriceAlert.game_id, PriceAlert.region
+                ).filter(
+                    PriceAlert.is_active == True,
+                    PriceAlert.is_triggered == False
+                ).distinct()}
+                game_keys |= {(game_id, None) for game_id, in self.db.session.query(UserWishlist.game_id).filter(
+                    (UserWishlist.target_price.isnot(None)) | (UserWishlist.target_discount.isnot(None))
+                ).distinct()}
+            else:
+                game_keys = set(self.db.session.query(GameStore.game_id, DealChange.region).join(
+                    GameStore, GameStore.id == DealChange.game_store_id
+                ).filter(
+                    DealChange.id > last_change_id,
+                    DealChange.id <= latest_change_id,
+                    DealChange.change_type != 'ended'
+                ).distinct().all())
+            game_keys |= dirty_keys
+            
+            best_offers = self._best_offers(game_keys)
+            matches = index.matching({
+                game_key: {'cheapest': offers['cheapest'].sale_price, 'deepest': offers['deepest'].savings_percentage}
+                for game_key, offers in best_offers.items()
+            })
+            
+            triggered = self._fire_alerts(matches, best_offers)
+            notified = self._fire_wishlist_targets(matches, best_offers)
             
             self.db.session.commit()
+            index.set_checkpoint(max(latest_change_id, last_change_id or 0))
+            
+            # Queue notifications only once the trigger is durable
+            for alert, deal, reason in triggered:
+                self._send_price_alert_notification(alert, deal, reason)
+            for item, deal, reason in notified:
+                self._send_wishlist_notification(item, deal, reason)
             
-            logger.info(f"Checked price alerts: {triggered_count} triggered")
+            triggered_count = len(triggered) + len(notified)
+            record('alerts_checked', len(game_keys))
+            record('alerts_triggered', len(triggered), kind='alert')
+            record('alerts_triggered', len(notified), kind='wishlist')
+            logger.info(f"Checked price alerts for {len(game_keys)} games: {len(triggered)} alerts "
+                        f"and {len(notified)} wishlist targets triggered")
             return triggered_count
         except Exception as e:
             logger.error(f"Error checking price alerts: {str(e)}")
             self.db.session.rollback()
+            try:
+                index.mark_dirty(dirty_keys)
+            except Exception:
+                pass
             return 0
+        finally:
+            try:
+                lock.release()
+            except LockError:
+                logger.warning("Alert check outlived its index lock")
+    
+    def _best_offers(self, game_keys, chunk_size=500):
+        """Cheapest and deepest-discounted on-sale offer per (game_id, region)
+        
+        A key with region None stands for the game in every region.
+        """
+        best_offers = {}
+        game_ids = sorted({game_id for game_id, _ in game_keys})
+        
+        for start in range(0, len(game_ids), chunk_size):
+            offers = GameStore.query.options(joinedload(GameStore.store), joinedload(GameStore.game)).filter(
+                GameStore.game_id.in_(game_ids[start:start + chunk_size]),
+                GameStore.is_on_sale == True,
+                GameStore.current_price.isnot(None)
+            ).all()
+            
+            for offer in offers:
+                game_key = (offer.game_id, offer.region)
+                if game_key not in game_keys and (offer.game_id, None) not in game_keys:
+                    continue
+                
+                best = best_offers.setdefault(game_key, {'cheapest': offer, 'deepest': offer})
+                if offer.sale_price < best['cheapest'].sale_price:
+                    best['cheapest'] = offer
+                if offer.savings_percentage > best['deepest'].savings_percentage:
+                    best['deepest'] = offer
+        
+        return best_offers
+    
+    def _fire_alerts(self, matches, best_offers):
+        """Trigger the matched PriceAlerts that still hold in the database"""
+        alert_ids = {alert_id for kind in ALERT_KINDS for alert_ids in matches[kind].values() for alert_id in alert_ids}
+        alerts = PriceAlert.query.filter(PriceAlert.id.in_(alert_ids)).all() if alert_ids else []
+        
+        triggered = []
+        for alert in alerts:
+            # The index can briefly lag the database, so confirm before firing
+            offers = best_offers.get((alert.game_id, alert.region))
+            if not offers or not alert.is_active or alert.is_triggered:
+                continue
+            
+            alert_type = alert.alert_type or 'price'
+            cheapest, deepest = offers['cheapest'], offers['deepest']
+            if alert_type == 'discount':
+                if alert.target_discount is None or deepest.savings_percentage < alert.target_discount:
+                    continue
+                deal, reason = deepest, f"{deepest.savings_percentage:.0f}% off, your target: {alert.target_discount:.0f}%"
+            elif alert_type == 'historical_low':
+                if alert.target_price is not None and cheapest.sale_price >= alert.target_price:
+                    continue
+                deal = cheapest
+                reason = f"new lowest price, previously ${alert.target_price:.2f}" \
+                    if alert.target_price is not None else "first recorded price"
+            else:
+                if alert.target_price is None or cheapest.sale_price > alert.target_price:
+                    continue
+                deal, reason = cheapest, f"your target: ${alert.target_price:.2f}"
+            
+            alert.is_triggered = True
+            alert.triggered_at = datetime.utcnow()
+            alert.triggered_price = deal.sale_price
+            alert.triggered_store = deal.store.name if deal.store else 'Unknown'
+            
+            triggered.append((alert, deal, reason))
+        
+        return triggered
+    
+    def _fire_wishlist_targets(self, matches, best_offers):
+        """Mark matched wishlist items whose targets are met in their owner's region"""
+        item_ids = {item_id for kind in WISHLIST_KINDS for item_ids in matches[kind].values() for item_id in item_ids}
+        items = UserWishlist.query.options(joinedload(UserWishlist.user)).filter(
+            UserWishlist.id.in_(item_ids)
+        ).all() if item_ids else []
+        
+        notified = []
+        for item in items:
+            offers = best_offers.get((item.game_id, item.user.preferred_region or 'US'))
+            if not offers:
+                continue
+            
+            cheapest, deepest = offers['cheapest'], offers['deepest']
+            if item.target_price is not None and cheapest.sale_price <= item.target_price:
+                deal, reason = cheapest, f"wishlist target: ${item.target_price:.2f}"
+            elif item.target_discount is not None and deepest.savings_percentage >= item.target_discount:
+                deal, reason = deepest, f"{deepest.savings_percentage:.0f}% off, wishlist target: {item.target_discount:.0f}%"
+            else:
+                continue
+            
+            # Stay quiet until the price drops below the one already notified
+            if item.notified_price is not None and deal.sale_price >= item.notified_price:
+                continue
+            
+            item.notified_at = datetime.utcnow()
+            item.notified_price = deal.sale_price
+            notified.append((item, deal, reason))
+        
+        return notified
     
-    def _send_price_alert_notification(self, alert, deal):
-        """Send price alert notification to user"""
+    def _send_price_alert_notification(self, alert, deal, reason=None):
+        """Queue a price alert notification; the dispatcher sends and marks it"""
         try:
-            # This would integrate with email service or push notifications
+            if self.notification_service is None:
+                from services.notification_service import NotificationService
+                self.notification_service = NotificationService(self.db)
+            
+            self.notification_service.enqueue_price_alert(alert, deal, reason)
+            
             logger.info(f"Price alert triggered for user {alert.user_id}: "
                        f"Game {alert.game_id} now ${deal.sale_price} at {deal.store.name}")
+        
+        except Exception as e:
+            logger.error(f"Error sending price alert notification: {str(e)}")
+    
+    def _send_wishlist_notification(self, item, deal, reason):
+        """Queue a wishlist target notification"""
+        try:
+            if self.notification_service is None:
+                from services.notification_service import NotificationService
+                self.notification_service = NotificationService(self.db)
             
-            # Mark email as sent
-            alert.email_sent = True
-            alert.email_sent_at = datetime.utcnow()
+            self.notification_service.enqueue_wishlist_target(item, deal, reason)
             
+            logger.info(f"Wishlist target met for user {item.user_id}: "
+                       f"Game {item.game_id} now ${deal.sale_price} at {deal.store.name}")
+        
         except Exception as e:
-            logger.error(f"Error sending price alert notification: {str(e)}")
+            logger.error(f"Error sending wishlist notification: {str(e)}")
     
     def get_user_alerts(self, user_id, active_only=True):
         """Get price alerts for a user"""
         try:
-            alerts_query = PriceAlert.query.filter_by(user_id=user_id)
+            alerts_query = PriceAlert.query.options(joinedload(PriceAlert.game)).filter_by(user_id=user_id)
             
             if active_only:
                 alerts_query = alerts_query.filter_by(is_active=True)
@@ -162,23 +427,34 @@ class PriceService:
     
     def delete_price_alert(self, alert_id, user_id):
         """Delete a price alert"""
+        return self.delete_price_alerts(user_id, alert_ids=[alert_id]) > 0
+    
+    def delete_price_alerts(self, user_id, alert_ids=None, game_ids=None):
+        """Delete a user's alerts by id and/or by game with one statement; returns how many"""
+        if not alert_ids and not game_ids:
+            return 0
+        
         try:
-            alert = PriceAlert.query.filter_by(
-                id=alert_id,
-                user_id=user_id
-            ).first()
-            
-            if alert:
-                self.db.session.delete(alert)
-                self.db.session.commit()
-                return True
+            conditions = []
+            if alert_ids:
+                conditions.append(PriceAlert.id.in_(alert_ids))
+            if game_ids:
+                conditions.append(PriceAlert.game_id.in_(game_ids))
             
-            return False
+            deleted = self.db.session.execute(
+                delete(PriceAlert).where(PriceAlert.user_id == user_id, or_(*conditions))
+                .returning(*ALERT_ROW_COLUMNS)
+            ).all()
+            self.db.session.commit()
         except Exception as e:
-            logger.error(f"Error deleting price alert: {str(e)}")
+            logger.error(f"Error deleting price alerts: {str(e)}")
             self.db.session.rollback()
-            return False
+            return 0
+        
+        sync_alert_rows(deleted=deleted)
+        return len(deleted)
     
+    @replica_read
     def get_lowest_price(self, game_id, region='US', days=30):
         """Get the lowest price for a game in the specified period"""
         try:
@@ -0,0 +1,59 @@
+"""
+Shared Redis client for scheduling and background coordination
+"""
+
+import os
+import redis
+
+_client = None
+_async_client = None
+_scripts = {}
+
+# Atomically claim up to ARGV[2] members whose score is <= ARGV[1] by rescoring them to ARGV[3]
+_LEASE_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, member in ipairs(due) do
+    redis.call('ZADD', KEYS[1], 'XX', ARGV[3], member)
+end
+return due
+"""
+
+def get_redis():
+    """Get the process-wide Redis client (connects lazily on first command)"""
+    global _client
+    
+    if _client is None:
+        _client = redis.Redis.from_url(
+            os.getenv('REDIS_URL', 'redis://localhost:6379'),
+            decode_responses=True
+        )
+    
+    return _client
+
+def get_async_redis():
+    """Get the process-wide asyncio Redis client for the async read API"""
+    global _async_client
+    
+    if _async_client is None:
+        import redis.asyncio
+        
+        _async_client = redis.asyncio.Redis.from_url(
+            os.getenv('REDIS_URL', 'redis://localhost:6379'),
+            decode_responses=True
+        )
+    
+    return _async_client
+
+def _script(redis_client, source):
+    script = _scripts.get((id(redis_client), source))
+    if script is None:
+        script = _scripts[(id(redis_client), source)] = redis_client.register_script(source)
+    return script
+
+def lease_due(redis_client, key, until, count, lease_until):
+    """Claim up to `count` members scored at or before `until`, rescoring them to `lease_until`
+    
+    The claimer removes or reschedules each member once it is handled; if it dies
+    first, the member comes due again when the lease runs out.
+    """
+    return _script(redis_client, _LEASE_DUE_SCRIPT)(keys=[key], args=[until, count, lease_until])
@@ -0,0 +1,219 @@
+"""
+Priority-based refresh scheduling for per-game price polling
+"""
+
+from sqlalchemy import func
+from models import GameStore, UserWishlist, PriceAlert
+from services.redis_client import get_redis, lease_due
+from datetime import datetime, timedelta
+import logging
+import math
+import os
+
+logger = logging.getLogger(__name__)
+
+class RefreshScheduler:
+    """Assigns each GameStore row a next-check time and hands out due rows in batches"""
+    
+    DUE_KEY = 'refresh:due'
+    VIEWS_KEY_PREFIX = 'refresh:views:'
+    
+    # Claimed rows come due again after this long if their worker dies mid-batch
+    CLAIM_SECONDS = 900
+    
+    # Priority weights per signal
+    WISHLIST_WEIGHT = 2.0
+    ALERT_WEIGHT = 5.0
+    VOLATILITY_WEIGHT = 10.0
+    VIEW_WEIGHT = 0.1
+    
+    def __init__(self, db, redis_client=None):
+        self.db = db
+        self.redis = redis_client or get_redis()
+        self.min_interval = timedelta(seconds=int(os.getenv('PRICE_REFRESH_MIN_INTERVAL_SECONDS', 60)))
+        self.max_interval = timedelta(hours=int(os.getenv('PRICE_REFRESH_MAX_INTERVAL_HOURS', 24)))
+    
+    def record_view(self, game_id):
+        """Count a game page view towards its refresh priority"""
+        try:
+            key = self._views_key(datetime.utcnow())
+            pipe = self.redis.pipeline()
+            pipe.hincrby(key, game_id, 1)
+            pipe.expire(key, 2 * 24 * 3600)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Error recording view for game {game_id}: {str(e)}")
+    
+    def compute_priority(self, wishlist_count=0, alert_count=0, volatility=0, views=0):
+        """Combine demand and volatility signals into a single priority score"""
+        return (self.WISHLIST_WEIGHT * wishlist_count +
+                self.ALERT_WEIGHT * alert_count +
+                self.VOLATILITY_WEIGHT * (volatility or 0) +
+                self.VIEW_WEIGHT * views)
+    
+    def interval_for(self, priority):
+        """Map a priority score to a polling interval between the min and max"""
+        interval = self.max_interval / (1 + max(priority or 0, 0))
+        return max(interval, self.min_interval)
+    
+    def next_check_for(self, last_price_check, priority):
+        """Get the next time a row should be polled"""
+        if not last_price_check:
+            return datetime.utcnow()
+        return last_price_check + self.interval_for(priority)
+    
+    def reschedule_all(self, batch_size=1000):
+        """Recompute priorities for every GameStore row and load them into the due set"""
+        try:
+            scheduled_count = 0
+            last_id = 0
+            
+            while True:
+                rows = self.db.session.query(
+                    GameStore.id,
+                    GameStore.game_id,
+                    GameStore.price_volatility,
+                    GameStore.last_price_check
+                ).filter(
+                    GameStore.id > last_id
+                ).order_by(GameStore.id).limit(batch_size).all()
+                
+                if not rows:
+                    break
+                
+                last_id = rows[-1].id
+                game_ids = list({row.game_id for row in rows})
+                wishlist_counts = self._wishlist_counts(game_ids)
+                alert_counts = self._alert_counts(game_ids)
+                view_counts = self._view_counts(game_ids)
+                
+                mappings = []
+                due = {}
+                for row in rows:
+                    priority = self.compute_priority(
+                        wishlist_count=wishlist_counts.get(row.game_id, 0),
+                        alert_count=alert_counts.get(row.game_id, 0),
+                        volatility=row.price_volatility,
+                        views=view_counts.get(row.game_id, 0)
+                    )
+                    next_check = self.next_check_for(row.last_price_check, priority)
+                    
+                    mappings.append({
+                        'id': row.id,
+                        'refresh_priority': priority,
+                        'next_price_check': next_check
+                    })
+                    due[row.id] = self._timestamp(next_check)
+                
+                self.db.session.bulk_update_mappings(GameStore, mappings)
+                self.db.session.commit()
+                self.redis.zadd(self.DUE_KEY, due)
+                
+                scheduled_count += len(rows)
+            
+            logger.info(f"Scheduled {scheduled_count} price checks")
+            return scheduled_count
+        except Exception as e:
+            logger.error(f"Error scheduling price checks: {str(e)}")
+            self.db.session.rollback()
+            return 0
+    
+    def claim_due(self, batch_size=50):
+        """Claim a batch of GameStore ids whose next check is due
+        
+        Claimed ids stay in the due set under a lease until _reschedule scores their
+        next check, so a batch lost with its worker is picked up again.
+        """
+        now = self._timestamp(datetime.utcnow())
+        return [int(member) for member in lease_due(
+            self.redis, self.DUE_KEY, now, batch_size, now + self.CLAIM_SECONDS
+        )]
+    
+    def refresh_due(self, batch_size=50, max_batches=10):
+        """Refresh due prices in batches and schedule each row's next check"""
+        from services.external_apis import PriceUpdateService
+        
+        price_update_service = PriceUpdateService(self.db)
+        refreshed_count = 0
+        
+        for _ in range(max_batches):
+            game_store_ids = self.claim_due(batch_size)
+            if not game_store_ids:
+                break
+            
+            try:
+                refreshed_count += price_update_service.refresh_game_store_prices(game_store_ids)
+            finally:
+                # Release the lease with each row's next check, even when the batch failed
+                self._reschedule(game_store_ids)
+        
+        return refreshed_count
+    
+    def _reschedule(self, game_store_ids):
+        """Schedule the next check for rows that were just polled"""
+        rows = self.db.session.query(
+            GameStore.id,
+            GameStore.refresh_priority
+        ).filter(GameStore.id.in_(game_store_ids)).all()
+        
+        now = datetime.utcnow()
+        due = {}
+        mappings = []
+        for row in rows:
+            next_check = now + self.interval_for(row.refresh_priority)
+            due[row.id] = self._timestamp(next_check)
+            mappings.append({'id': row.id, 'next_price_check': next_check})
+        
+        if due:
+            self.db.session.bulk_update_mappings(GameStore, mappings)
+            self.db.session.commit()
+            self.redis.zadd(self.DUE_KEY, due)
+        
+        # Rows deleted since they were scheduled would otherwise be leased forever
+        gone = set(game_store_ids) - set(due)
+        if gone:
+            self.redis.zrem(self.DUE_KEY, *gone)
+    
+    def _wishlist_counts(self, game_ids):
+        """Get wishlist counts per game"""
+        return dict(self.db.session.query(
+            UserWishlist.game_id,
+            func.count(UserWishlist.id)
+        ).filter(
+            UserWishlist.game_id.in_(game_ids)
+        ).group_by(UserWishlist.game_id).all())
+    
+    def _alert_counts(self, game_ids):
+        """Get active, untriggered alert counts per game"""
+        return dict(self.db.session.query(
+            PriceAlert.game_id,
+            func.count(PriceAlert.id)
+        ).filter(
+            PriceAlert.game_id.in_(game_ids),
+            PriceAlert.is_active == True,
+            PriceAlert.is_triggered == False
+        ).group_by(PriceAlert.game_id).all())
+    
+    def _view_counts(self, game_ids):
+        """Get page views per game over roughly the last day"""
+        try:
+            now = datetime.utcnow()
+            pipe = self.redis.pipeline()
+            pipe.hmget(self._views_key(now), game_ids)
+            pipe.hmget(self._views_key(now - timedelta(days=1)), game_ids)
+            today, yesterday = pipe.execute()
+            
+            return {
+                game_id: int(today[i] or 0) + int(yesterday[i] or 0)
+                for i, game_id in enumerate(game_ids)
+            }
+        except Exception as e:
+            logger.warning(f"Error reading page views: {str(e)}")
+            return {}
+    
+    def _views_key(self, when):
+        return f"{self.VIEWS_KEY_PREFIX}{when.strftime('%Y%m%d')}"
+    
+    @staticmethod
+    def _timestamp(when):
+        return math.floor((when - datetime(1970, 1, 1)).total_seconds())
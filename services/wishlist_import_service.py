@@ -0,0 +1,255 @@
+"""
+Steam wishlist and library imports
+"""
+
+from sqlalchemy.exc import IntegrityError
+from models import Game, UserWishlist, WishlistImport
+from database import upsert_insert
+from datetime import datetime
+from services.catalog_version import bump_versions
+from services.external_apis import SteamAPI
+from services.redis_client import get_redis
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+IMPORT_SOURCES = ('file', 'wishlist', 'library')
+
+def _entry(app_id, name=None, added=None):
+    app_id = int(app_id)
+    if app_id <= 0:
+        raise ValueError(f"Invalid Steam app id: {app_id}")
+    return {'app_id': app_id, 'name': name or None, 'added': int(added) if added else None}
+
+def parse_steam_export(data):
+    """Normalize a Steam wishlist or library export to [{'app_id', 'name', 'added'}]
+    
+    Accepts Web API responses (GetWishlist items, GetOwnedGames games), the
+    store's wishlistdata object keyed by app id, dynamicstore userdata
+    (rgWishlist) and plain lists of app ids or {"appid"} objects. Duplicate
+    app ids are dropped. Raises ValueError for anything else.
+    """
+    if isinstance(data, dict):
+        response = data.get('response')
+        if isinstance(response, dict):
+            data = response.get('items', response.get('games', []))
+        elif 'rgWishlist' in data:
+            data = data['rgWishlist']
+        else:
+            data = [dict(value if isinstance(value, dict) else {}, appid=key) for key, value in data.items()]
+    
+    if not isinstance(data, list):
+        raise ValueError('Unrecognized Steam export format')
+    
+    entries = {}
+    try:
+        for item in data:
+            if isinstance(item, dict):
+                app_id = item.get('appid', item.get('app_id'))
+                entry = _entry(app_id, item.get('name'), item.get('date_added') or item.get('added'))
+            else:
+                entry = _entry(item)
+            entries.setdefault(entry['app_id'], entry)
+    except (TypeError, ValueError):
+        raise ValueError('Unrecognized Steam export format')
+    
+    return list(entries.values())
+
+class WishlistImportService:
+    """Imports Steam wishlists and libraries into user wishlists in batches
+    
+    App ids are resolved to games with one query per batch, games not yet in the
+    catalogue are created with one INSERT, and wishlist rows are added with one
+    INSERT ... ON CONFLICT DO NOTHING, so re-running an import is harmless.
+    """
+    
+    ENTRIES_KEY_PREFIX = 'wishlist_import:entries:'
+    ENTRIES_TTL_SECONDS = 86400
+    
+    def __init__(self, db, redis_client=None, steam_api=None):
+        self.db = db
+        self.redis = redis_client or get_redis()
+        self.steam_api = steam_api
+        self.max_items = int(os.getenv('WISHLIST_IMPORT_MAX_ITEMS', 10000))
+    
+    def create_import(self, user_id, source, entries=None, steam_id=None):
+        """Record a pending import; uploaded entries are parked in Redis for the worker
+        
+        Raises ValueError if the request is invalid or the user already has an
+        import in progress.
+        """
+        if source not in IMPORT_SOURCES:
+            raise ValueError(f"Unknown import source: {source}")
+        if source == 'file' and not entries:
+            raise ValueError('The export contains no games')
+        if source != 'file' and not (steam_id and str(steam_id).isdigit() and len(str(steam_id)) == 17):
+            raise ValueError('steam_id must be a 64-bit Steam ID (17 digits)')
+        if entries and len(entries) > self.max_items:
+            raise ValueError(f"At most {self.max_items} games per import")
+        
+        in_progress = WishlistImport.query.filter(
+            WishlistImport.user_id == user_id,
+            WishlistImport.status.in_(['pending', 'running'])
+        ).first()
+        if in_progress:
+            raise ValueError('An import is already in progress')
+        
+        wishlist_import = WishlistImport(
+            user_id=user_id,
+            source=source,
+            steam_id=str(steam_id) if steam_id else None,
+            status='pending',
+            total_count=len(entries) if entries else 0
+        )
+        self.db.session.add(wishlist_import)
+        self.db.session.commit()
+        
+        if entries:
+            self.redis.set(f"{self.ENTRIES_KEY_PREFIX}{wishlist_import.id}", json.dumps(entries),
+                           ex=self.ENTRIES_TTL_SECONDS)
+        
+        return wishlist_import
+    
+    def get_import(self, import_id, user_id):
+        return WishlistImport.query.filter_by(id=import_id, user_id=user_id).first()
+    
+    def run(self, import_id, batch_size=500, progress=None):
+        """Run an import, committing and reporting progress after every batch
+        
+        `progress` is called with (processed, total). Safe to run again after a
+        failure: batches already imported are skipped by the conflict clauses.
+        """
+        wishlist_import = self.db.session.get(WishlistImport, import_id)
+        if wishlist_import is None or wishlist_import.status == 'completed':
+            return wishlist_import
+        
+        try:
+            wishlist_import.status = 'running'
+            wishlist_import.started_at = wishlist_import.started_at or datetime.utcnow()
+            wishlist_import.error = None
+            self.db.session.commit()
+            
+            entries = self._load_entries(wishlist_import)
+            if entries is None:
+                return self._finish(wishlist_import, 'failed', 'Could not read the Steam wishlist or library')
+            
+            wishlist_import.total_count = len(entries)
+            wishlist_import.processed_count = 0
+            wishlist_import.created_games = 0
+            wishlist_import.added_count = 0
+            self.db.session.commit()
+            
+            for start in range(0, len(entries), batch_size):
+                batch = entries[start:start + batch_size]
+                game_ids, created_count = self._resolve_games(batch)
+                added_count = self._add_to_wishlist(wishlist_import.user_id, batch, game_ids)
+                
+                wishlist_import.processed_count += len(batch)
+                wishlist_import.created_games += created_count
+                wishlist_import.added_count += added_count
+                self.db.session.commit()
+                
+                if created_count:
+                    bump_versions([None])
+                if progress:
+                    progress(wishlist_import.processed_count, wishlist_import.total_count)
+            
+            self.redis.delete(f"{self.ENTRIES_KEY_PREFIX}{import_id}")
+            return self._finish(wishlist_import, 'completed')
+        except Exception as e:
+            logger.error(f"Error running wishlist import {import_id}: {str(e)}")
+            self.db.session.rollback()
+            self._finish(self.db.session.get(WishlistImport, import_id), 'failed', str(e))
+            raise
+    
+    def _finish(self, wishlist_import, status, error=None):
+        wishlist_import.status = status
+        wishlist_import.error = error
+        wishlist_import.finished_at = datetime.utcnow()
+        self.db.session.commit()
+        return wishlist_import
+    
+    def _load_entries(self, wishlist_import):
+        """The import's entries: the uploaded export, or the user's list fetched from Steam"""
+        if wishlist_import.source == 'file':
+            raw = self.redis.get(f"{self.ENTRIES_KEY_PREFIX}{wishlist_import.id}")
+            return json.loads(raw) if raw else None
+        
+        steam_api = self.steam_api or SteamAPI()
+        if wishlist_import.source == 'library':
+            items = steam_api.get_owned_games(wishlist_import.steam_id)
+        else:
+            items = steam_api.get_wishlist(wishlist_import.steam_id)
+        if items is None:
+            return None
+        
+        return parse_steam_export(items)[:self.max_items]
+    
+    def _resolve_games(self, batch):
+        """Map a batch's app ids to game ids, creating missing games; returns (ids, created count)"""
+        app_ids = [entry['app_id'] for entry in batch]
+        game_ids = dict(self.db.session.query(Game.steam_app_id, Game.id).filter(Game.steam_app_id.in_(app_ids)))
+        
+        missing = [entry for entry in batch if entry['app_id'] not in game_ids]
+        if not missing:
+            return game_ids, 0
+        
+        names = {entry['app_id']: entry['name'] for entry in missing if entry['name']}
+        unnamed = [entry['app_id'] for entry in missing if not entry['name']]
+        if unnamed:
+            names.update((self.steam_api or SteamAPI()).get_app_names(unnamed))
+        
+        rows = []
+        for entry in missing:
+            title = (names.get(entry['app_id']) or f"Steam App {entry['app_id']}")[:255]
+            slug = title.lower().replace(' ', '-').replace(':', '').replace("'", '')
+            rows.append({'title': title, 'slug': slug, 'steam_app_id': entry['app_id']})
+        
+        # Titles shared with existing games or within the batch get the app id appended
+        taken = {slug for slug, in self.db.session.query(Game.slug).filter(Game.slug.in_([row['slug'] for row in rows]))}
+        for row in rows:
+            if row['slug'] in taken:
+                row['slug'] = f"{row['slug']}-{row['steam_app_id']}"[:255]
+            taken.add(row['slug'])
+        
+        # Games created concurrently by another import or the price updater are skipped and
+        # looked up below. A slug taken concurrently fails the insert, so it is retried once
+        # with every slug made unique by its app id
+        try:
+            with self.db.session.begin_nested():
+                created_count = self._insert_games(rows)
+        except IntegrityError:
+            for row in rows:
+                suffix = f"-{row['steam_app_id']}"
+                if not row['slug'].endswith(suffix):
+                    row['slug'] = f"{row['slug']}{suffix}"[:255]
+            created_count = self._insert_games(rows)
+        
+        game_ids.update(self.db.session.query(Game.steam_app_id, Game.id).filter(
+            Game.steam_app_id.in_([row['steam_app_id'] for row in rows])
+        ))
+        return game_ids, created_count
+    
+    def _insert_games(self, rows):
+        """Insert games unless their app id exists; returns how many were created"""
+        insert = upsert_insert(self.db.session, Game)
+        statement = insert.values(rows).on_conflict_do_nothing(index_elements=['steam_app_id'])
+        return len(self.db.session.execute(statement.returning(Game.id)).all())
+    
+    def _add_to_wishlist(self, user_id, batch, game_ids):
+        """Add a batch's games to the user's wishlist; returns how many were new"""
+        rows = {}
+        for entry in batch:
+            game_id = game_ids.get(entry['app_id'])
+            if game_id is not None:
+                added_at = datetime.utcfromtimestamp(entry['added']) if entry['added'] else datetime.utcnow()
+                rows.setdefault(game_id, {'user_id': user_id, 'game_id': game_id, 'added_at': added_at})
+        
+        if not rows:
+            return 0
+        
+        insert = upsert_insert(self.db.session, UserWishlist)
+        statement = insert.values(list(rows.values())).on_conflict_do_nothing(index_elements=['user_id', 'game_id'])
+        return len(self.db.session.execute(statement.returning(UserWishlist.id)).all())
@@ -0,0 +1,239 @@
+"""
+Wishlist service for reading and reconciling user wishlists
+"""
+
+from sqlalchemy import and_, case, delete, desc, func, select
+from models import Game, GameStore, PriceAlert, Store, UserWishlist
+from database import replica_read, upsert_insert
+from datetime import datetime
+from services.alert_index import sync_wishlist_rows
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Per-item fields a client may set; anything it leaves out keeps its server value
+WISHLIST_FIELDS = ('priority', 'notes', 'target_price', 'target_discount')
+
+# Columns returned by bulk writes, enough to keep the alert threshold index in step
+WISHLIST_ROW_COLUMNS = (UserWishlist.id, UserWishlist.game_id, UserWishlist.target_price, UserWishlist.target_discount)
+
+class WishlistService:
+    """Service for wishlist-related operations"""
+    
+    def __init__(self, db):
+        self.db = db
+    
+    @replica_read
+    def get_items(self, user_id):
+        """A user's wishlist entries, newest first"""
+        return self._items(user_id)
+    
+    def _items(self, user_id):
+        return self.db.session.query(
+            UserWishlist.game_id,
+            UserWishlist.priority,
+            UserWishlist.notes,
+            UserWishlist.target_price,
+            UserWishlist.target_discount,
+            UserWishlist.added_at
+        ).filter(UserWishlist.user_id == user_id).order_by(desc(UserWishlist.added_at), UserWishlist.game_id).all()
+    
+    def _best_offers(self, user_id, region):
+        """Subquery of the cheapest current offer per wishlisted game, with whether any offer is on sale"""
+        ranked = select(
+            GameStore.game_id,
+            GameStore.store_id,
+            GameStore.current_price,
+            GameStore.original_price,
+            GameStore.discount_percentage,
+            GameStore.store_url,
+            func.max(case((GameStore.is_on_sale == True, 1), else_=0)).over(
+                partition_by=GameStore.game_id
+            ).label('on_sale'),
+            func.row_number().over(
+                partition_by=GameStore.game_id,
+                order_by=(GameStore.current_price, GameStore.id)
+            ).label('price_rank')
+        ).join(
+            UserWishlist, and_(UserWishlist.game_id == GameStore.game_id, UserWishlist.user_id == user_id)
+        ).where(
+            GameStore.region == region,
+            GameStore.is_available == True,
+            GameStore.current_price.isnot(None)
+        ).subquery()
+        
+        return select(ranked).where(ranked.c.price_rank == 1).subquery()
+    
+    @replica_read
+    def get_page(self, user_id, region='US', page=1, per_page=24):
+        """One page of a user's wishlist with each game's best current offer, newest first"""
+        try:
+            best = self._best_offers(user_id, region)
+            return self.db.session.query(
+                UserWishlist.game_id,
+                UserWishlist.priority,
+                UserWishlist.target_price,
+                UserWishlist.target_discount,
+                UserWishlist.added_at,
+                Game.title,
+                Game.developer,
+                Game.cover_image_url,
+                Game.metacritic_score,
+                best.c.current_price.label('best_price'),
+                best.c.original_price.label('normal_price'),
+                best.c.discount_percentage.label('discount'),
+                best.c.store_url.label('deal_url'),
+                func.coalesce(best.c.on_sale, 0).label('is_on_sale'),
+                Store.name.label('store_name')
+            ).join(
+                Game, Game.id == UserWishlist.game_id
+            ).outerjoin(
+                best, best.c.game_id == UserWishlist.game_id
+            ).outerjoin(
+                Store, Store.id == best.c.store_id
+            ).filter(
+                UserWishlist.user_id == user_id
+            ).order_by(
+                desc(UserWishlist.added_at), UserWishlist.game_id
+            ).offset((page - 1) * per_page).limit(per_page).all()
+        except Exception as e:
+            logger.error(f"Error getting wishlist page: {str(e)}")
+            return []
+    
+    @replica_read
+    def get_stats(self, user_id, region='US'):
+        """Game, on-sale and active alert counts and the summed best prices, in one query"""
+        try:
+            best = self._best_offers(user_id, region)
+            active_alerts = select(func.count(PriceAlert.id)).where(
+                PriceAlert.user_id == user_id,
+                PriceAlert.is_active == True
+            ).scalar_subquery()
+            
+            total_games, on_sale, total_value, price_alerts = self.db.session.query(
+                func.count(UserWishlist.id),
+                func.coalesce(func.sum(best.c.on_sale), 0),
+                func.coalesce(func.sum(best.c.current_price), 0),
+                active_alerts
+            ).outerjoin(
+                best, best.c.game_id == UserWishlist.game_id
+            ).filter(UserWishlist.user_id == user_id).one()
+            
+            return {
+                'total_games': total_games,
+                'on_sale': on_sale,
+                'price_alerts': price_alerts,
+                'total_value': round(total_value, 2)
+            }
+        except Exception as e:
+            logger.error(f"Error getting wishlist stats: {str(e)}")
+            return {}
+    
+    def sync(self, user_id, add=(), update=(), remove=()):
+        """Apply a client's wishlist diff with set-based statements; returns the canonical wishlist
+        
+        `add` holds game ids or {"game_id", ...fields} entries, `update` holds
+        entries whose fields change. Both are upserts keyed by game, so adding a
+        game that is already listed only applies the fields given. A game in
+        `remove` is removed even if the diff also adds it, and unknown games are
+        ignored. Raises ValueError for an invalid entry, returns None if the
+        changes could not be saved.
+        """
+        now = datetime.utcnow()
+        rows = {}
+        for entry in (*add, *update):
+            row = self._wishlist_row(entry)
+            rows.setdefault(row['game_id'], {}).update(row)
+        
+        try:
+            removed_ids = {int(game_id) for game_id in remove}
+        except (TypeError, ValueError):
+            raise ValueError('remove must be a list of game ids')
+        
+        for game_id in removed_ids:
+            rows.pop(game_id, None)
+        
+        try:
+            if rows:
+                known_ids = {game_id for game_id, in self.db.session.query(Game.id).filter(Game.id.in_(list(rows)))}
+                rows = {game_id: row for game_id, row in rows.items() if game_id in known_ids}
+            
+            saved = []
+            for fields, group in self._group_by_fields(rows.values()).items():
+                saved.extend(self._upsert(user_id, fields, group, now))
+            
+            deleted = []
+            if removed_ids:
+                deleted = self.db.session.execute(
+                    delete(UserWishlist).where(
+                        UserWishlist.user_id == user_id,
+                        UserWishlist.game_id.in_(removed_ids)
+                    ).returning(*WISHLIST_ROW_COLUMNS)
+                ).all()
+            
+            self.db.session.commit()
+        except Exception as e:
+            logger.error(f"Error syncing wishlist: {str(e)}")
+            self.db.session.rollback()
+            return None
+        
+        sync_wishlist_rows(upserted=saved, deleted=deleted)
+        
+        # Read back from the primary session that just wrote, not a lagging replica
+        return self._items(user_id)
+    
+    @staticmethod
+    def _group_by_fields(rows):
+        """Rows in one multi-row INSERT must set the same columns"""
+        groups = {}
+        for row in rows:
+            fields = tuple(field for field in WISHLIST_FIELDS if field in row)
+            groups.setdefault(fields, []).append(row)
+        return groups
+    
+    def _upsert(self, user_id, fields, group, now):
+        """Insert or update one group of entries that set the same fields"""
+        insert = upsert_insert(self.db.session, UserWishlist)
+        statement = insert.values([
+            {'user_id': user_id, 'added_at': now, **row} for row in group
+        ])
+        if not fields:
+            statement = statement.on_conflict_do_nothing(index_elements=['user_id', 'game_id'])
+        else:
+            set_ = {field: getattr(statement.excluded, field) for field in fields}
+            if 'target_price' in fields or 'target_discount' in fields:
+                # A new target is a new rule, so it may notify again
+                set_.update(notified_at=None, notified_price=None)
+            statement = statement.on_conflict_do_update(index_elements=['user_id', 'game_id'], set_=set_)
+        
+        return self.db.session.execute(statement.returning(*WISHLIST_ROW_COLUMNS)).all()
+    
+    @staticmethod
+    def _wishlist_row(entry):
+        """Validate one wishlist entry from a request and build its row"""
+        if not isinstance(entry, dict):
+            entry = {'game_id': entry}
+        
+        try:
+            row = {'game_id': int(entry['game_id'])}
+            if entry.get('priority') is not None:
+                row['priority'] = int(entry['priority'])
+            for field in ('target_price', 'target_discount'):
+                if field in entry:
+                    row[field] = float(entry[field]) if entry[field] is not None else None
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Invalid wishlist entry: {entry}")
+        
+        if 'notes' in entry:
+            if entry['notes'] is not None and not isinstance(entry['notes'], str):
+                raise ValueError(f"Notes for game {row['game_id']} must be a string")
+            row['notes'] = entry['notes'] or None
+        
+        if row.get('priority') is not None and row['priority'] not in (1, 2, 3):
+            raise ValueError(f"Priority for game {row['game_id']} must be 1, 2 or 3")
+        if row.get('target_price') is not None and row['target_price'] <= 0:
+            raise ValueError(f"Target price for game {row['game_id']} must be positive")
+        if row.get('target_discount') is not None and not 0 < row['target_discount'] <= 100:
+            raise ValueError(f"Target discount for game {row['game_id']} must be between 0 and 100")
+        
+        return row
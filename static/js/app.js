@@ -6,7 +6,8 @@
 window.GameTracker = {
     // Configuration
     config: {
-        apiBaseUrl: '/api',
+        // Read endpoints may be served by the async API on another origin
+        apiBaseUrl: document.querySelector('meta[name="api-base-url"]')?.content || '/api',
         refreshInterval: 300000, // 5 minutes
         notificationDuration: 3000 // 3 seconds
     },
@@ -16,7 +17,10 @@ window.GameTracker = {
         currentRegion: localStorage.getItem('region') || 'US',
         currentTheme: localStorage.getItem('theme') || 'game',
         wishlist: JSON.parse(localStorage.getItem('wishlist') || '[]'),
-        priceAlerts: JSON.parse(localStorage.getItem('priceAlerts') || '[]')
+        wishlistPending: JSON.parse(localStorage.getItem('wishlistPending') || '{"add": [], "remove": []}'),
+        priceAlerts: JSON.parse(localStorage.getItem('priceAlerts') || '[]'),
+        deals: new Map(),
+        dealsVersion: null
     },
     
     // Initialize the application
@@ -92,8 +96,9 @@ window.GameTracker = {
             regionSelect.value = this.state.currentRegion;
         }
         
-        // Update wishlist buttons
+        // Update wishlist buttons, then reconcile with the server's wishlist
         this.updateWishlistButtons();
+        this.syncWishlist();
     },
     
     // Theme management
@@ -111,6 +116,7 @@ window.GameTracker = {
     // Region management
     setRegion(region) {
         this.state.currentRegion = region;
+        this.state.dealsVersion = null;
         localStorage.setItem('region', region);
         
         // Send to server
@@ -155,67 +161,101 @@ window.GameTracker = {
     },
     
     // Wishlist management
+    // Changes are applied locally at once and queued; one sync request sends
+    // the whole queue and replaces the local copy with the server's wishlist.
     addToWishlist(gameId) {
         if (!this.isLoggedIn()) {
             this.showNotification('Please log in to use wishlist', 'warning');
             return;
         }
         
-        fetch('/api/wishlist/add', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ game_id: parseInt(gameId) })
-        })
-        .then(response => response.json())
-        .then(data => {
-            if (data.success) {
-                this.showNotification('Added to wishlist!', 'success');
-                this.updateWishlistButton(gameId, true);
-                
-                // Update local state
-                if (!this.state.wishlist.includes(gameId)) {
-                    this.state.wishlist.push(gameId);
-                    localStorage.setItem('wishlist', JSON.stringify(this.state.wishlist));
-                }
-            } else {
-                this.showNotification(data.error || 'Failed to add to wishlist', 'error');
-            }
-        })
-        .catch(error => {
-            console.error('Error adding to wishlist:', error);
-            this.showNotification('Failed to add to wishlist', 'error');
-        });
+        this.queueWishlistChange(String(gameId), true);
+        this.showNotification('Added to wishlist!', 'success');
     },
     
     removeFromWishlist(gameId) {
-        fetch('/api/wishlist/remove', {
+        this.queueWishlistChange(String(gameId), false);
+        this.showNotification('Removed from wishlist!', 'success');
+    },
+    
+    queueWishlistChange(gameId, isInWishlist) {
+        // Only the latest change per game is kept, so the queue is a net diff
+        const pending = this.state.wishlistPending;
+        pending.add = pending.add.filter(id => id !== gameId);
+        pending.remove = pending.remove.filter(id => id !== gameId);
+        (isInWishlist ? pending.add : pending.remove).push(gameId);
+        
+        this.state.wishlist = this.state.wishlist.filter(id => id !== gameId);
+        if (isInWishlist) {
+            this.state.wishlist.push(gameId);
+        }
+        this.saveWishlistState();
+        this.updateWishlistButton(gameId, isInWishlist);
+        
+        clearTimeout(this.wishlistSyncTimer);
+        this.wishlistSyncTimer = setTimeout(() => this.syncWishlist(), 500);
+    },
+    
+    syncWishlist() {
+        if (!this.isLoggedIn() || this.wishlistSyncing) {
+            return;
+        }
+        
+        const sent = {
+            add: [...this.state.wishlistPending.add],
+            remove: [...this.state.wishlistPending.remove]
+        };
+        this.wishlistSyncing = true;
+        
+        fetch('/api/wishlist/sync', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({ game_id: parseInt(gameId) })
+            body: JSON.stringify({
+                add: sent.add.map(id => parseInt(id)),
+                remove: sent.remove.map(id => parseInt(id))
+            })
         })
         .then(response => response.json())
         .then(data => {
-            if (data.success) {
-                this.showNotification('Removed from wishlist!', 'success');
-                this.updateWishlistButton(gameId, false);
-                
-                // Update local state
-                this.state.wishlist = this.state.wishlist.filter(id => id !== gameId);
-                localStorage.setItem('wishlist', JSON.stringify(this.state.wishlist));
-            } else {
-                this.showNotification(data.error || 'Failed to remove from wishlist', 'error');
+            if (!data.success) {
+                throw new Error(data.error || 'Failed to sync wishlist');
             }
+            
+            // Keep changes queued while the request was in flight
+            const pending = this.state.wishlistPending;
+            pending.add = pending.add.filter(id => !sent.add.includes(id));
+            pending.remove = pending.remove.filter(id => !sent.remove.includes(id));
+            
+            const wishlist = new Set(data.items.map(item => String(item.game_id)));
+            pending.add.forEach(id => wishlist.add(id));
+            pending.remove.forEach(id => wishlist.delete(id));
+            this.state.wishlist = [...wishlist];
+            
+            this.saveWishlistState();
+            this.updateWishlistButtons();
         })
         .catch(error => {
-            console.error('Error removing from wishlist:', error);
-            this.showNotification('Failed to remove from wishlist', 'error');
+            // The queue stays in localStorage and is sent with the next sync
+            console.error('Error syncing wishlist:', error);
+            this.showNotification('Failed to sync wishlist', 'error');
+        })
+        .finally(() => {
+            this.wishlistSyncing = false;
+            const pending = this.state.wishlistPending;
+            if (pending.add.length || pending.remove.length) {
+                clearTimeout(this.wishlistSyncTimer);
+                this.wishlistSyncTimer = setTimeout(() => this.syncWishlist(), this.config.refreshInterval / 10);
+            }
         });
     },
     
+    saveWishlistState() {
+        localStorage.setItem('wishlist', JSON.stringify(this.state.wishlist));
+        localStorage.setItem('wishlistPending', JSON.stringify(this.state.wishlistPending));
+    },
+    
     updateWishlistButton(gameId, isInWishlist) {
         const button = document.querySelector(`[data-game-id="${gameId}"][data-wishlist-btn]`);
         if (button) {
@@ -248,14 +288,13 @@ window.GameTracker = {
         
         const targetPrice = prompt('Enter your target price (USD):');
         if (targetPrice && !isNaN(targetPrice) && parseFloat(targetPrice) > 0) {
-            fetch('/api/price-alert', {
+            fetch('/api/price-alerts', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ 
-                    game_id: parseInt(gameId),
-                    target_price: parseFloat(targetPrice)
+                body: JSON.stringify({
+                    alerts: [{ game_id: parseInt(gameId), target_price: parseFloat(targetPrice) }]
                 })
             })
             .then(response => response.json())
@@ -293,16 +332,52 @@ window.GameTracker = {
     
     // Auto-refresh functionality
     startAutoRefresh() {
+        // Prefer the async API's live stream; fall back to polling for changes
+        if (window.EventSource && this.config.apiBaseUrl !== '/api') {
+            const stream = new EventSource(`${this.config.apiBaseUrl}/stream/deals?region=${this.state.currentRegion}`);
+            ['hot_deal', 'price_drop'].forEach(type => {
+                stream.addEventListener(type, event => {
+                    const deal = JSON.parse(event.data);
+                    this.state.deals.set(deal.id, deal);
+                });
+            });
+            stream.onerror = () => {
+                if (stream.readyState === EventSource.CLOSED) {
+                    this.startPolling();
+                }
+            };
+            return;
+        }
+        
+        this.startPolling();
+    },
+    
+    startPolling() {
         setInterval(() => {
             this.refreshDeals();
         }, this.config.refreshInterval);
     },
     
+    // Apply only what changed since the last sync; refetch the list when told to reset
     refreshDeals() {
-        fetch(`${this.config.apiBaseUrl}/deals?region=${this.state.currentRegion}`)
+        const since = this.state.dealsVersion === null ? '' : `&since=${this.state.dealsVersion}`;
+        
+        fetch(`${this.config.apiBaseUrl}/deals/changes?region=${this.state.currentRegion}${since}`)
             .then(response => response.json())
             .then(data => {
-                console.log('Deals refreshed:', data.length);
+                if (data.reset) {
+                    return this.loadDeals(data.version);
+                }
+                
+                data.changes.forEach(change => {
+                    if (change.deal) {
+                        this.state.deals.set(change.id, change.deal);
+                    } else {
+                        this.state.deals.delete(change.id);
+                    }
+                });
+                this.state.dealsVersion = data.version;
+                console.log('Deals synced:', data.changes.length, 'changes');
                 // Update UI if needed
             })
             .catch(error => {
@@ -310,6 +385,16 @@ window.GameTracker = {
             });
     },
     
+    loadDeals(version) {
+        return fetch(`${this.config.apiBaseUrl}/deals?region=${this.state.currentRegion}`)
+            .then(response => response.json())
+            .then(data => {
+                this.state.deals = new Map(data.map(deal => [deal.id, deal]));
+                this.state.dealsVersion = version;
+                console.log('Deals refreshed:', data.length);
+            });
+    },
+    
     // Format price based on region
     formatPrice(price, currency = 'USD') {
         const formatters = {
@@ -3,9 +3,13 @@ Background tasks for Game Price Tracker
 """
 
 from celery import Celery
+from celery.signals import before_task_publish, task_prerun, task_postrun, task_failure, worker_process_init
 from datetime import datetime, timedelta
+import json
 import logging
 import os
+import random
+import time
 
 # Initialize Celery
 celery = Celery('game_tracker')
@@ -13,28 +17,158 @@ celery.config_from_object('celeryconfig')
 
 logger = logging.getLogger(__name__)
 
+_worker_app = None
+
+def get_worker_app():
+    """Get this worker's Flask app, created on first use without the web stack"""
+    global _worker_app
+    
+    if _worker_app is None:
+        from app import create_worker_app
+        _worker_app = create_worker_app()
+    
+    return _worker_app
+
+@worker_process_init.connect
+def reset_db_connections(**kwargs):
+    """Drop pooled connections inherited from the parent so forked children don't share sockets"""
+    if _worker_app is not None:
+        from models import db
+        
+        with _worker_app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+
 @celery.task
 def update_game_prices():
-    """Background task to update game prices"""
+    """Background task to fan out price updates per store and page"""
+    try:
+        from celery import chord
+        from services.external_apis import PriceUpdateService
+        
+        pages_per_store = int(os.getenv('PRICE_UPDATE_PAGES_PER_STORE', 5))
+        page_size = int(os.getenv('PRICE_UPDATE_PAGE_SIZE', 60))
+        
+        chunks = PriceUpdateService.plan_update_chunks(pages_per_store=pages_per_store)
+        chord(
+            update_price_chunk.s(store_id, page, page_size) for store_id, page in chunks
+        )(aggregate_price_updates.s())
+        
+        logger.info(f"Price update dispatched: {len(chunks)} chunks")
+        return f"Dispatched {len(chunks)} price update chunks"
+    except Exception as e:
+        logger.error(f"Error dispatching price updates: {str(e)}")
+        return f"Error: {str(e)}"
+
+@celery.task(bind=True, max_retries=3, default_retry_delay=30)
+def update_price_chunk(self, store_id, page, page_size=60):
+    """Update one page of one store's deals; retried on its own if it fails"""
+    try:
+        app = get_worker_app()
+        from models import db
+        from services.external_apis import PriceUpdateService
+        from services.ingestion_checkpoint import IngestionCheckpoint
+        
+        # Retries and redeliveries keep the task id, so they resume from the checkpoint
+        checkpoint = IngestionCheckpoint(self.request.id)
+        commit_every = int(os.getenv('PRICE_UPDATE_COMMIT_EVERY', 25))
+        
+        with app.app_context():
+            price_service = PriceUpdateService(db)
+            updated_count = price_service.update_store_prices(
+                store_id, page, page_size,
+                checkpoint=checkpoint,
+                commit_every=commit_every
+            )
+            checkpoint.clear()
+            
+            return {'store_id': store_id, 'page': page, 'updated': updated_count}
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=self.default_retry_delay * 2 ** self.request.retries)
+        
+        logger.error(f"Error updating store {store_id} page {page}: {str(e)}")
+        return {'store_id': store_id, 'page': page, 'updated': 0, 'error': str(e)}
+
+@celery.task
+def aggregate_price_updates(results):
+    """Combine chunk results once every price update chunk has finished"""
+    updated_count = sum(result.get('updated', 0) for result in results)
+    failed = [result for result in results if result.get('error')]
+    
+    for result in failed:
+        logger.warning(f"Price update chunk failed: store {result['store_id']} "
+                       f"page {result['page']}: {result['error']}")
+    
+    logger.info(f"Price update completed: {updated_count} deals updated "
+                f"across {len(results)} chunks ({len(failed)} failed)")
+    return f"Updated {updated_count} deals ({len(failed)} chunks failed)"
+
+@celery.task(bind=True)
+def backfill_prices(self, pages_per_store=50):
+    """Serial full backfill that resumes from its checkpoints after a worker restart"""
     try:
-        from app import app, db
+        app = get_worker_app()
+        from models import db
         from services.external_apis import PriceUpdateService
         
         with app.app_context():
             price_service = PriceUpdateService(db)
-            updated_count = price_service.update_all_prices()
+            updated_count = price_service.update_all_prices(
+                run_id=self.request.id,
+                pages_per_store=pages_per_store,
+                page_size=int(os.getenv('PRICE_UPDATE_PAGE_SIZE', 60)),
+                commit_every=int(os.getenv('PRICE_UPDATE_COMMIT_EVERY', 25))
+            )
+            
+            logger.info(f"Price backfill completed: {updated_count} deals updated")
+            return f"Backfilled {updated_count} deals"
+    except Exception as e:
+        logger.error(f"Error backfilling prices: {str(e)}")
+        return f"Error: {str(e)}"
+
+@celery.task
+def schedule_price_refreshes():
+    """Background task to recompute per-game refresh priorities"""
+    try:
+        app = get_worker_app()
+        from models import db
+        from services.refresh_scheduler import RefreshScheduler
+        
+        with app.app_context():
+            scheduler = RefreshScheduler(db)
+            scheduled_count = scheduler.reschedule_all()
             
-            logger.info(f"Price update completed: {updated_count} deals updated")
-            return f"Updated {updated_count} deals"
+            logger.info(f"Price refreshes scheduled: {scheduled_count} game stores")
+            return f"Scheduled {scheduled_count} price checks"
     except Exception as e:
-        logger.error(f"Error updating prices: {str(e)}")
+        logger.error(f"Error scheduling price refreshes: {str(e)}")
+        return f"Error: {str(e)}"
+
+@celery.task
+def refresh_due_prices():
+    """Background task to poll prices whose next check is due"""
+    try:
+        app = get_worker_app()
+        from models import db
+        from services.refresh_scheduler import RefreshScheduler
+        
+        with app.app_context():
+            scheduler = RefreshScheduler(db)
+            refreshed_count = scheduler.refresh_due()
+            
+            logger.info(f"Due price refresh completed: {refreshed_count} prices refreshed")
+            return f"Refreshed {refreshed_count} prices"
+    except Exception as e:
+        logger.error(f"Error refreshing due prices: {str(e)}")
         return f"Error: {str(e)}"
 
 @celery.task
 def check_price_alerts():
     """Background task to check price alerts"""
     try:
-        from app import app, db
+        app = get_worker_app()
+        from models import db
         from services.price_service import PriceService
         
         with app.app_context():
@@ -51,8 +185,8 @@ def check_price_alerts():
 def cleanup_old_deals():
     """Background task to clean up old deals"""
     try:
-        from app import app, db
-        from models import Deal
+        app = get_worker_app()
+        from models import db, Deal, DealChange, TaskRun
         
         with app.app_context():
             # Delete deals older than 90 days
@@ -64,9 +198,23 @@ def cleanup_old_deals():
             for deal in old_deals:
                 db.session.delete(deal)
             
+            # Clients that last synced before the retained change log get a reset
+            change_cutoff = datetime.utcnow() - timedelta(days=int(os.getenv('DEAL_CHANGE_RETENTION_DAYS', 7)))
+            change_count = DealChange.query.filter(DealChange.created_at < change_cutoff).delete(synchronize_session=False)
+            
+            run_cutoff = datetime.utcnow() - timedelta(days=int(os.getenv('TASK_RUN_RETENTION_DAYS', 30)))
+            run_count = TaskRun.query.filter(TaskRun.started_at < run_cutoff).delete(synchronize_session=False)
+            
             db.session.commit()
             
-            logger.info(f"Cleaned up {count} old deals")
+            from services.outbox import OutboxRelay
+            OutboxRelay(db).prune(days=int(os.getenv('OUTBOX_RETENTION_DAYS', 7)))
+            
+            # Recover alert index entries lost to Redis errors at commit time
+            from services.alert_index import AlertThresholdIndex
+            AlertThresholdIndex().rebuild()
+            
+            logger.info(f"Cleaned up {count} old deals, {change_count} deal changes and {run_count} task runs")
             return f"Cleaned up {count} old deals"
     except Exception as e:
         logger.error(f"Error cleaning up deals: {str(e)}")
@@ -74,46 +222,211 @@ def cleanup_old_deals():
         return f"Error: {str(e)}"
 
 @celery.task
-def send_weekly_digest():
-    """Send weekly digest of best deals to users"""
+def relay_outbox_events():
+    """Background task to publish committed price change events to the deals stream"""
+    try:
+        app = get_worker_app()
+        from models import db
+        from services.outbox import OutboxRelay
+        
+        with app.app_context():
+            published_count = OutboxRelay(db).relay()
+            
+            if published_count:
+                logger.info(f"Outbox relay published {published_count} events")
+            return f"Published {published_count} events"
+    except Exception as e:
+        logger.error(f"Error relaying outbox events: {str(e)}")
+        return f"Error: {str(e)}"
+
+@celery.task
+def dispatch_notifications():
+    """Send queued price alert notifications in coalesced batches"""
     try:
-        from app import app, db
-        from models import User, Deal
+        app = get_worker_app()
+        from models import db
+        from extensions import mail
         from services.email_service import EmailService
+        from services.notification_service import NotificationService
         
         with app.app_context():
-            # Get users who want email notifications
-            users = User.query.filter_by(
-                email_notifications=True,
-                is_active=True
-            ).all()
-            
-            # Get best deals from the past week
-            week_ago = datetime.utcnow() - timedelta(days=7)
-            best_deals = Deal.query.filter(
-                Deal.created_at >= week_ago,
-                Deal.savings_percentage >= 50
-            ).order_by(Deal.savings_percentage.desc()).limit(10).all()
+            notification_service = NotificationService(db)
+            sent_count = notification_service.dispatch(EmailService(mail))
             
+            logger.info(f"Notifications dispatched: {sent_count} emails sent")
+            return f"Sent {sent_count} notification emails"
+    except Exception as e:
+        logger.error(f"Error dispatching notifications: {str(e)}")
+        return f"Error: {str(e)}"
+
+@celery.task(bind=True)
+def send_weekly_digest(self):
+    """Fan out the weekly digest across workers in keyset-batched user ranges"""
+    try:
+        app = get_worker_app()
+        from models import db
+        from services.digest_service import DigestService
+        
+        batch_size = int(os.getenv('DIGEST_BATCH_SIZE', 500))
+        
+        with app.app_context():
+            digest_service = DigestService(db)
+            
+            # Compute the deal pool once; every chunk personalises from it
+            best_deals = digest_service.compute_best_deals()
             if not best_deals:
                 return "No deals to send"
             
-            email_service = EmailService()
-            sent_count = 0
+            run_id = self.request.id
+            digest_service.store_best_deals(run_id, best_deals)
             
-            for user in users:
-                try:
-                    email_service.send_weekly_digest(user, best_deals)
-                    sent_count += 1
-                except Exception as e:
-                    logger.error(f"Failed to send digest to {user.email}: {str(e)}")
+            chunk_count = 0
+            for first_id, last_id in digest_service.iter_user_id_ranges(batch_size):
+                send_digest_chunk.delay(run_id, first_id, last_id)
+                chunk_count += 1
             
-            logger.info(f"Weekly digest sent to {sent_count} users")
-            return f"Sent digest to {sent_count} users"
+            logger.info(f"Weekly digest dispatched: {chunk_count} chunks")
+            return f"Dispatched {chunk_count} digest chunks"
     except Exception as e:
         logger.error(f"Error sending weekly digest: {str(e)}")
         return f"Error: {str(e)}"
 
+@celery.task(bind=True, max_retries=3, default_retry_delay=60)
+def send_digest_chunk(self, run_id, first_id, last_id):
+    """Send the weekly digest to one range of users"""
+    try:
+        app = get_worker_app()
+        from models import db
+        from extensions import mail
+        from services.digest_service import DigestService
+        from services.email_service import EmailService
+        
+        with app.app_context():
+            digest_service = DigestService(db)
+            best_deals = digest_service.load_best_deals(run_id)
+            sent_count = digest_service.send_range(EmailService(mail), first_id, last_id, best_deals)
+            
+            logger.info(f"Digest chunk {first_id}-{last_id}: sent to {sent_count} users")
+            return f"Sent digest to {sent_count} users"
+    except Exception as e:
+        logger.error(f"Error sending digest chunk {first_id}-{last_id}: {str(e)}")
+        raise self.retry(exc=e)
+
+@celery.task(bind=True, max_retries=3, default_retry_delay=30)
+def import_steam_wishlist(self, import_id):
+    """Import a Steam wishlist or library in batches, reporting progress as it goes"""
+    try:
+        app = get_worker_app()
+        from models import db
+        from services.wishlist_import_service import WishlistImportService
+        
+        def report_progress(processed, total):
+            self.update_state(state='PROGRESS', meta={'import_id': import_id, 'processed': processed, 'total': total})
+        
+        with app.app_context():
+            wishlist_import = WishlistImportService(db).run(
+                import_id,
+                batch_size=int(os.getenv('WISHLIST_IMPORT_BATCH_SIZE', 500)),
+                progress=report_progress
+            )
+            if wishlist_import is None:
+                return f"Wishlist import {import_id} not found"
+            
+            logger.info(f"Wishlist import {import_id} {wishlist_import.status}: "
+                        f"{wishlist_import.added_count} added, {wishlist_import.created_games} games created")
+            return f"Imported {wishlist_import.added_count} wishlist items"
+    except Exception as e:
+        logger.error(f"Error importing wishlist {import_id}: {str(e)}")
+        raise self.retry(exc=e)
+
+# Task telemetry
+_task_runs = {}
+
+# Periodic tasks that run every minute or more often; only a sample of their
+# successful runs is stored, while failures always are
+SAMPLED_TASKS = {
+    'tasks.refresh_due_prices',
+    'tasks.check_price_alerts',
+    'tasks.dispatch_notifications',
+    'tasks.relay_outbox_events',
+}
+
+@before_task_publish.connect
+def stamp_sent_at(headers=None, **kwargs):
+    """Stamp outgoing tasks so workers can measure queue lag"""
+    if headers is not None:
+        headers.setdefault('sent_at', time.time())
+
+@task_prerun.connect
+def start_task_run(task_id=None, task=None, **kwargs):
+    """Start collecting telemetry for a task run"""
+    from monitoring import TaskTelemetry
+    
+    sent_at = task.request.get('sent_at') or (task.request.headers or {}).get('sent_at')
+    queue_lag = max(time.time() - float(sent_at), 0) if sent_at else None
+    
+    task_run = TaskTelemetry(task.name, task_id=task_id, queue_lag=queue_lag)
+    task_run.activate()
+    _task_runs[task_id] = task_run
+
+@task_failure.connect
+def fail_task_run(task_id=None, exception=None, **kwargs):
+    """Record the exception on a failed task run"""
+    task_run = _task_runs.get(task_id)
+    if task_run is not None:
+        task_run.error = str(exception)
+
+@task_postrun.connect
+def finish_task_run(task_id=None, retval=None, state=None, **kwargs):
+    """Finish a task run, log its summary and store it for comparison across releases"""
+    task_run = _task_runs.pop(task_id, None)
+    if task_run is None:
+        return
+    
+    task_run.deactivate()
+    
+    # Tasks report handled errors by returning an "Error: ..." string
+    if isinstance(retval, str) and retval.startswith('Error:'):
+        task_run.finish('error', error=retval[len('Error:'):].strip())
+    elif state in ('FAILURE', 'RETRY'):
+        task_run.finish(state.lower(), error=task_run.error or str(retval))
+    else:
+        task_run.finish('success')
+    
+    summary = task_run.summary()
+    logger.info(f"task_run {json.dumps(summary, default=str)}")
+    
+    if (task_run.status == 'success' and task_run.task_name in SAMPLED_TASKS
+            and random.random() >= float(os.getenv('TASK_RUN_SAMPLE_RATE', 0.05))):
+        return
+    
+    try:
+        app = get_worker_app()
+        from models import db, TaskRun
+        
+        with app.app_context():
+            db.session.add(TaskRun(
+                task_name=task_run.task_name,
+                task_id=task_run.task_id,
+                release=task_run.release,
+                status=task_run.status,
+                started_at=task_run.started_at,
+                finished_at=task_run.finished_at,
+                duration_seconds=task_run.duration,
+                queue_lag_seconds=task_run.queue_lag,
+                records_fetched=summary['records_fetched'],
+                rows_changed=summary['rows_changed'],
+                metrics=json.dumps({
+                    'counters': summary['counters'],
+                    'http': summary['http'],
+                    'db': summary['db']
+                }),
+                error=task_run.error
+            ))
+            db.session.commit()
+    except Exception as e:
+        logger.error(f"Error storing task run {task_id}: {str(e)}")
+
 # Periodic task scheduling
 from celery.schedules import crontab
 
@@ -122,9 +435,25 @@ celery.conf.beat_schedule = {
         'task': 'tasks.update_game_prices',
         'schedule': crontab(minute=0, hour='*/6'),  # Every 6 hours
     },
+    'schedule-price-refreshes': {
+        'task': 'tasks.schedule_price_refreshes',
+        'schedule': crontab(minute='*/15'),  # Every 15 minutes
+    },
+    'refresh-due-prices': {
+        'task': 'tasks.refresh_due_prices',
+        'schedule': crontab(),  # Every minute
+    },
     'check-alerts': {
         'task': 'tasks.check_price_alerts',
-        'schedule': crontab(minute='*/30'),  # Every 30 minutes
+        'schedule': crontab(),  # Every minute
+    },
+    'dispatch-notifications': {
+        'task': 'tasks.dispatch_notifications',
+        'schedule': crontab(),  # Every minute
+    },
+    'relay-outbox-events': {
+        'task': 'tasks.relay_outbox_events',
+        'schedule': float(os.getenv('OUTBOX_RELAY_INTERVAL_SECONDS', 10)),  # Every 10 seconds
     },
     'cleanup-deals': {
         'task': 'tasks.cleanup_old_deals',
@@ -0,0 +1,742 @@
+"""
+Web views for Game Price Tracker
+"""
+
+from flask import Blueprint, current_app, render_template, request, jsonify, redirect, url_for, flash, session, make_response
+from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+from werkzeug.security import generate_password_hash, check_password_hash
+from datetime import datetime, timedelta
+from models import db, User, Store, UserWishlist, TaskRun
+from database import stick_to_primary
+from services.game_service import GameService
+from services.deal_service import DealService, deal_changes_json, deal_json
+from services.price_service import PriceService
+from services.refresh_scheduler import RefreshScheduler
+from services.wishlist_service import WishlistService
+from services.wishlist_import_service import WishlistImportService, parse_steam_export
+from services.catalog_version import get_version, make_etag
+from functools import wraps
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+main = Blueprint('main', __name__)
+
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
+
+# User loader for Flask-Login
+@login_manager.user_loader
+def load_user(user_id):
+    return User.query.get(int(user_id))
+
+# Initialize services
+game_service = GameService(db)
+deal_service = DealService(db)
+price_service = PriceService(db)
+wishlist_service = WishlistService(db)
+wishlist_import_service = WishlistImportService(db)
+refresh_scheduler = RefreshScheduler(db)
+
+def catalog_cached(view):
+    """Serve 304s for listing JSON until the catalogue version for the region changes
+    
+    The ETag comes from the ingestion version counters, so a matching
+    If-None-Match is answered without running the view's queries.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        version = get_version(request.args.get('region', 'US'))
+        if version is None:
+            return view(*args, **kwargs)
+        
+        etag = make_etag(version, request.full_path)
+        if request.if_none_match.contains_weak(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = (
+            f"public, max-age={int(os.getenv('HTTP_CACHE_MAX_AGE', 30))}, "
+            f"stale-while-revalidate={int(os.getenv('HTTP_CACHE_STALE_WHILE_REVALIDATE', 300))}"
+        )
+        return response
+    return wrapper
+
+def admin_required(view):
+    """Limit a view to signed-in users listed in ADMIN_EMAILS"""
+    @wraps(view)
+    @login_required
+    def wrapper(*args, **kwargs):
+        if current_user.email.lower() not in current_app.config.get('ADMIN_EMAILS', []):
+            return jsonify({'error': 'Admin access required'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+def _alert_json(alert):
+    """Serialize a price alert for the alerts API"""
+    return {
+        'id': alert.id,
+        'game_id': alert.game_id,
+        'game_title': alert.game.title if alert.game else None,
+        'alert_type': alert.alert_type,
+        'target_price': alert.target_price,
+        'target_discount': alert.target_discount,
+        'currency': alert.currency,
+        'region': alert.region,
+        'is_active': alert.is_active,
+        'is_triggered': alert.is_triggered,
+        'triggered_at': alert.triggered_at.isoformat() if alert.triggered_at else None,
+        'triggered_price': alert.triggered_price,
+        'triggered_store': alert.triggered_store
+    }
+
+def _wishlist_json(item):
+    """Serialize a wishlist entry for the wishlist sync API"""
+    return {
+        'game_id': item.game_id,
+        'priority': item.priority,
+        'notes': item.notes,
+        'target_price': item.target_price,
+        'target_discount': item.target_discount,
+        'added_at': item.added_at.isoformat() if item.added_at else None
+    }
+
+def _import_json(wishlist_import):
+    """Serialize a wishlist import and its progress"""
+    return {
+        'id': wishlist_import.id,
+        'source': wishlist_import.source,
+        'status': wishlist_import.status,
+        'total': wishlist_import.total_count,
+        'processed': wishlist_import.processed_count,
+        'created_games': wishlist_import.created_games,
+        'added': wishlist_import.added_count,
+        'error': wishlist_import.error,
+        'created_at': wishlist_import.created_at.isoformat() if wishlist_import.created_at else None,
+        'finished_at': wishlist_import.finished_at.isoformat() if wishlist_import.finished_at else None
+    }
+
+# Bulk endpoints accept at most this many items per request
+MAX_BULK_ITEMS = 1000
+
+# Routes
+@main.route('/')
+def index():
+    """Main dashboard page"""
+    try:
+        # Get user's preferred region
+        region = session.get('region', 'US')
+        
+        # Get latest deals
+        hot_deals = deal_service.get_hot_deals(limit=20, region=region)
+        
+        # Get dashboard stats
+        stats = {
+            'active_offers': len(hot_deals),
+            'ending_soon': len([d for d in hot_deals if d.deal_end_date and 
+                              d.deal_end_date < datetime.utcnow() + timedelta(days=2)]),
+            'total_value': sum(d.normal_price for d in hot_deals),
+            'your_savings': 85 if current_user.is_authenticated else 0
+        }
+        
+        return render_template('index.html', 
+                             deals=hot_deals, 
+                             stats=stats, 
+                             region=region)
+    except Exception as e:
+        logger.error(f"Error loading index page: {str(e)}")
+        flash('Error loading deals. Please try again.', 'error')
+        return render_template('index.html', deals=[], stats={})
+
+@main.route('/api/deals')
+@catalog_cached
+def api_deals():
+    """API endpoint for deals"""
+    try:
+        region = request.args.get('region', 'US')
+        limit = int(request.args.get('limit', 20))
+        store_id = request.args.get('store_id')
+        
+        deals = deal_service.get_deals(
+            region=region,
+            limit=limit,
+            store_id=store_id
+        )
+        
+        return jsonify([deal_json(deal) for deal in deals])
+    except Exception as e:
+        logger.error(f"Error fetching deals: {str(e)}")
+        return jsonify({'error': 'Failed to fetch deals'}), 500
+
+@main.route('/api/deals/changes')
+@catalog_cached
+def api_deal_changes():
+    """API endpoint for deals added, changed or ended since a deals version"""
+    try:
+        region = request.args.get('region', 'US')
+        since = request.args.get('since', type=int)
+        limit = min(request.args.get('limit', 500, type=int), 1000)
+        
+        if since is None:
+            version, changes = deal_service.get_changes_version(region), None
+        else:
+            version, changes = deal_service.get_changes(since, region=region, limit=limit)
+        
+        if version is None:
+            return jsonify({'error': 'Failed to fetch deal changes'}), 500
+        
+        # reset tells the client to refetch /api/deals (after taking this version, so
+        # changes committed in between are replayed rather than missed)
+        return jsonify(deal_changes_json(version, changes))
+    except Exception as e:
+        logger.error(f"Error fetching deal changes: {str(e)}")
+        return jsonify({'error': 'Failed to fetch deal changes'}), 500
+
+@main.route('/search')
+def search():
+    """Advanced search page"""
+    query = request.args.get('q', '')
+    genre = request.args.get('genre', '')
+    min_rating = request.args.get('min_rating', 0, type=int)
+    max_price = request.args.get('max_price', 999, type=float)
+    
+    games = game_service.search_games(
+        query=query,
+        genre=genre,
+        min_rating=min_rating,
+        max_price=max_price
+    )
+    
+    return render_template('search.html', 
+                         games=games, 
+                         query=query,
+                         genre=genre,
+                         min_rating=min_rating,
+                         max_price=max_price)
+
+@main.route('/game/<int:game_id>')
+def game_details(game_id):
+    """Game details page"""
+    try:
+        game = game_service.get_game_details(game_id)
+        if not game:
+            flash('Game not found.', 'error')
+            return redirect(url_for('main.index'))
+        
+        # Page views raise the game's price refresh priority
+        refresh_scheduler.record_view(game_id)
+        
+        # Get price history
+        price_history = price_service.get_price_history(game_id, days=30)
+        
+        # Get similar games
+        similar_games = game_service.get_similar_games(game_id, limit=6)
+        
+        return render_template('game_details.html',
+                             game=game,
+                             price_history=price_history,
+                             similar_games=similar_games)
+    except Exception as e:
+        logger.error(f"Error loading game details: {str(e)}")
+        flash('Error loading game details.', 'error')
+        return redirect(url_for('main.index'))
+
+@main.route('/wishlist')
+@login_required
+def wishlist():
+    """User wishlist page"""
+    try:
+        region = session.get('region', 'US')
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 24, type=int), 1), 100)
+        
+        stats = wishlist_service.get_stats(current_user.id, region=region)
+        pages = max((stats.get('total_games', 0) + per_page - 1) // per_page, 1)
+        page = min(page, pages)
+        items = wishlist_service.get_page(current_user.id, region=region, page=page, per_page=per_page)
+        
+        return render_template('wishlist.html', items=items, stats=stats, page=page, pages=pages, per_page=per_page)
+    except Exception as e:
+        logger.error(f"Error loading wishlist: {str(e)}")
+        flash('Error loading wishlist.', 'error')
+        return render_template('wishlist.html', items=[], stats={}, page=1, pages=1, per_page=24)
+
+@main.route('/api/wishlist/add', methods=['POST'])
+@login_required
+def add_to_wishlist():
+    """Add game to wishlist"""
+    try:
+        game_id = request.json.get('game_id')
+        
+        # Check if already in wishlist
+        existing = UserWishlist.query.filter_by(
+            user_id=current_user.id,
+            game_id=game_id
+        ).first()
+        
+        if existing:
+            return jsonify({'error': 'Game already in wishlist'}), 400
+        
+        # Add to wishlist
+        wishlist_item = UserWishlist(
+            user_id=current_user.id,
+            game_id=game_id,
+            added_at=datetime.utcnow()
+        )
+        db.session.add(wishlist_item)
+        db.session.commit()
+        stick_to_primary()
+        
+        return jsonify({'success': True, 'message': 'Added to wishlist'})
+    except Exception as e:
+        logger.error(f"Error adding to wishlist: {str(e)}")
+        return jsonify({'error': 'Failed to add to wishlist'}), 500
+
+@main.route('/api/wishlist/remove', methods=['POST'])
+@login_required
+def remove_from_wishlist():
+    """Remove game from wishlist"""
+    try:
+        game_id = request.json.get('game_id')
+        
+        wishlist_item = UserWishlist.query.filter_by(
+            user_id=current_user.id,
+            game_id=game_id
+        ).first()
+        
+        if wishlist_item:
+            db.session.delete(wishlist_item)
+            db.session.commit()
+            stick_to_primary()
+            return jsonify({'success': True, 'message': 'Removed from wishlist'})
+        
+        return jsonify({'error': 'Game not in wishlist'}), 404
+    except Exception as e:
+        logger.error(f"Error removing from wishlist: {str(e)}")
+        return jsonify({'error': 'Failed to remove from wishlist'}), 500
+
+@main.route('/api/wishlist/sync', methods=['POST'])
+@login_required
+def sync_wishlist():
+    """Reconcile a client's wishlist changes in one round trip
+    
+    Body: {"add": [game_id or {"game_id", "priority", "notes", "target_price", "target_discount"}],
+    "update": [{"game_id", ...}], "remove": [game_id]}. Returns the server's wishlist,
+    which replaces the client's copy; an empty body just fetches it.
+    """
+    try:
+        data = request.json or {}
+        diff = {part: data.get(part) or [] for part in ('add', 'update', 'remove')}
+        if not all(isinstance(entries, list) for entries in diff.values()):
+            return jsonify({'error': 'add, update and remove must be lists'}), 400
+        if sum(len(entries) for entries in diff.values()) > MAX_BULK_ITEMS:
+            return jsonify({'error': f"At most {MAX_BULK_ITEMS} changes per request"}), 400
+        
+        try:
+            items = wishlist_service.sync(current_user.id, **diff)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if items is None:
+            return jsonify({'error': 'Failed to sync wishlist'}), 500
+        
+        if any(diff.values()):
+            stick_to_primary()
+        return jsonify({'success': True, 'items': [_wishlist_json(item) for item in items]})
+    except Exception as e:
+        logger.error(f"Error syncing wishlist: {str(e)}")
+        return jsonify({'error': 'Failed to sync wishlist'}), 500
+
+@main.route('/api/wishlist/import', methods=['POST'])
+@login_required
+def import_wishlist():
+    """Start a background import of a Steam wishlist or library
+    
+    Either upload an export as the multipart field `file`, or send
+    {"steam_id": "7656...", "source": "wishlist" | "library"} to read a public
+    profile through the Steam Web API. Poll the returned import for progress.
+    """
+    try:
+        from tasks import import_steam_wishlist
+        
+        max_bytes = int(os.getenv('WISHLIST_IMPORT_MAX_BYTES', 5 * 1024 * 1024))
+        if request.content_length and request.content_length > max_bytes:
+            return jsonify({'error': f"Uploads are limited to {max_bytes // (1024 * 1024)} MB"}), 413
+        
+        try:
+            upload = request.files.get('file')
+            if upload:
+                try:
+                    entries = parse_steam_export(json.load(upload.stream))
+                except json.JSONDecodeError:
+                    raise ValueError('The export is not valid JSON')
+                wishlist_import = wishlist_import_service.create_import(current_user.id, 'file', entries=entries)
+            else:
+                data = request.get_json(silent=True) or {}
+                wishlist_import = wishlist_import_service.create_import(
+                    current_user.id, data.get('source') or 'wishlist', steam_id=data.get('steam_id')
+                )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        try:
+            result = import_steam_wishlist.delay(wishlist_import.id)
+            wishlist_import.task_id = result.id
+        except Exception as e:
+            logger.error(f"Error queueing wishlist import {wishlist_import.id}: {str(e)}")
+            wishlist_import.status = 'failed'
+            wishlist_import.error = 'Could not queue the import'
+        db.session.commit()
+        stick_to_primary()
+        
+        if wishlist_import.status == 'failed':
+            return jsonify({'error': 'Failed to start import'}), 503
+        return jsonify({'success': True, 'import': _import_json(wishlist_import)}), 202
+    except Exception as e:
+        logger.error(f"Error starting wishlist import: {str(e)}")
+        return jsonify({'error': 'Failed to start import'}), 500
+
+@main.route('/api/wishlist/import/<int:import_id>')
+@login_required
+def wishlist_import_status(import_id):
+    """Progress of one of the current user's wishlist imports"""
+    try:
+        wishlist_import = wishlist_import_service.get_import(import_id, current_user.id)
+        if not wishlist_import:
+            return jsonify({'error': 'Import not found'}), 404
+        
+        return jsonify({'import': _import_json(wishlist_import)})
+    except Exception as e:
+        logger.error(f"Error fetching wishlist import: {str(e)}")
+        return jsonify({'error': 'Failed to fetch import'}), 500
+
+@main.route('/api/price-alerts', methods=['GET'])
+@login_required
+def api_price_alerts():
+    """API endpoint for the current user's price alerts"""
+    try:
+        active_only = request.args.get('active_only', 'true').lower() in ['true', 'on', '1']
+        alerts = price_service.get_user_alerts(current_user.id, active_only=active_only)
+        
+        return jsonify({'alerts': [_alert_json(alert) for alert in alerts]})
+    except Exception as e:
+        logger.error(f"Error fetching price alerts: {str(e)}")
+        return jsonify({'error': 'Failed to fetch price alerts'}), 500
+
+@main.route('/api/price-alerts', methods=['POST'])
+@login_required
+def save_price_alerts():
+    """Create or update any number of price alerts in one request
+    
+    Body: {"alerts": [{"game_id", "alert_type", "target_price", "target_discount", "region"}]}.
+    Alerts are keyed by game and alert type, so posting one again updates it.
+    """
+    try:
+        alerts = (request.json or {}).get('alerts')
+        if not isinstance(alerts, list) or not alerts:
+            return jsonify({'error': 'alerts must be a non-empty list'}), 400
+        if len(alerts) > MAX_BULK_ITEMS:
+            return jsonify({'error': f"At most {MAX_BULK_ITEMS} alerts per request"}), 400
+        
+        try:
+            saved = price_service.save_price_alerts(current_user.id, alerts)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if not saved:
+            return jsonify({'error': 'Failed to save price alerts'}), 500
+        
+        stick_to_primary()
+        return jsonify({'success': True, 'saved': len(saved), 'ids': [row.id for row in saved]})
+    except Exception as e:
+        logger.error(f"Error saving price alerts: {str(e)}")
+        return jsonify({'error': 'Failed to save price alerts'}), 500
+
+@main.route('/api/price-alerts', methods=['DELETE'])
+@login_required
+def delete_price_alerts():
+    """Delete price alerts by id and/or by game: {"ids": [...], "game_ids": [...]}"""
+    try:
+        data = request.json or {}
+        try:
+            alert_ids = [int(alert_id) for alert_id in data.get('ids') or []]
+            game_ids = [int(game_id) for game_id in data.get('game_ids') or []]
+        except (TypeError, ValueError):
+            return jsonify({'error': 'ids and game_ids must be lists of integers'}), 400
+        
+        if len(alert_ids) + len(game_ids) > MAX_BULK_ITEMS:
+            return jsonify({'error': f"At most {MAX_BULK_ITEMS} alerts per request"}), 400
+        
+        deleted_count = price_service.delete_price_alerts(current_user.id, alert_ids=alert_ids, game_ids=game_ids)
+        stick_to_primary()
+        
+        return jsonify({'success': True, 'deleted': deleted_count})
+    except Exception as e:
+        logger.error(f"Error deleting price alerts: {str(e)}")
+        return jsonify({'error': 'Failed to delete price alerts'}), 500
+
+@main.route('/deals')
+def deals():
+    """Deals page with categories"""
+    try:
+        region = session.get('region', 'US')
+        
+        # Get different categories of deals
+        hot_deals = deal_service.get_hot_deals(limit=12, region=region)
+        new_deals = deal_service.get_recent_deals(limit=12, region=region)
+        free_games = deal_service.get_free_games(limit=12, region=region)
+        
+        return render_template('deals.html',
+                             hot_deals=hot_deals,
+                             new_deals=new_deals,
+                             free_games=free_games)
+    except Exception as e:
+        logger.error(f"Error loading deals page: {str(e)}")
+        flash('Error loading deals.', 'error')
+        return render_template('deals.html', hot_deals=[], new_deals=[], free_games=[])
+
+@main.route('/free-games')
+def free_games():
+    """Free games page"""
+    try:
+        region = session.get('region', 'US')
+        free_games = deal_service.get_free_games(limit=20, region=region)
+        
+        return render_template('free_games.html', games=free_games)
+    except Exception as e:
+        logger.error(f"Error loading free games: {str(e)}")
+        flash('Error loading free games.', 'error')
+        return render_template('free_games.html', games=[])
+
+@main.route('/store/<store_name>')
+def store_page(store_name):
+    """Individual store page"""
+    try:
+        store = Store.query.filter_by(slug=store_name).first()
+        if not store:
+            flash('Store not found.', 'error')
+            return redirect(url_for('main.index'))
+        
+        region = session.get('region', 'US')
+        deals = deal_service.get_store_deals(store.id, region=region, limit=20)
+        
+        # Calculate store stats across all current deals, not just this page
+        stats = deal_service.get_store_stats(store.id, region=region)
+        stats['avg_rating'] = 8.5  # Mock data
+        
+        return render_template('store.html', store=store, deals=deals, stats=stats)
+    except Exception as e:
+        logger.error(f"Error loading store page: {str(e)}")
+        flash('Error loading store page.', 'error')
+        return redirect(url_for('main.index'))
+
+@main.route('/settings')
+@login_required
+def settings():
+    """User settings page"""
+    return render_template('settings.html', user=current_user)
+
+@main.route('/api/settings', methods=['POST'])
+@login_required
+def update_settings():
+    """Update user settings"""
+    try:
+        data = request.json
+        
+        # Update user preferences
+        if 'preferred_currency' in data:
+            current_user.preferred_currency = data['preferred_currency']
+        if 'preferred_region' in data:
+            current_user.preferred_region = data['preferred_region']
+        if 'theme_preference' in data:
+            current_user.theme_preference = data['theme_preference']
+        if 'email_notifications' in data:
+            current_user.email_notifications = data['email_notifications']
+        
+        db.session.commit()
+        stick_to_primary()
+        
+        # Update session
+        session['region'] = current_user.preferred_region
+        
+        return jsonify({'success': True, 'message': 'Settings updated'})
+    except Exception as e:
+        logger.error(f"Error updating settings: {str(e)}")
+        return jsonify({'error': 'Failed to update settings'}), 500
+
+@main.route('/api/region', methods=['POST'])
+def set_region():
+    """Set user's preferred region"""
+    try:
+        region = request.json.get('region', 'US')
+        session['region'] = region
+        
+        if current_user.is_authenticated:
+            current_user.preferred_region = region
+            db.session.commit()
+            stick_to_primary()
+        
+        return jsonify({'success': True, 'region': region})
+    except Exception as e:
+        logger.error(f"Error setting region: {str(e)}")
+        return jsonify({'error': 'Failed to set region'}), 500
+
+@main.route('/api/task-runs')
+@admin_required
+def api_task_runs():
+    """API endpoint for background task telemetry, compared across releases"""
+    try:
+        task_name = request.args.get('task')
+        days = request.args.get('days', 7, type=int)
+        limit = min(request.args.get('limit', 50, type=int), 500)
+        
+        query = TaskRun.query.filter(TaskRun.started_at >= datetime.utcnow() - timedelta(days=days))
+        if task_name:
+            query = query.filter(TaskRun.task_name == task_name)
+        
+        runs = query.order_by(TaskRun.started_at.desc()).limit(limit).all()
+        
+        # Per task and release averages, so a regression shows up against the previous release
+        releases = query.with_entities(
+            TaskRun.task_name,
+            TaskRun.release,
+            db.func.count(TaskRun.id),
+            db.func.avg(TaskRun.duration_seconds),
+            db.func.avg(TaskRun.queue_lag_seconds),
+            db.func.sum(TaskRun.records_fetched),
+            db.func.sum(TaskRun.duration_seconds),
+            db.func.sum(db.case((TaskRun.status != 'success', 1), else_=0))
+        ).group_by(TaskRun.task_name, TaskRun.release).order_by(None).all()
+        
+        return jsonify({
+            'runs': [{
+                'task_name': run.task_name,
+                'task_id': run.task_id,
+                'release': run.release,
+                'status': run.status,
+                'started_at': run.started_at.isoformat(),
+                'duration_seconds': run.duration_seconds,
+                'queue_lag_seconds': run.queue_lag_seconds,
+                'records_fetched': run.records_fetched,
+                'rows_changed': run.rows_changed,
+                'metrics': json.loads(run.metrics) if run.metrics else {},
+                'error': run.error
+            } for run in runs],
+            'releases': [{
+                'task_name': name,
+                'release': release,
+                'runs': count,
+                'avg_duration_seconds': avg_duration,
+                'avg_queue_lag_seconds': avg_lag,
+                'records_per_second': (records or 0) / total_duration if total_duration else None,
+                'failures': int(failures or 0)
+            } for name, release, count, avg_duration, avg_lag, records, total_duration, failures in releases]
+        })
+    except Exception as e:
+        logger.error(f"Error fetching task runs: {str(e)}")
+        return jsonify({'error': 'Failed to fetch task runs'}), 500
+
+# Authentication routes
+@main.route('/login', methods=['GET', 'POST'])
+def login():
+    """User login"""
+    if request.method == 'POST':
+        try:
+            data = request.json if request.is_json else request.form
+            email = data.get('email')
+            password = data.get('password')
+            
+            user = User.query.filter_by(email=email).first()
+            
+            if user and check_password_hash(user.password_hash, password):
+                login_user(user)
+                session['region'] = user.preferred_region
+                
+                if request.is_json:
+                    return jsonify({'success': True, 'message': 'Logged in successfully'})
+                else:
+                    flash('Logged in successfully!', 'success')
+                    return redirect(url_for('main.index'))
+            else:
+                if request.is_json:
+                    return jsonify({'error': 'Invalid credentials'}), 401
+                else:
+                    flash('Invalid email or password.', 'error')
+        except Exception as e:
+            logger.error(f"Login error: {str(e)}")
+            if request.is_json:
+                return jsonify({'error': 'Login failed'}), 500
+            else:
+                flash('Login failed. Please try again.', 'error')
+    
+    return render_template('auth/login.html')
+
+@main.route('/register', methods=['GET', 'POST'])
+def register():
+    """User registration"""
+    if request.method == 'POST':
+        try:
+            data = request.json if request.is_json else request.form
+            email = data.get('email')
+            password = data.get('password')
+            username = data.get('username', '')
+            
+            # Check if user exists
+            if User.query.filter_by(email=email).first():
+                if request.is_json:
+                    return jsonify({'error': 'Email already registered'}), 400
+                else:
+                    flash('Email already registered.', 'error')
+                    return render_template('auth/register.html')
+            
+            # Create new user
+            user = User(
+                email=email,
+                username=username,
+                password_hash=generate_password_hash(password),
+                created_at=datetime.utcnow()
+            )
+            db.session.add(user)
+            db.session.commit()
+            
+            login_user(user)
+            
+            if request.is_json:
+                return jsonify({'success': True, 'message': 'Account created successfully'})
+            else:
+                flash('Account created successfully!', 'success')
+                return redirect(url_for('main.index'))
+        
+        except Exception as e:
+            logger.error(f"Registration error: {str(e)}")
+            if request.is_json:
+                return jsonify({'error': 'Registration failed'}), 500
+            else:
+                flash('Registration failed. Please try again.', 'error')
+    
+    return render_template('auth/register.html')
+
+@main.route('/logout')
+@login_required
+def logout():
+    """User logout"""
+    logout_user()
+    session.pop('region', None)
+    flash('Logged out successfully.', 'success')
+    return redirect(url_for('main.index'))
+
+# Error handlers
+@main.app_errorhandler(404)
+def not_found(error):
+    return render_template('errors/404.html'), 404
+
+@main.app_errorhandler(500)
+def internal_error(error):
+    db.session.rollback()
+    return render_template('errors/500.html'), 500
@@ -0,0 +1,366 @@
+"""
+Webhook delivery worker pushing price change events to partner endpoints
+
+Reads the events:deals stream through its own consumer group, matches each
+event against the active webhook subscriptions, and POSTs one signed batch per
+subscriber over a single pooled aiohttp session:
+
+    python -m webhook_worker --name webhooks-1
+
+Run more workers with different names to share the stream. Ingestion only ever
+writes outbox rows, so nothing here can hold it up. Every batch is parked in a
+Redis sorted set under a lease before its stream entries are acked, and stays
+there until it is delivered, rescheduled with exponential backoff or
+dead-lettered, so a worker that dies mid-delivery loses nothing. Stream reads
+don't wait for deliveries to finish, so one slow or broken endpoint doesn't
+stall the stream or the other subscribers, and concurrent requests to any one
+host are capped by WEBHOOK_PER_ENDPOINT_CONCURRENCY.
+
+Each request carries an X-Webhook-Signature header of the form t=<unix time>,v1=<hex>,
+where the hex is the HMAC-SHA256 of "<unix time>.<body>" under the subscription
+secret. Delivery is at-least-once: receivers dedupe on delivery_id or event_id.
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from collections import defaultdict
+from datetime import datetime
+from dotenv import load_dotenv
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from database import create_async_db_engine
+from models import WebhookSubscription
+from services.outbox import OutboxConsumer
+from services.redis_client import get_redis, lease_due
+import aiohttp
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import random
+import time
+import uuid
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CONSUMER_GROUP = 'webhooks'
+RETRY_KEY = 'webhooks:retry'
+DEAD_LETTER_KEY = 'webhooks:dead'
+DEAD_LETTER_LIMIT = 1000
+SIGNATURE_HEADER = 'X-Webhook-Signature'
+
+# 408 and 429 are worth retrying; any other 4xx means the request itself is refused
+RETRYABLE_STATUSES = {408, 429}
+
+def sign_payload(secret, timestamp, body):
+    """Signature header value for a request body sent at `timestamp`"""
+    digest = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+def verify_signature(secret, header, body, tolerance=300):
+    """Check a signature header against the body, rejecting stale timestamps"""
+    try:
+        parts = dict(part.split('=', 1) for part in header.split(','))
+        timestamp = int(parts['t'])
+    except (AttributeError, KeyError, ValueError):
+        return False
+    
+    if abs(time.time() - timestamp) > tolerance:
+        return False
+    return hmac.compare_digest(sign_payload(secret, timestamp, body), header)
+
+class SubscriptionIndex:
+    """Active subscriptions keyed by event type and region for matching events"""
+    
+    def __init__(self, subscriptions):
+        self.by_id = {subscription.id: subscription for subscription in subscriptions}
+        self.routes = defaultdict(list)
+        for subscription in subscriptions:
+            for event_type in (subscription.event_types or 'price_dropped').split(','):
+                self.routes[(event_type.strip(), subscription.region)].append(subscription)
+    
+    def match(self, event):
+        """Subscriptions whose filters accept an event"""
+        discount = event.get('savings_percentage') or 0
+        candidates = self.routes.get((event['event_type'], event['region']), []) + \
+            self.routes.get((event['event_type'], None), [])
+        return [
+            subscription for subscription in candidates
+            if (subscription.store_id is None or subscription.store_id == event.get('store_id'))
+            and (subscription.min_discount is None or discount >= subscription.min_discount)
+        ]
+
+class WebhookDispatcher:
+    """Matches stream events to subscriptions and delivers them in signed batches"""
+    
+    def __init__(self, database_url=None, name='webhooks-1', redis_client=None):
+        database_url = database_url or os.getenv('DATABASE_URL', 'sqlite:///gametracker.db')
+        self.engine = create_async_db_engine(database_url, os.environ)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.redis = redis_client or get_redis()
+        self.consumer = OutboxConsumer(CONSUMER_GROUP, name, redis_client=self.redis)
+        
+        self.read_count = int(os.getenv('WEBHOOK_READ_COUNT', 500))
+        self.batch_size = int(os.getenv('WEBHOOK_BATCH_SIZE', 100))
+        self.max_connections = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 200))
+        self.per_endpoint = int(os.getenv('WEBHOOK_PER_ENDPOINT_CONCURRENCY', 4))
+        self.timeout = float(os.getenv('WEBHOOK_TIMEOUT_SECONDS', 10))
+        self.max_attempts = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', 8))
+        self.retry_base = float(os.getenv('WEBHOOK_RETRY_BASE_SECONDS', 10))
+        self.retry_max = float(os.getenv('WEBHOOK_RETRY_MAX_SECONDS', 3600))
+        self.disable_after = int(os.getenv('WEBHOOK_DISABLE_AFTER_FAILURES', 100))
+        self.refresh_seconds = int(os.getenv('WEBHOOK_SUBSCRIPTION_REFRESH_SECONDS', 30))
+        # Batches claimed by a worker that died come due again after this long
+        self.lease_seconds = self.timeout * 2 + 30
+        
+        self.index = SubscriptionIndex([])
+        self.refreshed_at = 0
+        self.http = None
+        self.inflight = {}
+        self.stats = {'events': 0, 'delivered': 0, 'failed': 0, 'retried': 0, 'dead': 0}
+    
+    async def start(self):
+        # One pool for every subscriber; limit_per_host is the per-endpoint concurrency cap
+        connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.per_endpoint)
+        self.http = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={'Content-Type': 'application/json', 'User-Agent': 'GameTracker-Webhooks/1.0'}
+        )
+    
+    async def close(self):
+        # Unfinished deliveries keep their leases and are retried by the next worker
+        for task in self.inflight:
+            task.cancel()
+        if self.http:
+            await self.http.close()
+        await self.engine.dispose()
+    
+    async def run(self, block_ms=1000):
+        """Deliver events until cancelled"""
+        await self.start()
+        try:
+            while True:
+                await self.run_once(block_ms)
+        finally:
+            await self.close()
+    
+    async def run_once(self, block_ms=1000):
+        """One cycle: record finished deliveries, then start due retries and the next events; returns events read"""
+        await self._refresh_subscriptions()
+        
+        if len(self.inflight) >= self.max_connections:
+            # Every connection is busy; let some deliveries finish before reading more
+            await asyncio.wait(self.inflight, return_when=asyncio.FIRST_COMPLETED)
+        await self._record_finished()
+        
+        deliveries = await self._due_retries()
+        entries = await asyncio.to_thread(self.consumer.read, self.read_count, block_ms)
+        batches = self._batches(entries)
+        if batches:
+            await asyncio.to_thread(self._lease, batches)
+        
+        # The batches are parked in the retry set now, so the stream entries are done with
+        await asyncio.to_thread(self.consumer.ack, [entry_id for entry_id, _ in entries])
+        
+        for delivery in deliveries + batches:
+            self.inflight[asyncio.ensure_future(self._deliver(delivery))] = delivery
+        
+        self.stats['events'] += len(entries)
+        return len(entries)
+    
+    async def _record_finished(self):
+        finished = [task for task in self.inflight if task.done()]
+        if not finished:
+            return
+        
+        deliveries, results = [], []
+        for task in finished:
+            deliveries.append(self.inflight.pop(task))
+            error = task.exception()
+            results.append(f"{type(error).__name__}: {str(error)}"[:500] if error else task.result())
+        await self._record_results(deliveries, results)
+    
+    async def _refresh_subscriptions(self):
+        if time.monotonic() - self.refreshed_at < self.refresh_seconds:
+            return
+        
+        try:
+            async with self.sessions() as session:
+                result = await session.execute(
+                    select(WebhookSubscription).filter(WebhookSubscription.is_active == True)
+                )
+                self.index = SubscriptionIndex(result.scalars().all())
+            self.refreshed_at = time.monotonic()
+        except Exception as e:
+            # Keep delivering to the subscriptions we already know about
+            logger.error(f"Error loading webhook subscriptions: {str(e)}")
+    
+    def _batches(self, entries):
+        events_by_subscription = defaultdict(list)
+        for _, event in entries:
+            for subscription in self.index.match(event):
+                events_by_subscription[subscription.id].append(event)
+        
+        deliveries = []
+        for subscription_id, events in events_by_subscription.items():
+            for start in range(0, len(events), self.batch_size):
+                body = json.dumps({
+                    'delivery_id': uuid.uuid4().hex,
+                    'subscription_id': subscription_id,
+                    'events': events[start:start + self.batch_size]
+                }).encode()
+                deliveries.append(_delivery(subscription_id, 1, body))
+        
+        return deliveries
+    
+    def _lease(self, deliveries):
+        self.redis.zadd(RETRY_KEY, {delivery['member']: time.time() + self.lease_seconds for delivery in deliveries})
+    
+    async def _due_retries(self):
+        now = time.time()
+        members = await asyncio.to_thread(
+            lease_due, self.redis, RETRY_KEY, now, self.read_count, now + self.lease_seconds
+        )
+        deliveries = []
+        for member in members:
+            delivery = json.loads(member)
+            delivery.update(body=delivery['body'].encode(), member=member)
+            deliveries.append(delivery)
+        return deliveries
+    
+    async def _deliver(self, delivery):
+        """POST one batch; returns None on success or an error string"""
+        subscription = self.index.by_id.get(delivery['subscription_id'])
+        if subscription is None:
+            return 'Subscription inactive'
+        
+        body = delivery['body']
+        headers = {
+            SIGNATURE_HEADER: sign_payload(subscription.secret, int(time.time()), body),
+            'X-Webhook-Attempt': str(delivery['attempt'])
+        }
+        
+        try:
+            async with self.http.post(subscription.url, data=body, headers=headers) as response:
+                if response.status < 300:
+                    return None
+                delivery['retry_after'] = _int(response.headers.get('Retry-After'), 0)
+                delivery['retryable'] = response.status >= 500 or response.status in RETRYABLE_STATUSES
+                return f"HTTP {response.status}"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            delivery['retryable'] = True
+            return f"{type(e).__name__}: {str(e)}"[:500]
+    
+    def _backoff(self, attempt, retry_after=0):
+        # Full jitter keeps retries to a recovering endpoint from arriving in lockstep
+        delay = min(self.retry_base * 2 ** (attempt - 1), self.retry_max)
+        return max(random.uniform(delay / 2, delay), retry_after)
+    
+    async def _record_results(self, deliveries, results):
+        delivered_ids = set()
+        failures = defaultdict(set)
+        retries = {}
+        dead = []
+        
+        for delivery, error in zip(deliveries, results):
+            if error is None:
+                delivered_ids.add(delivery['subscription_id'])
+                self.stats['delivered'] += 1
+                continue
+            
+            if delivery['subscription_id'] not in self.index.by_id:
+                # Deleted or disabled since the batch was built; nobody wants it now
+                continue
+            
+            self.stats['failed'] += 1
+            failures[error].add(delivery['subscription_id'])
+            
+            parked = _delivery(delivery['subscription_id'], delivery['attempt'] + 1, delivery['body'])
+            if delivery.get('retryable') and delivery['attempt'] < self.max_attempts:
+                retries[parked['member']] = time.time() + self._backoff(
+                    delivery['attempt'], delivery.get('retry_after', 0)
+                )
+            else:
+                dead.append(json.dumps(dict(json.loads(parked['member']), error=error)))
+        
+        # Each batch's lease is swapped for its next attempt or dead letter in one transaction
+        await asyncio.to_thread(self._settle, [delivery['member'] for delivery in deliveries], retries, dead)
+        self.stats['retried'] += len(retries)
+        self.stats['dead'] += len(dead)
+        
+        if delivered_ids or failures:
+            await self._update_subscriptions(delivered_ids, failures)
+    
+    def _settle(self, leased, retries, dead):
+        pipe = self.redis.pipeline()
+        pipe.zrem(RETRY_KEY, *leased)
+        if retries:
+            pipe.zadd(RETRY_KEY, retries)
+        if dead:
+            logger.warning(f"Moving {len(dead)} failed webhook deliveries to {DEAD_LETTER_KEY}")
+            pipe.lpush(DEAD_LETTER_KEY, *dead)
+            pipe.ltrim(DEAD_LETTER_KEY, 0, DEAD_LETTER_LIMIT - 1)
+        pipe.execute()
+    
+    async def _update_subscriptions(self, delivered_ids, failures):
+        try:
+            async with self.sessions() as session:
+                if delivered_ids:
+                    await session.execute(
+                        update(WebhookSubscription)
+                        .where(WebhookSubscription.id.in_(delivered_ids))
+                        .values(consecutive_failures=0, last_delivered_at=datetime.utcnow(), last_error=None)
+                    )
+                
+                for error, subscription_ids in failures.items():
+                    await session.execute(
+                        update(WebhookSubscription)
+                        .where(WebhookSubscription.id.in_(subscription_ids - delivered_ids))
+                        .values(consecutive_failures=WebhookSubscription.consecutive_failures + 1, last_error=error)
+                    )
+                
+                # Endpoints that have been failing for a long time stop receiving events
+                await session.execute(
+                    update(WebhookSubscription)
+                    .where(WebhookSubscription.is_active == True,
+                           WebhookSubscription.consecutive_failures >= self.disable_after)
+                    .values(is_active=False)
+                )
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Error recording webhook delivery status: {str(e)}")
+
+def _delivery(subscription_id, attempt, body):
+    """A batch to deliver; `member` is how it is stored in the retry set"""
+    member = json.dumps({'subscription_id': subscription_id, 'attempt': attempt, 'body': body.decode()})
+    return {'subscription_id': subscription_id, 'attempt': attempt, 'body': body, 'member': member}
+
+def _int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Deliver price change events to webhook subscribers')
+    parser.add_argument('--name', default=os.getenv('HOSTNAME', 'webhooks-1'),
+                        help='Consumer name; unique per running worker')
+    parser.add_argument('--database-url', help='Defaults to DATABASE_URL')
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(WebhookDispatcher(args.database_url, name=args.name).run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()